@@ -0,0 +1,55 @@
+"""Benchmark sequential vs batch Steam extraction against a local stub server
+
+Usage: python spark_jobs/benchmarks/bench_extraction.py [--accounts N] [--workers N]
+"""
+
+import argparse
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "src"))
+
+from rate_limit import TokenBucket  # noqa: E402
+from steam_job import fetch_steam_data, fetch_steam_data_batch  # noqa: E402
+from stub_steam_server import StubSteamServer  # noqa: E402
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--accounts", type=int, default=200)
+    parser.add_argument("--workers", type=int, default=32)
+    parser.add_argument("--latency", type=float, default=0.02, help="stub latency in seconds")
+    parser.add_argument("--rate", type=float, default=1000.0, help="token bucket rate (req/s)")
+    args = parser.parse_args()
+
+    steam_ids = [str(76561197960265728 + i) for i in range(args.accounts)]
+
+    with StubSteamServer(latency=args.latency) as server:
+        start = time.perf_counter()
+        for steam_id in steam_ids:
+            fetch_steam_data("bench", steam_id, base_url=server.base_url)
+        sequential = time.perf_counter() - start
+
+        start = time.perf_counter()
+        result = fetch_steam_data_batch(
+            "bench",
+            steam_ids,
+            max_workers=args.workers,
+            rate_limiter=TokenBucket(args.rate, args.workers),
+            base_url=server.base_url,
+        )
+        batch = time.perf_counter() - start
+
+    print(f"accounts: {args.accounts}, stub latency: {args.latency * 1000:.0f} ms")
+    print(f"sequential: {sequential:.2f}s ({args.accounts / sequential:.1f} accounts/s)")
+    print(f"batch:      {batch:.2f}s ({args.accounts / batch:.1f} accounts/s)")
+    print(f"speedup:    {sequential / batch:.1f}x")
+    print(
+        f"players: {len(result['player_summary']['response']['players'])}, "
+        f"failed: {len(result['failed_steam_ids'])}"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,318 @@
+"""End-to-end pipeline benchmark on synthetic Steam payloads
+
+Generates payloads chunk by chunk, drives ``create_steam_dataframes``, session
+reconstruction and both writers, and reports per stage: wall time, rows,
+throughput, latency percentiles over chunks and peak memory: the Python process
+RSS and the used heap of the Spark driver JVM, which also hosts the executors
+under a local master. Results are saved as JSON; pass ``--baseline`` with an
+earlier result to see regressions.
+
+PostgreSQL is the one configured through Config (POSTGRES_* variables) with
+sql/postgres/01_steam_schema.sql loaded; ``--no-postgres`` skips it. ClickHouse
+is an in-process stand-in that accepts and counts blocks unless
+``--clickhouse live`` is given.
+
+Usage: python spark_jobs/benchmarks/bench_pipeline.py [--accounts N] [--games N]
+           [--chunk N] [--output results.json] [--baseline previous.json]
+
+e.g. --accounts 100000 --games 500 --chunk 2000 for a production-scale run.
+"""
+
+import argparse
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import threading
+import time
+from collections.abc import Callable
+from datetime import datetime
+from pathlib import Path
+from typing import Any
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "src"))
+
+os.environ.setdefault("SPARK_MASTER", "local[*]")
+
+from base import (  # noqa: E402
+    get_spark_session,
+    persist_dataframes,
+    profile_name,
+    size_shuffle_partitions,
+    spark_settings,
+    unpersist_dataframes,
+)
+from config import Config  # noqa: E402
+from database_writers import ClickHouseWriter, PostgreSQLWriter  # noqa: E402
+from sessions import reconstruct_sessions, snapshot_frame  # noqa: E402
+from steam_job import create_steam_dataframes  # noqa: E402
+from synthetic_data import SyntheticCatalog, steam_ids, synthetic_payload  # noqa: E402
+
+RESULTS_DIR = Path(__file__).resolve().parent / "results"
+
+
+class StubClickHouseClient:
+    """Accepts INSERT blocks like clickhouse_driver.Client and counts them"""
+
+    def __init__(self):
+        self.rows = 0
+        self.blocks = 0
+
+    def execute(self, query: str, data: Any = None, columnar: bool = False, **kwargs) -> None:
+        self.blocks += 1
+        self.rows += len(data[0]) if columnar and data else len(data or [])
+
+    def disconnect(self) -> None:
+        pass
+
+
+def rss_bytes() -> int:
+    """Current resident set size of this (Python) process"""
+    try:
+        with open("/proc/self/statm") as statm:
+            return int(statm.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except OSError:
+        # ru_maxrss is the lifetime peak (KiB on Linux, bytes on macOS)
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak if sys.platform == "darwin" else peak * 1024
+
+
+def jvm_heap_probe(spark) -> Callable[[], int]:
+    """Used heap of the Spark driver JVM, read through the py4j gateway"""
+    runtime = spark.sparkContext._jvm.java.lang.Runtime.getRuntime()
+    return lambda: runtime.totalMemory() - runtime.freeMemory()
+
+
+class PeakMemory:
+    """Sample a memory probe in a background thread while a block runs"""
+
+    def __init__(self, probe: Callable[[], int] = rss_bytes, interval: float = 0.01):
+        self.probe = probe
+        self.interval = interval
+        self.peak = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._sample, daemon=True)
+
+    def _sample(self) -> None:
+        while not self._stop.is_set():
+            self.peak = max(self.peak, self.probe())
+            self._stop.wait(self.interval)
+
+    def __enter__(self) -> "PeakMemory":
+        self.peak = self.probe()
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc: Any) -> None:
+        self._stop.set()
+        self._thread.join()
+        self.peak = max(self.peak, self.probe())
+
+
+class StageStats:
+    def __init__(self, jvm_heap: Callable[[], int]):
+        self.jvm_heap = jvm_heap
+        self.latencies: list[float] = []
+        self.rows = 0
+        self.peak_rss = 0
+        self.peak_jvm_heap = 0
+
+    def run(self, fn, rows: int) -> Any:
+        # Each py4j call is a gateway round trip, so the JVM is sampled less often
+        with PeakMemory() as rss, PeakMemory(self.jvm_heap, interval=0.05) as heap:
+            start = time.perf_counter()
+            result = fn()
+            self.latencies.append(time.perf_counter() - start)
+        self.rows += rows
+        self.peak_rss = max(self.peak_rss, rss.peak)
+        self.peak_jvm_heap = max(self.peak_jvm_heap, heap.peak)
+        return result
+
+    def summary(self) -> dict[str, Any]:
+        latencies = sorted(self.latencies)
+        total = sum(latencies)
+
+        def percentile(p: float) -> float:
+            return latencies[min(len(latencies) - 1, int(p * len(latencies)))]
+
+        return {
+            "chunks": len(latencies),
+            "rows": self.rows,
+            "seconds": round(total, 4),
+            "rows_per_second": round(self.rows / total, 1) if total else None,
+            "latency_p50": round(percentile(0.50), 4),
+            "latency_p95": round(percentile(0.95), 4),
+            "latency_p99": round(percentile(0.99), 4),
+            "peak_python_rss_mb": round(self.peak_rss / 2**20, 1),
+            "peak_jvm_heap_mb": round(self.peak_jvm_heap / 2**20, 1),
+        }
+
+
+def git_revision() -> str:
+    try:
+        return (
+            subprocess.check_output(
+                ["git", "describe", "--tags", "--always", "--dirty"], stderr=subprocess.DEVNULL
+            )
+            .decode()
+            .strip()
+        )
+    except (subprocess.CalledProcessError, FileNotFoundError):
+        return "unknown"
+
+
+def write_sink(writer, dataframes: dict) -> None:
+    """Load a writer's tables one batch after another, as its fan-out sink thread does"""
+    for table in writer.sink_tables(dataframes):
+        for batch in table.batches():
+            table.write(batch)
+
+
+def run_chunk(
+    spark, stages: dict[str, StageStats], payload: dict, pg_writer, ch_writer, extracted_at
+) -> None:
+    games = payload["owned_games"]["response"]["games"]
+    players = payload["player_summary"]["response"]["players"]
+    recent = payload["recently_played"]["response"]["games"]
+    total_rows = len(games) + len(players) + len(recent) + len(payload["achievements"])
+
+    config = Config()
+    storage_level = config.get_spark_config()["storage_level"]
+
+    def transform() -> dict:
+        size_shuffle_partitions(spark, config, total_rows)
+        dataframes = create_steam_dataframes(spark, payload)
+        persist_dataframes(dataframes, storage_level)
+        return dataframes
+
+    dataframes = stages["transform"].run(transform, total_rows)
+
+    def sessions():
+        df = reconstruct_sessions(
+            snapshot_frame(spark, dataframes["owned_games"], extracted_at),
+            dataframes.get("achievements"),
+        )
+        return df, persist_dataframes({"sessions": df}, storage_level)["sessions"]
+
+    sessions_df, session_rows = stages["sessions"].run(sessions, 0)
+    stages["sessions"].rows += session_rows
+
+    if pg_writer is not None:
+        stages["postgres"].run(
+            lambda: write_sink(pg_writer, dataframes), len(players) + 2 * len(games) + len(recent)
+        )
+
+    stages["clickhouse"].run(
+        lambda: write_sink(ch_writer, {**dataframes, "sessions": sessions_df}),
+        len(players) + len(games) + session_rows,
+    )
+
+    unpersist_dataframes({**dataframes, "sessions": sessions_df})
+
+
+def compare(results: dict, baseline_path: str) -> None:
+    baseline = json.loads(Path(baseline_path).read_text())
+    print(f"\nvs baseline {baseline['revision']} ({baseline['started_at']}):")
+    ignored = {"output", "baseline"}
+    changed = {
+        k: v
+        for k, v in results["parameters"].items()
+        if k not in ignored and baseline["parameters"].get(k) != v
+    }
+    if changed:
+        print(f"  warning: parameters differ from the baseline: {changed}")
+    for name, stage in results["stages"].items():
+        before = baseline["stages"].get(name)
+        if not before or not before.get("rows_per_second") or not stage["rows_per_second"]:
+            continue
+        ratio = stage["rows_per_second"] / before["rows_per_second"]
+        flag = "  REGRESSION" if ratio < 0.9 else ""
+        print(f"  {name:<11} throughput x{ratio:.2f}{flag}")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--accounts", type=int, default=2000)
+    parser.add_argument("--games", type=int, default=200, help="mean games per account")
+    parser.add_argument("--chunk", type=int, default=500, help="accounts per chunk")
+    parser.add_argument("--catalog", type=int, default=50_000, help="distinct games")
+    parser.add_argument("--achievements", type=int, default=0, help="achievements per game")
+    parser.add_argument("--no-postgres", action="store_true")
+    parser.add_argument("--clickhouse", choices=("stub", "live"), default="stub")
+    parser.add_argument("--output", help="result file (default: results/pipeline-<time>.json)")
+    parser.add_argument("--baseline", help="earlier result file to compare against")
+    args = parser.parse_args()
+
+    config = Config()
+    spark = get_spark_session("joyst-bench-pipeline", config)
+    spark.sparkContext.setLogLevel("ERROR")
+    catalog = SyntheticCatalog(args.catalog)
+    names = ("generate", "transform", "sessions", "postgres", "clickhouse")
+    jvm_heap = jvm_heap_probe(spark)
+    stages = {name: StageStats(jvm_heap) for name in names}
+
+    pg_writer = None if args.no_postgres else PostgreSQLWriter(config)
+    stub = StubClickHouseClient() if args.clickhouse == "stub" else None
+    ch_writer = ClickHouseWriter(config, client=stub)
+
+    started_at = datetime.now()
+    try:
+        for offset in range(0, args.accounts, args.chunk):
+            ids = steam_ids(min(args.chunk, args.accounts - offset), offset)
+            payload = stages["generate"].run(
+                lambda ids=ids: synthetic_payload(ids, args.games, catalog, args.achievements),
+                len(ids),
+            )
+            run_chunk(spark, stages, payload, pg_writer, ch_writer, started_at)
+            print(f"chunk {offset // args.chunk + 1}: {offset + len(ids)}/{args.accounts} accounts")
+    finally:
+        if pg_writer is not None:
+            pg_writer.close()
+        ch_writer.close()
+        spark.stop()
+
+    results = {
+        "benchmark": "pipeline",
+        "revision": git_revision(),
+        "started_at": started_at.isoformat(timespec="seconds"),
+        "parameters": vars(args),
+        "environment": {
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpus": os.cpu_count(),
+            "spark_master": config.get_spark_config()["master"],
+            "spark_profile": profile_name(config),
+            "spark_settings": spark_settings(config, args.chunk * args.games),
+        },
+        "stages": {name: stats.summary() for name, stats in stages.items() if stats.latencies},
+    }
+
+    print(
+        f"\n{'stage':<11} {'rows':>10} {'seconds':>9} {'rows/s':>10} {'p50':>8} {'p95':>8} "
+        f"{'py RSS MB':>10} {'JVM heap MB':>12}"
+    )
+    for name, stage in results["stages"].items():
+        print(
+            f"{name:<11} {stage['rows']:>10} {stage['seconds']:>9.2f} "
+            f"{stage['rows_per_second'] or 0:>10.0f} {stage['latency_p50']:>8.3f} "
+            f"{stage['latency_p95']:>8.3f} {stage['peak_python_rss_mb']:>10.1f} "
+            f"{stage['peak_jvm_heap_mb']:>12.1f}"
+        )
+
+    output = (
+        Path(args.output)
+        if args.output
+        else (RESULTS_DIR / f"pipeline-{started_at:%Y%m%dT%H%M%S}.json")
+    )
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text(json.dumps(results, indent=2))
+    print(f"\nresults saved to {output}")
+
+    if args.baseline:
+        compare(results, args.baseline)
+
+
+if __name__ == "__main__":
+    main()
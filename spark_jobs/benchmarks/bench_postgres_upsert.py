@@ -0,0 +1,68 @@
+"""Benchmark COPY + INSERT ... ON CONFLICT upserts against per-row upsert functions
+
+Runs against the PostgreSQL configured through Config (config.json or POSTGRES_*
+environment variables) with sql/postgres/01_steam_schema.sql loaded.
+
+Usage: python spark_jobs/benchmarks/bench_postgres_upsert.py [--rows N]
+"""
+
+import argparse
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "src"))
+
+from config import Config  # noqa: E402
+from database_writers import PostgreSQLWriter  # noqa: E402
+
+
+def game_records(rows: int, offset: int, revision: int) -> list[tuple]:
+    return [
+        (offset + i, f"Game {offset + i} r{revision}", f"icon{i}", f"logo{i}") for i in range(rows)
+    ]
+
+
+def timed(label: str, fn, records: list[tuple]) -> float:
+    start = time.perf_counter()
+    fn(records)
+    elapsed = time.perf_counter() - start
+    print(f"{label:<28} {elapsed:8.3f}s  {len(records) / elapsed:>10.0f} rows/s")
+    return elapsed
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--rows", type=int, default=20000)
+    parser.add_argument("--offset", type=int, default=10_000_000, help="first synthetic appid")
+    args = parser.parse_args()
+
+    writer = PostgreSQLWriter(Config())
+    per_row_base = args.offset
+    bulk_base = args.offset + args.rows
+    try:
+        print(f"{args.rows} rows per run, batch size {writer.batch_size}")
+        per_row = timed(
+            "per-row insert",
+            writer.upsert_games_per_row,
+            game_records(args.rows, per_row_base, 0),
+        )
+        bulk = timed("bulk insert", writer.upsert_games, game_records(args.rows, bulk_base, 0))
+        per_row += timed(
+            "per-row update",
+            writer.upsert_games_per_row,
+            game_records(args.rows, per_row_base, 1),
+        )
+        bulk += timed("bulk update", writer.upsert_games, game_records(args.rows, bulk_base, 1))
+        print(f"speedup: {per_row / bulk:.1f}x")
+    finally:
+        with writer.connection.cursor() as cursor:
+            cursor.execute(
+                "DELETE FROM steam_games WHERE appid >= %s AND appid < %s",
+                (args.offset, bulk_base + args.rows),
+            )
+        writer.close()
+
+
+if __name__ == "__main__":
+    main()
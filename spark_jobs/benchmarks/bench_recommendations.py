@@ -0,0 +1,218 @@
+"""Latency and throughput of the recommendation index, in process and over HTTP
+
+Builds a ``RecommendationIndex`` from synthetic libraries (see synthetic_data)
+and synthetic top-K similarities over the same catalog, then measures:
+
+- cold queries (empty cache) and warm queries (cached players), per query
+- in-process throughput from ``--threads`` threads with a Zipf-skewed mix of
+  hot and cold players, as a live server sees them
+- the same mix over HTTP against ``recommendation_server`` on a local port,
+  with one keep-alive connection per client thread (skip with ``--no-http``)
+
+Usage: python spark_jobs/benchmarks/bench_recommendations.py [--accounts N] [--games N]
+           [--queries N] [--threads N] [--output results.json]
+"""
+
+import argparse
+import http.client
+import json
+import os
+import platform
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from pathlib import Path
+from typing import Any
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "src"))
+
+from bench_pipeline import git_revision  # noqa: E402
+from recommendations import RecommendationIndex, recommendation_server  # noqa: E402
+from synthetic_data import SyntheticCatalog, steam_ids, synthetic_library  # noqa: E402
+
+RESULTS_DIR = Path(__file__).resolve().parent / "results"
+
+
+def synthetic_similarities(
+    catalog: SyntheticCatalog, top_k: int, seed: int = 0
+) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """top_k neighbours per catalog game, drawn with the catalog's popularity"""
+    from recommendations import game_sks
+
+    rng = np.random.default_rng(seed)
+    sks = game_sks(catalog.appids)
+    size = len(sks)
+    neighbours = rng.choice(size, size=(size, top_k), p=catalog.weights)
+    sk1 = np.repeat(sks, top_k)
+    sk2 = sks[neighbours.ravel()]
+    distinct = sk1 != sk2
+    scores = rng.random(size * top_k).astype("float32")
+    return sk1[distinct], sk2[distinct], scores[distinct]
+
+
+def build_index(args: argparse.Namespace) -> tuple[RecommendationIndex, np.ndarray, dict]:
+    catalog = SyntheticCatalog(args.catalog)
+    now = int(time.time())
+    ids, appids, playtime = [], [], []
+    start = time.perf_counter()
+    for steam_id in steam_ids(args.accounts):
+        games, _ = synthetic_library(steam_id, catalog, args.games, now)
+        ids.extend([int(steam_id)] * len(games))
+        appids.extend(game["appid"] for game in games)
+        playtime.extend(game["playtime_forever"] for game in games)
+    generated = time.perf_counter() - start
+
+    index = RecommendationIndex(cache_size=args.cache, max_candidates=args.candidates)
+    start = time.perf_counter()
+    index.set_similarities(*synthetic_similarities(catalog, args.top_k), catalog.appids)
+    index.set_libraries(np.array(ids), np.array(appids), np.array(playtime))
+    built = time.perf_counter() - start
+    players = np.array(sorted(set(ids)))
+    return (
+        index,
+        players,
+        {
+            "generate_seconds": round(generated, 2),
+            "build_seconds": round(built, 2),
+            "index_mb": round(index.nbytes() / 2**20, 1),
+            "rows": len(ids),
+        },
+    )
+
+
+def summarize(latencies: list[float], seconds: float | None = None) -> dict[str, Any]:
+    ordered = np.sort(np.array(latencies)) * 1000
+    summary = {
+        "queries": len(ordered),
+        "p50_ms": round(float(np.percentile(ordered, 50)), 4),
+        "p95_ms": round(float(np.percentile(ordered, 95)), 4),
+        "p99_ms": round(float(np.percentile(ordered, 99)), 4),
+        "max_ms": round(float(ordered[-1]), 4),
+    }
+    if seconds:
+        summary["queries_per_second"] = round(len(ordered) / seconds, 1)
+    return summary
+
+
+def timed_queries(index: RecommendationIndex, players: np.ndarray, n: int) -> list[float]:
+    latencies = []
+    for steamid in players:
+        start = time.perf_counter()
+        index.recommend(int(steamid), n)
+        latencies.append(time.perf_counter() - start)
+    return latencies
+
+
+def query_mix(players: np.ndarray, queries: int, seed: int = 1) -> np.ndarray:
+    """Zipf-skewed player sequence: a few hot players, a long cold tail"""
+    rng = np.random.default_rng(seed)
+    ranks = np.minimum(rng.zipf(1.2, queries), len(players)) - 1
+    return players[rng.permutation(len(players))[ranks]]
+
+
+def run_threads(threads: int, work: list, fn) -> tuple[list[float], float]:
+    """Run ``fn(chunk)`` on ``threads`` chunks of ``work``; latencies and wall time"""
+    chunks = [work[i::threads] for i in range(threads)]
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        results = list(pool.map(fn, chunks))
+    return [latency for chunk in results for latency in chunk], time.perf_counter() - start
+
+
+def http_client(host: str, port: int, n: int):
+    def query(steamids: list) -> list[float]:
+        connection = http.client.HTTPConnection(host, port)
+        latencies = []
+        for steamid in steamids:
+            start = time.perf_counter()
+            connection.request("GET", f"/recommendations/{steamid}?n={n}")
+            json.loads(connection.getresponse().read())
+            latencies.append(time.perf_counter() - start)
+        connection.close()
+        return latencies
+
+    return query
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--accounts", type=int, default=20_000)
+    parser.add_argument("--games", type=int, default=100, help="mean games per account")
+    parser.add_argument("--catalog", type=int, default=20_000, help="distinct games")
+    parser.add_argument("--top-k", type=int, default=20, help="neighbours per game")
+    parser.add_argument("--n", type=int, default=10, help="recommendations per query")
+    parser.add_argument("--cache", type=int, default=10_000, help="LRU capacity (players)")
+    parser.add_argument("--candidates", type=int, default=200)
+    parser.add_argument("--queries", type=int, default=50_000, help="queries per mixed run")
+    parser.add_argument("--threads", type=int, default=4)
+    parser.add_argument("--no-http", action="store_true")
+    parser.add_argument("--output", help="result file (default: results/recommendations-<t>.json)")
+    args = parser.parse_args()
+
+    started_at = datetime.now()
+    index, players, build = build_index(args)
+    print(f"index: {build}")
+
+    sample = players[np.random.default_rng(2).permutation(len(players))[:2000]]
+    index.cache.clear()
+    runs = {"cold": summarize(timed_queries(index, sample, args.n))}
+    runs["warm"] = summarize(timed_queries(index, sample, args.n))
+
+    index.cache.clear()
+    mix = query_mix(players, args.queries).tolist()
+    latencies, seconds = run_threads(
+        args.threads, mix, lambda chunk: timed_queries(index, np.array(chunk), args.n)
+    )
+    runs["mixed_in_process"] = summarize(latencies, seconds)
+    runs["mixed_in_process"]["cache_hit_rate"] = round(
+        index.cache.hits / max(1, index.cache.hits + index.cache.misses), 3
+    )
+
+    if not args.no_http:
+        index.cache.clear()
+        server = recommendation_server(index, "127.0.0.1", 0)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        host, port = server.server_address[:2]
+        try:
+            latencies, seconds = run_threads(args.threads, mix, http_client(host, port, args.n))
+            runs["mixed_http"] = summarize(latencies, seconds)
+        finally:
+            server.shutdown()
+            server.server_close()
+
+    print(f"\n{'run':<17} {'queries':>8} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'qps':>9}")
+    for name, run in runs.items():
+        print(
+            f"{name:<17} {run['queries']:>8} {run['p50_ms']:>8.3f} {run['p95_ms']:>8.3f} "
+            f"{run['p99_ms']:>8.3f} {run.get('queries_per_second', 0):>9.0f}"
+        )
+
+    results = {
+        "benchmark": "recommendations",
+        "revision": git_revision(),
+        "started_at": started_at.isoformat(timespec="seconds"),
+        "parameters": vars(args),
+        "environment": {
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpus": os.cpu_count(),
+        },
+        "index": build,
+        "runs": runs,
+    }
+    output = (
+        Path(args.output)
+        if args.output
+        else (RESULTS_DIR / f"recommendations-{started_at:%Y%m%dT%H%M%S}.json")
+    )
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text(json.dumps(results, indent=2))
+    print(f"\nresults saved to {output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,116 @@
+"""Compare the Spark performance profiles on the pipeline benchmark
+
+Runs bench_pipeline.py once per profile (``SPARK_PROFILE``), each in its own
+process because driver memory and the serializer only apply to a fresh JVM,
+and prints the per-stage throughput of every profile next to the first one.
+Options other than the ones below are passed through to bench_pipeline.py.
+
+bench_pipeline.py runs under ``SPARK_MASTER`` (``local[*]`` unless set). With a
+local master every task runs in the driver JVM, so the executor memory and cores
+of the ``cluster`` profile do nothing and its row measures only its partition
+sizing and SQL settings; point SPARK_MASTER at a cluster to compare real executors.
+
+Usage: python spark_jobs/benchmarks/bench_spark_profiles.py
+           [--profiles local-dev,single-node,cluster] [--accounts N] [--games N] ...
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+from datetime import datetime
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "src"))
+
+from base import SPARK_PROFILES  # noqa: E402
+from bench_pipeline import git_revision  # noqa: E402
+
+RESULTS_DIR = Path(__file__).resolve().parent / "results"
+BENCH_PIPELINE = Path(__file__).resolve().parent / "bench_pipeline.py"
+STAGES = ("transform", "sessions", "postgres", "clickhouse")
+
+
+def run_profile(profile: str, pipeline_args: list[str], output: Path) -> dict:
+    env = {**os.environ, "SPARK_PROFILE": profile}
+    # Sized by the profile, unless the caller fixes it
+    env.setdefault("SPARK_SHUFFLE_PARTITIONS", "auto")
+    command = [sys.executable, str(BENCH_PIPELINE), *pipeline_args, "--output", str(output)]
+    print(f"\n=== {profile} ===")
+    subprocess.run(command, env=env, check=True)
+    return json.loads(output.read_text())
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--profiles", default=",".join(SPARK_PROFILES))
+    parser.add_argument("--output", help="result file (default: results/profiles-<time>.json)")
+    args, pipeline_args = parser.parse_known_args()
+    profiles = args.profiles.split(",")
+    unknown = set(profiles) - set(SPARK_PROFILES)
+    if unknown:
+        parser.error(f"unknown profiles: {sorted(unknown)}")
+
+    # bench_pipeline.py falls back to the same local master, where executors don't exist
+    master = os.environ.get("SPARK_MASTER", "local[*]")
+    executor_profiles = [
+        name for name in profiles if "spark.executor.cores" in SPARK_PROFILES[name].settings
+    ]
+    note = None
+    if master.startswith("local") and executor_profiles:
+        note = (
+            f"⚠️ SPARK_MASTER={master}: the executor settings of {', '.join(executor_profiles)} "
+            "have no effect, only partition sizing and SQL settings differ"
+        )
+        print(note)
+
+    started_at = datetime.now()
+    runs = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        for profile in profiles:
+            runs[profile] = run_profile(profile, pipeline_args, Path(tmp) / f"{profile}.json")
+
+    base = profiles[0]
+    header = f"{'profile':<12} {'stage':<11} {'seconds':>9} {'rows/s':>10} {'p95':>8}"
+    print(f"\n{header} {'vs ' + base:>9}")
+    for profile, result in runs.items():
+        for name in STAGES:
+            stage = result["stages"].get(name)
+            if not stage:
+                continue
+            reference = runs[base]["stages"][name]["rows_per_second"]
+            ratio = stage["rows_per_second"] / reference if reference else 0
+            print(
+                f"{profile:<12} {name:<11} {stage['seconds']:>9.2f} "
+                f"{stage['rows_per_second'] or 0:>10.0f} {stage['latency_p95']:>8.3f} "
+                f"{'x' + format(ratio, '.2f'):>9}"
+            )
+    if note:
+        print(note)
+
+    results = {
+        "benchmark": "spark_profiles",
+        "revision": git_revision(),
+        "started_at": started_at.isoformat(timespec="seconds"),
+        "parameters": {
+            "profiles": profiles,
+            "spark_master": master,
+            "note": note,
+            "pipeline_args": pipeline_args,
+        },
+        "runs": runs,
+    }
+    output = (
+        Path(args.output)
+        if args.output
+        else (RESULTS_DIR / f"profiles-{started_at:%Y%m%dT%H%M%S}.json")
+    )
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text(json.dumps(results, indent=2))
+    print(f"\nresults saved to {output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,105 @@
+"""Local stand-in for the Steam Web API used by the benchmarks
+
+Serves deterministic synthetic payloads for the endpoints ``SteamAPIClient``
+calls, with a configurable per-request latency to mimic a remote API.
+"""
+
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+
+def synthetic_games(steam_id: str, games_per_account: int) -> list[dict]:
+    rng = random.Random(steam_id)
+    return [
+        {
+            "appid": 10 * (i + 1),
+            "name": f"Game {10 * (i + 1)}",
+            "playtime_forever": int(rng.paretovariate(1.2) * 30) if rng.random() < 0.6 else 0,
+            "playtime_2weeks": rng.randint(0, 600) if rng.random() < 0.05 else 0,
+            "img_icon_url": f"icon{i}",
+            "img_logo_url": f"logo{i}",
+            "has_community_visible_stats": rng.random() < 0.5,
+        }
+        for i in range(games_per_account)
+    ]
+
+
+def synthetic_player(steam_id: str) -> dict:
+    return {
+        "steamid": steam_id,
+        "personaname": f"player-{steam_id[-6:]}",
+        "profileurl": f"https://steamcommunity.com/profiles/{steam_id}/",
+        "avatar": "avatar.jpg",
+        "personastate": 1,
+        "communityvisibilitystate": 3,
+        "profilestate": 1,
+        "lastlogoff": 1700000000,
+        "timecreated": 1300000000,
+    }
+
+
+class StubSteamServer:
+    """Threaded HTTP server answering Steam API paths with synthetic data"""
+
+    def __init__(self, latency: float = 0.02, games_per_account: int = 50):
+        self.latency = latency
+        self.games_per_account = games_per_account
+        self.requests_served = 0
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), self._handler())
+        self._server.daemon_threads = True
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+
+    @property
+    def base_url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def payload(self, path: str, params: dict[str, str]) -> dict:
+        if "GetPlayerSummaries" in path:
+            ids = params.get("steamids", "").split(",")
+            return {"response": {"players": [synthetic_player(i) for i in ids if i]}}
+        if "GetOwnedGames" in path:
+            games = synthetic_games(params["steamid"], self.games_per_account)
+            return {"response": {"game_count": len(games), "games": games}}
+        if "GetRecentlyPlayedGames" in path:
+            games = synthetic_games(params["steamid"], self.games_per_account)
+            recent = [g for g in games if g["playtime_2weeks"] > 0]
+            return {"response": {"total_count": len(recent), "games": recent}}
+        return {}
+
+    def _handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def do_GET(self):
+                url = urlparse(self.path)
+                params = {k: v[0] for k, v in parse_qs(url.query).items()}
+                time.sleep(server.latency)
+                body = json.dumps(server.payload(url.path, params)).encode()
+                with server._lock:
+                    server.requests_served += 1
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+    def __enter__(self) -> "StubSteamServer":
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self._server.shutdown()
+        self._server.server_close()
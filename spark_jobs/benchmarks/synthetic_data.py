@@ -0,0 +1,115 @@
+"""Synthetic Steam payloads at configurable scale for the end-to-end benchmarks
+
+Payloads have the shape ``fetch_steam_data_batch`` returns. Distributions are
+chosen to resemble real libraries: game popularity is Zipf-like over a shared
+catalog, library sizes are log-normal around the requested mean, about a third
+of owned games are never played, lifetime playtime is heavy-tailed and only a
+few games carry two-week activity.
+"""
+
+import time
+
+import numpy as np
+from stub_steam_server import synthetic_player
+
+FIRST_STEAM_ID = 76561197960265728
+
+
+def steam_ids(accounts: int, offset: int = 0) -> list[str]:
+    return [str(FIRST_STEAM_ID + offset + i) for i in range(accounts)]
+
+
+class SyntheticCatalog:
+    """Shared game catalog with Zipf popularity weights"""
+
+    def __init__(self, size: int = 50_000, zipf_exponent: float = 1.1):
+        self.appids = np.arange(1, size + 1) * 10
+        weights = 1.0 / np.arange(1, size + 1) ** zipf_exponent
+        self.weights = weights / weights.sum()
+
+    def sample(self, rng: np.random.Generator, count: int) -> np.ndarray:
+        count = min(count, len(self.appids))
+        return rng.choice(self.appids, size=count, replace=False, p=self.weights)
+
+
+def synthetic_library(
+    steam_id: str,
+    catalog: SyntheticCatalog,
+    games_per_account: int,
+    now: int,
+    achievements_per_game: int = 0,
+) -> tuple[list[dict], list[dict]]:
+    """Owned games and achievements of one account, deterministic per steam_id"""
+    rng = np.random.default_rng(int(steam_id))
+    size = max(1, int(rng.lognormal(np.log(games_per_account), 0.5)))
+    appids = catalog.sample(rng, size)
+
+    played = rng.random(len(appids)) >= 0.3
+    forever = np.where(played, rng.lognormal(np.log(300), 1.5, len(appids)).astype(int) + 1, 0)
+    recent = played & (rng.random(len(appids)) < 0.05)
+    two_weeks = np.where(recent, np.minimum(forever, rng.integers(1, 1200, len(appids))), 0)
+    last_played = np.where(
+        recent,
+        now - rng.integers(0, 14 * 86400, len(appids)),
+        np.where(played, now - rng.integers(14 * 86400, 3 * 365 * 86400, len(appids)), 0),
+    )
+
+    games = [
+        {
+            "steamid": steam_id,
+            "appid": int(appid),
+            "name": f"Game {appid}",
+            "playtime_forever": int(forever[i]),
+            "playtime_2weeks": int(two_weeks[i]),
+            "img_icon_url": f"icon{appid}",
+            "img_logo_url": f"logo{appid}",
+            "has_community_visible_stats": bool(appid % 20 == 0),
+            "rtime_last_played": int(last_played[i]),
+        }
+        for i, appid in enumerate(appids)
+    ]
+
+    achievements = []
+    if achievements_per_game:
+        for game in games:
+            if game["playtime_forever"] and game["has_community_visible_stats"]:
+                unlocked = rng.random(achievements_per_game) < 0.4
+                achievements.extend(
+                    {
+                        "steamid": steam_id,
+                        "appid": game["appid"],
+                        "apiname": f"ACH_{n}",
+                        "achieved": int(unlocked[n]),
+                        "unlocktime": int(now - rng.integers(0, 365 * 86400)) if unlocked[n] else 0,
+                    }
+                    for n in range(achievements_per_game)
+                )
+    return games, achievements
+
+
+def synthetic_payload(
+    ids: list[str],
+    games_per_account: int,
+    catalog: SyntheticCatalog,
+    achievements_per_game: int = 0,
+    now: int | None = None,
+) -> dict:
+    """Merged payload for ``ids``, as ``fetch_steam_data_batch`` would return it"""
+    now = now or int(time.time())
+    owned: list[dict] = []
+    achievements: list[dict] = []
+    for steam_id in ids:
+        games, unlocks = synthetic_library(
+            steam_id, catalog, games_per_account, now, achievements_per_game
+        )
+        owned.extend(games)
+        achievements.extend(unlocks)
+
+    return {
+        "player_summary": {"response": {"players": [synthetic_player(i) for i in ids]}},
+        "owned_games": {"response": {"games": owned}},
+        "recently_played": {"response": {"games": [g for g in owned if g["playtime_2weeks"]]}},
+        "achievements": achievements,
+        "game_stats": [],
+        "failed_steam_ids": [],
+    }
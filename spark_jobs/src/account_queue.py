@@ -0,0 +1,237 @@
+"""Durable queue of steam IDs in PostgreSQL, consumed by streaming workers
+
+Accounts wait in ``steam_account_queue`` until a worker claims a batch of them.
+Claiming leases the rows to the worker with ``FOR UPDATE SKIP LOCKED``, so any
+number of workers, on one node or many, take disjoint batches without blocking
+each other. A batch is checkpointed as done only after its data and watermarks
+are written; a worker that dies mid-batch stops renewing its lease and the
+accounts become claimable again when the lease expires (at once for a worker
+restarted under the same ``QUEUE_WORKER_ID``).
+
+    python account_queue.py enqueue STEAMID [...] | --file ids.txt
+    python account_queue.py status
+"""
+
+import argparse
+import os
+import socket
+import threading
+from collections.abc import Iterator
+from contextlib import contextmanager
+
+from config import Config
+from connection_pool import postgres_pool
+from psycopg2.extras import execute_values
+
+
+def default_worker_id() -> str:
+    return f"{socket.gethostname()}-{os.getpid()}"
+
+
+class AccountQueue:
+    """Enqueue, lease and checkpoint accounts in steam_account_queue"""
+
+    def __init__(self, config: Config, worker_id: str | None = None):
+        queue_config = config.get_queue_config()
+        self.pool = postgres_pool(config)
+        self.worker_id = worker_id or queue_config["worker_id"] or default_worker_id()
+        self.lease_seconds = float(queue_config["lease_seconds"])
+        self.max_attempts = int(queue_config["max_attempts"])
+        self.retry_backoff = float(queue_config["retry_backoff"])
+        self.revisit_hours = float(queue_config["revisit_hours"])
+
+    def _execute(self, query: str, params: tuple = ()) -> list[tuple]:
+        with self.pool.connection() as connection, connection.cursor() as cursor:
+            cursor.execute(query, params)
+            return cursor.fetchall() if cursor.description else []
+
+    def enqueue(self, steam_ids: list[str]) -> int:
+        """Add accounts; finished or failed ones are queued again, leased ones left alone"""
+        steam_ids = list(dict.fromkeys(steam_ids))
+        if not steam_ids:
+            return 0
+        with self.pool.connection() as connection, connection.cursor() as cursor:
+            rows = execute_values(
+                cursor,
+                """
+                INSERT INTO steam_account_queue (steamid) VALUES %s
+                ON CONFLICT (steamid) DO UPDATE SET
+                    status = 'pending',
+                    attempts = 0,
+                    available_at = CURRENT_TIMESTAMP,
+                    updated_at = CURRENT_TIMESTAMP
+                WHERE steam_account_queue.status IN ('done', 'failed')
+                RETURNING steamid
+                """,
+                [(steam_id,) for steam_id in steam_ids],
+                fetch=True,
+            )
+        return len(rows)
+
+    def claim(self, limit: int) -> list[str]:
+        """Lease up to ``limit`` due accounts to this worker
+
+        Due are pending accounts past their ``available_at`` and leased ones whose
+        lease expired or that this worker held before a restart.
+        """
+        rows = self._execute(
+            """
+            UPDATE steam_account_queue SET
+                status = 'leased',
+                leased_by = %(worker)s,
+                lease_expires_at = CURRENT_TIMESTAMP + make_interval(secs => %(lease)s),
+                attempts = attempts + 1,
+                updated_at = CURRENT_TIMESTAMP
+            WHERE steamid IN (
+                SELECT steamid FROM steam_account_queue
+                WHERE (status = 'pending' AND available_at <= CURRENT_TIMESTAMP)
+                   OR (status = 'leased'
+                       AND (lease_expires_at < CURRENT_TIMESTAMP OR leased_by = %(worker)s))
+                ORDER BY available_at
+                LIMIT %(limit)s
+                FOR UPDATE SKIP LOCKED
+            )
+            RETURNING steamid
+            """,
+            {"worker": self.worker_id, "lease": self.lease_seconds, "limit": limit},
+        )
+        return [row[0] for row in rows]
+
+    def renew(self, steam_ids: list[str]) -> int:
+        """Extend this worker's leases on ``steam_ids``; returns the leases still held"""
+        rows = self._execute(
+            """
+            UPDATE steam_account_queue
+            SET lease_expires_at = CURRENT_TIMESTAMP + make_interval(secs => %s)
+            WHERE steamid = ANY(%s) AND status = 'leased' AND leased_by = %s
+            RETURNING steamid
+            """,
+            (self.lease_seconds, list(steam_ids), self.worker_id),
+        )
+        return len(rows)
+
+    @contextmanager
+    def keep_leased(self, steam_ids: list[str]) -> Iterator[None]:
+        """Renew the leases on ``steam_ids`` in the background while a batch is processed"""
+        stop = threading.Event()
+
+        def renew() -> None:
+            while not stop.wait(self.lease_seconds / 3):
+                try:
+                    self.renew(steam_ids)
+                except Exception as e:
+                    print(f"⚠️ Could not renew queue leases: {e}")
+
+        thread = threading.Thread(target=renew, daemon=True)
+        thread.start()
+        try:
+            yield
+        finally:
+            stop.set()
+            thread.join()
+
+    def complete(self, steam_ids: list[str]) -> int:
+        """Checkpoint accounts as processed (due again after ``revisit_hours`` when set)"""
+        if not steam_ids:
+            return 0
+        status = "pending" if self.revisit_hours > 0 else "done"
+        rows = self._execute(
+            """
+            UPDATE steam_account_queue SET
+                status = %s,
+                attempts = 0,
+                available_at = CURRENT_TIMESTAMP + make_interval(secs => %s),
+                leased_by = NULL,
+                lease_expires_at = NULL,
+                last_error = NULL,
+                processed_at = CURRENT_TIMESTAMP,
+                updated_at = CURRENT_TIMESTAMP
+            WHERE steamid = ANY(%s) AND status = 'leased' AND leased_by = %s
+            RETURNING steamid
+            """,
+            (status, self.revisit_hours * 3600, list(steam_ids), self.worker_id),
+        )
+        return len(rows)
+
+    def fail(self, steam_ids: list[str], error: str) -> int:
+        """Return accounts for a retry with exponential backoff, or park them as failed"""
+        if not steam_ids:
+            return 0
+        rows = self._execute(
+            """
+            UPDATE steam_account_queue SET
+                status = CASE WHEN attempts >= %(max_attempts)s THEN 'failed' ELSE 'pending' END,
+                available_at = CURRENT_TIMESTAMP
+                    + make_interval(secs => %(backoff)s * power(2, attempts - 1)),
+                leased_by = NULL,
+                lease_expires_at = NULL,
+                last_error = %(error)s,
+                updated_at = CURRENT_TIMESTAMP
+            WHERE steamid = ANY(%(ids)s) AND status = 'leased' AND leased_by = %(worker)s
+            RETURNING steamid
+            """,
+            {
+                "max_attempts": self.max_attempts,
+                "backoff": self.retry_backoff,
+                "error": error[:1000],
+                "ids": list(steam_ids),
+                "worker": self.worker_id,
+            },
+        )
+        return len(rows)
+
+    def release(self) -> int:
+        """Hand this worker's unfinished leases back without counting an attempt"""
+        rows = self._execute(
+            """
+            UPDATE steam_account_queue SET
+                status = 'pending',
+                attempts = GREATEST(attempts - 1, 0),
+                leased_by = NULL,
+                lease_expires_at = NULL,
+                updated_at = CURRENT_TIMESTAMP
+            WHERE status = 'leased' AND leased_by = %s
+            RETURNING steamid
+            """,
+            (self.worker_id,),
+        )
+        return len(rows)
+
+    def counts(self) -> dict[str, int]:
+        """Accounts per status; ``due`` counts the pending ones claimable now"""
+        rows = self._execute(
+            """
+            SELECT status, count(*),
+                   count(*) FILTER (WHERE available_at <= CURRENT_TIMESTAMP)
+            FROM steam_account_queue
+            GROUP BY status
+            """
+        )
+        counts = {status: total for status, total, _ in rows}
+        counts["due"] = sum(due for status, _, due in rows if status == "pending")
+        return counts
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Manage the steam account queue")
+    parser.add_argument("--config", default=None, help="Config file")
+    commands = parser.add_subparsers(dest="command", required=True)
+    enqueue = commands.add_parser("enqueue", help="Queue accounts for the workers")
+    enqueue.add_argument("steam_ids", nargs="*")
+    enqueue.add_argument("--file", help="File with one steam ID per line")
+    commands.add_parser("status", help="Accounts per queue status")
+    args = parser.parse_args()
+
+    queue = AccountQueue(Config(args.config))
+    if args.command == "enqueue":
+        steam_ids = list(args.steam_ids)
+        if args.file:
+            with open(args.file) as f:
+                steam_ids.extend(line.strip() for line in f if line.strip())
+        print(f"✅ Queued {queue.enqueue(steam_ids)} of {len(steam_ids)} accounts")
+    else:
+        print(queue.counts())
+
+
+if __name__ == "__main__":
+    main()
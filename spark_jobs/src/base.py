@@ -1,16 +1,166 @@
+import math
+from dataclasses import dataclass, field
+from pathlib import Path
+
 from config import Config
-from pyspark.sql import SparkSession
+from pyspark import StorageLevel
+from pyspark.sql import DataFrame, SparkSession
+
+# Settings every profile starts from
+COMMON_SETTINGS = {
+    # Columnar Arrow transfer for createDataFrame(pandas) and toPandas() in the writers
+    "spark.sql.execution.arrow.pyspark.enabled": "true",
+    "spark.sql.execution.arrow.pyspark.fallback.enabled": "true",
+    "spark.sql.execution.arrow.maxRecordsPerBatch": "10000",
+    # Adaptive query execution re-plans joins and merges small shuffle partitions at runtime
+    "spark.sql.adaptive.enabled": "true",
+    "spark.sql.adaptive.coalescePartitions.enabled": "true",
+    "spark.serializer": "org.apache.spark.serializer.KryoSerializer",
+    "spark.kryoserializer.buffer.max": "256m",
+}
+
+
+@dataclass(frozen=True)
+class SparkProfile:
+    """Spark settings of one deployment shape and how it sizes shuffle partitions"""
+
+    settings: dict[str, str] = field(default_factory=dict)
+    rows_per_partition: int = 100_000
+    min_partitions: int = 1
+    max_partitions: int = 64
+
+
+SPARK_PROFILES = {
+    # Laptop runs and tests: small driver, no UI, few partitions
+    "local-dev": SparkProfile(
+        {
+            "spark.driver.memory": "2g",
+            "spark.ui.enabled": "false",
+            "spark.sql.adaptive.advisoryPartitionSizeInBytes": "16m",
+        },
+        rows_per_partition=50_000,
+        max_partitions=8,
+    ),
+    # One large machine in local[*] mode: everything runs in the driver JVM
+    "single-node": SparkProfile(
+        {
+            "spark.driver.memory": "8g",
+            "spark.sql.adaptive.advisoryPartitionSizeInBytes": "64m",
+            "spark.sql.adaptive.skewJoin.enabled": "true",
+        },
+        rows_per_partition=100_000,
+        min_partitions=2,
+        max_partitions=64,
+    ),
+    # Standalone or YARN cluster: sized executors, larger partitions
+    "cluster": SparkProfile(
+        {
+            "spark.driver.memory": "4g",
+            "spark.executor.memory": "4g",
+            "spark.executor.cores": "2",
+            "spark.sql.adaptive.advisoryPartitionSizeInBytes": "128m",
+            "spark.sql.adaptive.skewJoin.enabled": "true",
+        },
+        rows_per_partition=250_000,
+        min_partitions=8,
+        max_partitions=400,
+    ),
+}
+
+
+def profile_name(config: Config) -> str:
+    """SPARK_PROFILE, or when unset the profile matching the Spark master"""
+    spark_config = config.get_spark_config()
+    if spark_config["profile"]:
+        return spark_config["profile"]
+    return "local-dev" if spark_config["master"].startswith("local") else "cluster"
+
+
+def spark_profile(config: Config) -> SparkProfile:
+    name = profile_name(config)
+    if name not in SPARK_PROFILES:
+        raise ValueError(
+            f"Unknown Spark profile {name!r}, expected one of {sorted(SPARK_PROFILES)}"
+        )
+    return SPARK_PROFILES[name]
+
+
+def partition_count(profile: SparkProfile, rows: int) -> int:
+    """Shuffle partitions for ``rows`` input rows, within the profile's bounds"""
+    wanted = math.ceil(rows / profile.rows_per_partition)
+    return max(profile.min_partitions, min(profile.max_partitions, wanted))
+
 
+def spark_settings(config: Config, input_rows: int | None = None) -> dict[str, str]:
+    """Session settings of the configured profile with the Config overrides applied"""
+    spark_config = config.get_spark_config()
+    profile = spark_profile(config)
+    settings = {**COMMON_SETTINGS, **profile.settings}
+    for key, option in (("driver_memory", "driver"), ("executor_memory", "executor")):
+        if spark_config[key]:
+            settings[f"spark.{option}.memory"] = spark_config[key]
+
+    if str(spark_config["shuffle_partitions"]) != "auto":
+        settings["spark.sql.shuffle.partitions"] = str(spark_config["shuffle_partitions"])
+    elif input_rows is not None:
+        settings["spark.sql.shuffle.partitions"] = str(partition_count(profile, input_rows))
+    else:
+        settings["spark.sql.shuffle.partitions"] = str(profile.min_partitions)
+    return settings
+
+
+def get_spark_session(
+    app_name: str = "joyst", config: Config = None, input_rows: int | None = None
+) -> SparkSession:
+    """Spark session tuned by the configured profile (SPARK_PROFILE)
 
-def get_spark_session(app_name: str = "joyst", config: Config = None) -> SparkSession:
+    Pass ``input_rows`` when the input size is known up front; otherwise call
+    ``size_shuffle_partitions`` once it is.
+    """
     if config is None:
         config = Config()
 
     spark_config = config.get_spark_config()
 
-    return (
-        SparkSession.builder.appName(spark_config.get("app_name", app_name))
-        .master(spark_config["master"])
-        .config("spark.sql.shuffle.partitions", spark_config["shuffle_partitions"])
-        .getOrCreate()
+    builder = SparkSession.builder.appName(spark_config.get("app_name", app_name)).master(
+        spark_config["master"]
     )
+    for key, value in spark_settings(config, input_rows).items():
+        builder = builder.config(key, value)
+    return builder.getOrCreate()
+
+
+def size_shuffle_partitions(spark: SparkSession, config: Config, input_rows: int) -> int:
+    """Size spark.sql.shuffle.partitions for a batch of ``input_rows`` rows
+
+    A runtime setting, so it can follow each batch of a long-lived session.
+    Fixed SPARK_SHUFFLE_PARTITIONS values are left alone.
+    """
+    partitions = int(spark_settings(config, input_rows)["spark.sql.shuffle.partitions"])
+    spark.conf.set("spark.sql.shuffle.partitions", str(partitions))
+    return partitions
+
+
+def add_job_modules(spark: SparkSession) -> None:
+    """Ship this package's modules to the executors
+
+    Job modules import each other by bare name, so functions that run on
+    executors (e.g. ``foreachPartition`` writers) need them on the worker path.
+    """
+    for module in sorted(Path(__file__).parent.glob("*.py")):
+        spark.sparkContext.addPyFile(str(module))
+
+
+def persist_dataframes(dataframes: dict[str, DataFrame], storage_level: str) -> dict[str, int]:
+    """Persist DataFrames at the named StorageLevel and materialize each with one count
+
+    Every later action (writers, snapshot) then reads the cached blocks instead
+    of recomputing the DataFrame. Returns the row count of each DataFrame.
+    """
+    level = getattr(StorageLevel, storage_level)
+    return {name: df.persist(level).count() for name, df in dataframes.items()}
+
+
+def unpersist_dataframes(dataframes: dict[str, DataFrame]) -> None:
+    for df in dataframes.values():
+        df.unpersist()
@@ -53,14 +53,48 @@ class Config:
         # Return default
         return default
 
-    def get_steam_config(self) -> dict[str, str]:
+    def get_list(self, key: str, default: list | None = None, env_var: str | None = None) -> list:
+        """Get a list value; environment variables are parsed as comma-separated strings"""
+        value = self.get(key, default, env_var=env_var)
+        if value is None:
+            return []
+        if isinstance(value, str):
+            return [item.strip() for item in value.split(",") if item.strip()]
+        return list(value)
+
+    def get_steam_config(self) -> dict[str, Any]:
         """Get Steam API configuration"""
         return {
             "api_key": self.get("steam_api_key", env_var="STEAM_API_KEY"),
             "steam_id": self.get("steam_id", env_var="STEAM_ID"),
+            "steam_ids": self.get_list("steam_ids", env_var="STEAM_IDS"),
             "output_path": self.get(
                 "output_path", "data/steam_account", env_var="STEAM_OUTPUT_PATH"
             ),
+            # Steam allows 100k calls/day per key (~1.15/s); bursts are capped by the bucket
+            "requests_per_second": self.get(
+                "steam_requests_per_second", "1.15", env_var="STEAM_REQUESTS_PER_SECOND"
+            ),
+            "burst": self.get("steam_burst", "10", env_var="STEAM_BURST"),
+            "max_workers": self.get("steam_max_workers", "16", env_var="STEAM_MAX_WORKERS"),
+            # Opt-in: two extra rate-limited calls per played game with community stats
+            "fetch_achievements": self.get(
+                "steam_fetch_achievements", "false", env_var="STEAM_FETCH_ACHIEVEMENTS"
+            ),
+            # Set steam_cache_dir to an empty string to disable the response cache
+            "cache_dir": self.get("steam_cache_dir", "data/steam_cache", env_var="STEAM_CACHE_DIR"),
+            "cache_max_mb": self.get("steam_cache_max_mb", "512", env_var="STEAM_CACHE_MAX_MB"),
+            # Directory for raw gzip NDJSON payload recordings; empty disables recording
+            "record_dir": self.get("steam_record_dir", "", env_var="STEAM_RECORD_DIR"),
+            # Parquet snapshot lake under output_path
+            "snapshot_buckets": self.get(
+                "steam_snapshot_buckets", "16", env_var="STEAM_SNAPSHOT_BUCKETS"
+            ),
+            "snapshot_compression": self.get(
+                "steam_snapshot_compression", "zstd", env_var="STEAM_SNAPSHOT_COMPRESSION"
+            ),
+            # "full" rewrites everything; "incremental" writes only changes since the watermark
+            "ingestion_mode": self.get("ingestion_mode", "full", env_var="INGESTION_MODE"),
         }
 
     def get_spark_config(self) -> dict[str, str]:
@@ -70,9 +104,24 @@ class Config:
             "app_name": self.get(
                 "spark_app_name", "steam-account-processor", env_var="SPARK_APP_NAME"
             ),
+            # Performance profile from base.SPARK_PROFILES: local-dev, single-node or cluster;
+            # empty picks local-dev for local[...] masters and cluster for the others
+            "profile": self.get("spark_profile", "", env_var="SPARK_PROFILE"),
+            # "auto" sizes shuffle partitions from the input row count within the profile
             "shuffle_partitions": self.get(
-                "spark_shuffle_partitions", "4", env_var="SPARK_SHUFFLE_PARTITIONS"
+                "spark_shuffle_partitions", "auto", env_var="SPARK_SHUFFLE_PARTITIONS"
+            ),
+            # Override the profile's memory settings when set
+            "driver_memory": self.get("spark_driver_memory", "", env_var="SPARK_DRIVER_MEMORY"),
+            "executor_memory": self.get(
+                "spark_executor_memory", "", env_var="SPARK_EXECUTOR_MEMORY"
             ),
+            # StorageLevel name DataFrames are persisted at while they are shared by the sinks
+            "storage_level": self.get(
+                "spark_storage_level", "MEMORY_AND_DISK", env_var="SPARK_STORAGE_LEVEL"
+            ),
+            # Print the first rows of every DataFrame (runs one extra Spark job each)
+            "debug_show": self.get("spark_debug_show", "false", env_var="SPARK_DEBUG_SHOW"),
         }
 
     def get_postgres_config(self) -> dict[str, str]:
@@ -83,6 +132,26 @@ class Config:
             "database": self.get("postgres_db", "joyst_dw", env_var="POSTGRES_DB"),
             "user": self.get("postgres_user", "admin", env_var="POSTGRES_USER"),
             "password": self.get("postgres_password", env_var="POSTGRES_PASSWORD"),
+            "batch_size": self.get("postgres_batch_size", "10000", env_var="POSTGRES_BATCH_SIZE"),
+            # Connection pool shared by the writers of this process
+            "pool_min_size": self.get(
+                "postgres_pool_min_size", "1", env_var="POSTGRES_POOL_MIN_SIZE"
+            ),
+            "pool_max_size": self.get(
+                "postgres_pool_max_size", "4", env_var="POSTGRES_POOL_MAX_SIZE"
+            ),
+            # Idle connections older than this are pinged before reuse
+            "pool_health_check_seconds": self.get(
+                "postgres_pool_health_check_seconds",
+                "30",
+                env_var="POSTGRES_POOL_HEALTH_CHECK_SECONDS",
+            ),
+            "connect_attempts": self.get(
+                "postgres_connect_attempts", "5", env_var="POSTGRES_CONNECT_ATTEMPTS"
+            ),
+            "connect_backoff": self.get(
+                "postgres_connect_backoff", "0.5", env_var="POSTGRES_CONNECT_BACKOFF"
+            ),
         }
 
     def get_clickhouse_config(self) -> dict[str, str]:
@@ -93,4 +162,114 @@ class Config:
             "database": self.get("clickhouse_db", "gaming_analytics", env_var="CLICKHOUSE_DB"),
             "user": self.get("clickhouse_user", "admin", env_var="CLICKHOUSE_USER"),
             "password": self.get("clickhouse_password", env_var="CLICKHOUSE_PASSWORD"),
+            "batch_size": self.get(
+                "clickhouse_batch_size", "100000", env_var="CLICKHOUSE_BATCH_SIZE"
+            ),
+            # "columnar" sends Arrow-fetched column blocks; "row" builds one list per row
+            "insert_mode": self.get(
+                "clickhouse_insert_mode", "columnar", env_var="CLICKHOUSE_INSERT_MODE"
+            ),
+            # Block compression ("lz4", "zstd"); needs clickhouse-driver's compression extras
+            "compression": self.get("clickhouse_compression", "", env_var="CLICKHOUSE_COMPRESSION"),
+            # Connection pool shared by the writers of this process
+            "pool_min_size": self.get(
+                "clickhouse_pool_min_size", "1", env_var="CLICKHOUSE_POOL_MIN_SIZE"
+            ),
+            "pool_max_size": self.get(
+                "clickhouse_pool_max_size", "4", env_var="CLICKHOUSE_POOL_MAX_SIZE"
+            ),
+            # Idle connections older than this are pinged before reuse
+            "pool_health_check_seconds": self.get(
+                "clickhouse_pool_health_check_seconds",
+                "30",
+                env_var="CLICKHOUSE_POOL_HEALTH_CHECK_SECONDS",
+            ),
+            "connect_attempts": self.get(
+                "clickhouse_connect_attempts", "5", env_var="CLICKHOUSE_CONNECT_ATTEMPTS"
+            ),
+            "connect_backoff": self.get(
+                "clickhouse_connect_backoff", "0.5", env_var="CLICKHOUSE_CONNECT_BACKOFF"
+            ),
+        }
+
+    def get_writer_config(self) -> dict[str, str]:
+        """Get database write-phase configuration"""
+        return {
+            # "driver" streams rows to the driver; "partition" writes from the executors
+            "mode": self.get("writer_mode", "driver", env_var="WRITER_MODE"),
+            "parallelism": self.get("writer_parallelism", "4", env_var="WRITER_PARALLELISM"),
+            # Driver mode: batches buffered per store, and retries of a failed batch
+            "queue_depth": self.get("writer_queue_depth", "4", env_var="WRITER_QUEUE_DEPTH"),
+            "max_attempts": self.get("writer_max_attempts", "3", env_var="WRITER_MAX_ATTEMPTS"),
+            "retry_backoff": self.get(
+                "writer_retry_backoff", "1.0", env_var="WRITER_RETRY_BACKOFF"
+            ),
+        }
+
+    def get_queue_config(self) -> dict[str, str]:
+        """Get account queue and streaming worker configuration"""
+        return {
+            # Accounts claimed and pushed through fetch, transform and write together
+            "batch_size": self.get("queue_batch_size", "100", env_var="QUEUE_BATCH_SIZE"),
+            # A claimed batch returns to the queue when its worker stops renewing the lease
+            "lease_seconds": self.get("queue_lease_seconds", "600", env_var="QUEUE_LEASE_SECONDS"),
+            "poll_seconds": self.get("queue_poll_seconds", "10", env_var="QUEUE_POLL_SECONDS"),
+            "max_attempts": self.get("queue_max_attempts", "5", env_var="QUEUE_MAX_ATTEMPTS"),
+            # Seconds before a failed account is retried, doubled per attempt
+            "retry_backoff": self.get("queue_retry_backoff", "60", env_var="QUEUE_RETRY_BACKOFF"),
+            # Re-ingest processed accounts after this many hours; 0 processes each once
+            "revisit_hours": self.get("queue_revisit_hours", "0", env_var="QUEUE_REVISIT_HOURS"),
+            # Stable name so a restarted worker takes back its own leases at once
+            "worker_id": self.get("queue_worker_id", "", env_var="QUEUE_WORKER_ID"),
+        }
+
+    def get_features_config(self) -> dict[str, str]:
+        """Get player behaviour feature configuration"""
+        return {
+            # Recompute player_behavior_features of the players each run touched
+            "refresh": self.get("features_refresh", "true", env_var="FEATURES_REFRESH"),
+        }
+
+    def get_similarity_config(self) -> dict[str, str]:
+        """Get game similarity job configuration"""
+        return {
+            "top_k": self.get("similarity_top_k", "20", env_var="SIMILARITY_TOP_K"),
+            # "cosine" (playtime-weighted) or "jaccard" (shared players only)
+            "metric": self.get("similarity_metric", "cosine", env_var="SIMILARITY_METRIC"),
+            "hash_tables": self.get(
+                "similarity_hash_tables", "5", env_var="SIMILARITY_HASH_TABLES"
+            ),
+            # Largest Jaccard distance between player sets kept as a candidate pair
+            "max_distance": self.get(
+                "similarity_max_distance", "0.9", env_var="SIMILARITY_MAX_DISTANCE"
+            ),
+            "min_players": self.get(
+                "similarity_min_players", "2", env_var="SIMILARITY_MIN_PLAYERS"
+            ),
+        }
+
+    def get_serving_config(self) -> dict[str, str]:
+        """Get recommendation serving configuration"""
+        return {
+            "host": self.get("serving_host", "127.0.0.1", env_var="SERVING_HOST"),
+            "port": self.get("serving_port", "8090", env_var="SERVING_PORT"),
+            # Players whose ranked candidates stay cached
+            "cache_size": self.get("serving_cache_size", "10000", env_var="SERVING_CACHE_SIZE"),
+            "max_candidates": self.get(
+                "serving_max_candidates", "200", env_var="SERVING_MAX_CANDIDATES"
+            ),
+            # Seconds between polls for changed libraries and new similarity runs
+            "refresh_seconds": self.get(
+                "serving_refresh_seconds", "60", env_var="SERVING_REFRESH_SECONDS"
+            ),
+        }
+
+    def get_metrics_config(self) -> dict[str, str]:
+        """Get pipeline metrics configuration"""
+        return {
+            # Prometheus textfile path; empty disables it
+            "prometheus_path": self.get(
+                "metrics_prometheus_path", "", env_var="METRICS_PROMETHEUS_PATH"
+            ),
+            "clickhouse": self.get("metrics_clickhouse", "false", env_var="METRICS_CLICKHOUSE"),
         }
@@ -0,0 +1,260 @@
+"""Process-wide PostgreSQL and ClickHouse connection pools
+
+Long-running workers write many accounts over the same few connections instead
+of paying TCP, auth and session setup per account. A pool keeps up to
+``pool_max_size`` connections, opens ``pool_min_size`` of them up front, checks
+connections that sat idle for ``pool_health_check_seconds`` before lending them
+out and retries failed connects with exponential backoff.
+"""
+
+import atexit
+import threading
+import time
+from collections.abc import Callable, Iterator
+from contextlib import contextmanager
+from typing import Any
+
+import psycopg2
+from clickhouse_driver import Client
+from config import Config
+from psycopg2 import extensions
+
+# Pools of this process, keyed by sink and connection settings
+_POOLS: dict[tuple, "ConnectionPool"] = {}
+_POOLS_LOCK = threading.Lock()
+
+CONNECTION_KEYS = ("host", "port", "database", "user", "password")
+
+
+class PoolExhaustedError(RuntimeError):
+    """No connection became free within the acquire timeout"""
+
+
+class ConnectionPool:
+    """Thread-safe pool of connections created by ``connect``
+
+    ``ping`` raises (or returns False) when a connection is no longer usable,
+    ``reset`` prepares a returned connection for its next user and returns
+    False when it should be discarded instead, and ``close`` closes one.
+    """
+
+    def __init__(
+        self,
+        connect: Callable[[], Any],
+        ping: Callable[[Any], bool],
+        close: Callable[[Any], None],
+        reset: Callable[[Any], bool] = lambda connection: True,
+        min_size: int = 1,
+        max_size: int = 4,
+        connect_attempts: int = 5,
+        connect_backoff: float = 0.5,
+        health_check_seconds: float = 30.0,
+        acquire_timeout: float = 60.0,
+    ):
+        self._connect = connect
+        self._ping = ping
+        self._close = close
+        self._reset = reset
+        self.max_size = max_size
+        self.connect_attempts = connect_attempts
+        self.connect_backoff = connect_backoff
+        self.health_check_seconds = health_check_seconds
+        self.acquire_timeout = acquire_timeout
+        self._idle: list[tuple[Any, float]] = []  # (connection, returned at), newest last
+        self._size = 0
+        self._available = threading.Condition()
+        self.stats = {"connects": 0, "reconnects": 0, "reused": 0}
+
+        for _ in range(min_size):
+            self._size += 1
+            self._idle.append((self._open(), time.monotonic()))
+
+    def _open(self) -> Any:
+        """Connect, retrying with exponential backoff"""
+        for attempt in range(self.connect_attempts):
+            try:
+                connection = self._connect()
+                self.stats["connects"] += 1
+                return connection
+            except Exception as e:
+                if attempt == self.connect_attempts - 1:
+                    raise
+                delay = self.connect_backoff * 2**attempt
+                print(f"⚠️ Connect failed ({e}), retrying in {delay:.1f}s...")
+                time.sleep(delay)
+
+    def _healthy(self, connection: Any) -> bool:
+        try:
+            return self._ping(connection) is not False
+        except Exception:
+            return False
+
+    def _discard(self, connection: Any) -> None:
+        try:
+            self._close(connection)
+        except Exception:
+            pass
+
+    def acquire(self) -> Any:
+        """Lend out a healthy connection, opening one while the pool is below max_size"""
+        deadline = time.monotonic() + self.acquire_timeout
+        with self._available:
+            while not self._idle and self._size >= self.max_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0 or not self._available.wait(remaining):
+                    raise PoolExhaustedError(f"No free connection after {self.acquire_timeout}s")
+            if self._idle:
+                connection, returned_at = self._idle.pop()
+            else:
+                connection, returned_at = None, None
+                self._size += 1
+
+        if connection is not None:
+            stale = time.monotonic() - returned_at >= self.health_check_seconds
+            if not stale or self._healthy(connection):
+                self.stats["reused"] += 1
+                return connection
+            self._discard(connection)
+            self.stats["reconnects"] += 1
+
+        try:
+            return self._open()
+        except BaseException:
+            with self._available:
+                self._size -= 1
+                self._available.notify()
+            raise
+
+    def release(self, connection: Any) -> None:
+        """Return a connection; broken ones are closed and their slot freed"""
+        try:
+            keep = self._reset(connection)
+        except Exception:
+            keep = False
+        if not keep:
+            self._discard(connection)
+        with self._available:
+            if keep:
+                self._idle.append((connection, time.monotonic()))
+            else:
+                self._size -= 1
+            self._available.notify()
+
+    @contextmanager
+    def connection(self) -> Iterator[Any]:
+        connection = self.acquire()
+        try:
+            yield connection
+        finally:
+            self.release(connection)
+
+    def close(self) -> None:
+        """Close the idle connections; connections still lent out close on release"""
+        with self._available:
+            idle, self._idle = self._idle, []
+            self._size -= len(idle)
+        for connection, _ in idle:
+            self._discard(connection)
+
+
+def _pool_options(sink_config: dict[str, str]) -> dict[str, Any]:
+    return {
+        "min_size": int(sink_config["pool_min_size"]),
+        "max_size": int(sink_config["pool_max_size"]),
+        "connect_attempts": int(sink_config["connect_attempts"]),
+        "connect_backoff": float(sink_config["connect_backoff"]),
+        "health_check_seconds": float(sink_config["pool_health_check_seconds"]),
+    }
+
+
+def _shared_pool(sink: str, sink_config: dict[str, str], create: Callable[[], ConnectionPool]):
+    key = (sink, *(sink_config[k] for k in CONNECTION_KEYS))
+    with _POOLS_LOCK:
+        if key not in _POOLS:
+            _POOLS[key] = create()
+        return _POOLS[key]
+
+
+def _connect_postgres(pg_config: dict[str, str]) -> Any:
+    connection = psycopg2.connect(
+        host=pg_config["host"],
+        port=pg_config["port"],
+        database=pg_config["database"],
+        user=pg_config["user"],
+        password=pg_config["password"],
+    )
+    connection.autocommit = True
+    return connection
+
+
+def _ping_postgres(connection: Any) -> bool:
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT 1")
+    return True
+
+
+def _reset_postgres(connection: Any) -> bool:
+    """Roll back anything a user left open and return to autocommit"""
+    if connection.closed:
+        return False
+    if connection.status != extensions.STATUS_READY:
+        connection.rollback()
+    connection.autocommit = True
+    return True
+
+
+def postgres_pool(config: Config) -> ConnectionPool:
+    """This process's pool for the configured PostgreSQL database"""
+    pg_config = config.get_postgres_config()
+    return _shared_pool(
+        "postgres",
+        pg_config,
+        lambda: ConnectionPool(
+            lambda: _connect_postgres(pg_config),
+            _ping_postgres,
+            lambda connection: connection.close(),
+            reset=_reset_postgres,
+            **_pool_options(pg_config),
+        ),
+    )
+
+
+def clickhouse_pool(config: Config) -> ConnectionPool:
+    """This process's pool of clients for the configured ClickHouse database
+
+    clickhouse_driver connects lazily, so a new client is checked with one ping.
+    """
+    ch_config = config.get_clickhouse_config()
+
+    def connect() -> Client:
+        client = Client(
+            host=ch_config["host"],
+            port=ch_config["port"],
+            database=ch_config["database"],
+            user=ch_config["user"],
+            password=ch_config["password"],
+            compression=ch_config["compression"] or False,
+        )
+        client.execute("SELECT 1")
+        return client
+
+    return _shared_pool(
+        "clickhouse",
+        ch_config,
+        lambda: ConnectionPool(
+            connect,
+            lambda client: client.execute("SELECT 1") is not None,
+            lambda client: client.disconnect(),
+            **_pool_options(ch_config),
+        ),
+    )
+
+
+@atexit.register
+def close_pools() -> None:
+    """Close every pool of this process"""
+    with _POOLS_LOCK:
+        pools = list(_POOLS.values())
+        _POOLS.clear()
+    for pool in pools:
+        pool.close()
@@ -1,249 +1,751 @@
 """Database writers for Steam data - PostgreSQL and ClickHouse"""
 
+import io
+from collections.abc import Callable, Iterable, Iterator
+from contextlib import contextmanager
+from datetime import date, datetime, timezone
+from itertools import islice
+from typing import Any
+
 import psycopg2
 from clickhouse_driver import Client
 from config import Config
+from connection_pool import ConnectionPool, clickhouse_pool, postgres_pool
+from metrics import PipelineMetrics
 from pyspark.sql import DataFrame
+from pyspark.sql import functions as F
+from sink_fanout import SinkRunner, SinkTable, fan_out
+from surrogate_keys import (
+    game_sk,
+    game_sk_col,
+    player_sk,
+    player_sk_col,
+    session_sk,
+    session_sk_col,
+    to_unsigned,
+)
+
+PLAYER_COLUMNS = (
+    "steamid",
+    "personaname",
+    "profileurl",
+    "avatar",
+    "personastate",
+    "communityvisibilitystate",
+    "profilestate",
+    "lastlogoff",
+    "timecreated",
+)
+GAME_COLUMNS = ("appid", "name", "img_icon_url", "img_logo_url")
+ACTIVITY_COLUMNS = ("steamid", "appid", "playtime_forever", "playtime_2weeks", "last_played")
+
+# Staging table for owned/recently-played rows, keyed by natural keys until resolved
+OWNED_GAMES_STAGE_DDL = """
+    CREATE TEMP TABLE stage_owned_games (
+        steamid VARCHAR(20),
+        appid INTEGER,
+        playtime_forever INTEGER,
+        playtime_2weeks INTEGER,
+        last_played TIMESTAMP
+    ) ON COMMIT DROP
+"""
+
+
+def batched(iterable: Iterable, size: int) -> Iterator[list]:
+    """Yield lists of at most ``size`` items"""
+    iterator = iter(iterable)
+    while batch := list(islice(iterator, size)):
+        yield batch
+
+
+def column_blocks(columns: dict[str, list], size: int) -> Iterator[dict[str, list]]:
+    """Slice equally long column lists into blocks of at most ``size`` rows"""
+    total = len(next(iter(columns.values()), []))
+    for start in range(0, total, size):
+        yield {name: values[start : start + size] for name, values in columns.items()}
+
+
+def epoch_to_timestamp(value: int | None) -> datetime | None:
+    """Convert a Steam unix timestamp to a naive UTC datetime"""
+    if not value:
+        return None
+    return datetime.fromtimestamp(value, tz=timezone.utc).replace(tzinfo=None)
+
+
+def player_record(row: Any) -> tuple:
+    """steam_players values for a player summary row, in PLAYER_COLUMNS order"""
+    return (
+        row.steamid,
+        row.personaname,
+        row.profileurl,
+        row.avatar,
+        row.personastate,
+        row.communityvisibilitystate,
+        row.profilestate,
+        epoch_to_timestamp(row.lastlogoff),
+        epoch_to_timestamp(row.timecreated),
+    )
+
+
+def game_record(row: Any) -> tuple:
+    """steam_games values for a game row, in GAME_COLUMNS order"""
+    return (row.appid, row.name, row.img_icon_url, row.img_logo_url)
+
+
+def owned_game_record(row: Any) -> tuple:
+    """Staging values for an owned/recently-played game row, in ACTIVITY_COLUMNS order"""
+    return (
+        row.steamid,
+        row.appid,
+        row.playtime_forever,
+        row.playtime_2weeks,
+        epoch_to_timestamp(row.rtime_last_played),
+    )
+
+
+def _copy_field(value: Any) -> str:
+    """Encode a value for COPY ... FROM STDIN in text format"""
+    if value is None:
+        return "\\N"
+    return (
+        str(value)
+        .replace("\\", "\\\\")
+        .replace("\t", "\\t")
+        .replace("\n", "\\n")
+        .replace("\r", "\\r")
+    )
 
 
 class PostgreSQLWriter:
     """Write Steam data to PostgreSQL for operational storage"""
 
-    def __init__(self, config: Config):
+    def __init__(self, config: Config, pool: ConnectionPool | None = None):
         self.config = config
         pg_config = config.get_postgres_config()
-        self.connection = psycopg2.connect(
-            host=pg_config["host"],
-            port=pg_config["port"],
-            database=pg_config["database"],
-            user=pg_config["user"],
-            password=pg_config["password"],
+        self.batch_size = int(pg_config["batch_size"])
+        self.bytes_sent = 0
+        # A pooled connection is borrowed here and handed back by close()
+        self.pool = pool
+        self.connection = self._connect()
+
+    def _connect(self) -> Any:
+        if self.pool is not None:
+            connection = self.pool.acquire()
+        else:
+            pg_config = self.config.get_postgres_config()
+            connection = psycopg2.connect(
+                host=pg_config["host"],
+                port=pg_config["port"],
+                database=pg_config["database"],
+                user=pg_config["user"],
+                password=pg_config["password"],
+            )
+        connection.autocommit = True
+        return connection
+
+    def reset(self) -> None:
+        """Roll back after a failed batch, or swap in a new connection if this one died"""
+        if not self.connection.closed:
+            try:
+                self.connection.rollback()
+                self.connection.autocommit = True
+                return
+            except psycopg2.Error:
+                pass
+        broken = self.connection
+        if self.pool is not None:
+            # The pool discards connections that are closed or won't roll back
+            self.pool.release(broken)
+        else:
+            broken.close()
+        self.connection = self._connect()
+
+    @contextmanager
+    def _transaction(self):
+        """Run a block in one transaction, then return to autocommit"""
+        self.connection.autocommit = False
+        try:
+            with self.connection, self.connection.cursor() as cursor:
+                yield cursor
+        finally:
+            self.connection.autocommit = True
+
+    def _copy_merge(
+        self,
+        stage: str,
+        stage_ddl: str,
+        columns: tuple[str, ...],
+        merge_sql: str,
+        records: Iterable[tuple],
+    ) -> int:
+        """COPY record batches into a temp staging table and merge each with one statement
+
+        ``stage_ddl`` creates the ``ON COMMIT DROP`` staging table ``stage`` and ``merge_sql``
+        moves its rows into the target; both run with the COPY in one transaction
+        per batch, so each batch costs three statements regardless of its size.
+        Returns the number of records staged.
+        """
+        column_list = ", ".join(columns)
+        written = 0
+
+        for batch in batched(records, self.batch_size):
+            buffer = io.StringIO()
+            for record in batch:
+                buffer.write("\t".join(_copy_field(v) for v in record) + "\n")
+            self.bytes_sent += buffer.tell()
+            buffer.seek(0)
+
+            with self._transaction() as cursor:
+                cursor.execute(stage_ddl)
+                cursor.copy_expert(f"COPY {stage} ({column_list}) FROM STDIN", buffer)
+                cursor.execute(merge_sql)
+            written += len(batch)
+
+        return written
+
+    def copy_upsert(
+        self,
+        table: str,
+        columns: tuple[str, ...],
+        key: str,
+        records: Iterable[tuple],
+    ) -> int:
+        """Upsert records through a COPY-loaded staging table, one transaction per batch
+
+        Each batch is streamed into a temporary table with COPY and merged with a
+        single INSERT ... ON CONFLICT (key) DO UPDATE. Returns the number of rows
+        written.
+        """
+        column_list = ", ".join(columns)
+        updates = ", ".join(f"{c} = EXCLUDED.{c}" for c in columns if c != key)
+        stage = f"stage_{table}"
+        stage_ddl = (
+            f"CREATE TEMP TABLE {stage} ON COMMIT DROP AS "
+            f"SELECT {column_list} FROM {table} WITH NO DATA"
+        )
+        # DISTINCT ON keeps ON CONFLICT from touching the same row twice
+        merge_sql = f"""
+            INSERT INTO {table} ({column_list})
+            SELECT DISTINCT ON ({key}) {column_list} FROM {stage}
+            ON CONFLICT ({key}) DO UPDATE SET
+                {updates},
+                updated_at = CURRENT_TIMESTAMP
+        """
+        return self._copy_merge(stage, stage_ddl, columns, merge_sql, records)
+
+    def upsert_players(self, records: Iterable[tuple]) -> int:
+        """Bulk upsert steam_players records (see ``player_record``)"""
+        return self.copy_upsert("steam_players", PLAYER_COLUMNS, "steamid", records)
+
+    def upsert_games(self, records: Iterable[tuple]) -> int:
+        """Bulk upsert steam_games records (see ``game_record``)"""
+        return self.copy_upsert("steam_games", GAME_COLUMNS, "appid", records)
+
+    def upsert_owned_games(self, records: Iterable[tuple]) -> int:
+        """Bulk upsert steam_owned_games records (see ``owned_game_record``)
+
+        player_id and game_id are resolved with one join against steam_players and
+        steam_games per batch; rows whose player or game is unknown are skipped.
+        """
+        merge_sql = """
+            INSERT INTO steam_owned_games (
+                player_id, game_id, appid, playtime_forever, playtime_2weeks, last_played
+            )
+            SELECT DISTINCT ON (p.id, s.appid)
+                p.id, g.id, s.appid,
+                COALESCE(s.playtime_forever, 0), COALESCE(s.playtime_2weeks, 0), s.last_played
+            FROM stage_owned_games s
+            JOIN steam_players p ON p.steamid = s.steamid
+            JOIN steam_games g ON g.appid = s.appid
+            ON CONFLICT (player_id, appid) DO UPDATE SET
+                game_id = EXCLUDED.game_id,
+                playtime_forever = EXCLUDED.playtime_forever,
+                playtime_2weeks = EXCLUDED.playtime_2weeks,
+                last_played = EXCLUDED.last_played,
+                updated_at = CURRENT_TIMESTAMP
+        """
+        return self._copy_merge(
+            "stage_owned_games", OWNED_GAMES_STAGE_DDL, ACTIVITY_COLUMNS, merge_sql, records
         )
-        self.connection.autocommit = True
 
-    def write_player_data(self, df: DataFrame) -> None:
-        """Write player summary data to PostgreSQL"""
-        print("Writing player data to PostgreSQL...")
+    def insert_recently_played(self, records: Iterable[tuple]) -> int:
+        """Append steam_recently_played records (see ``owned_game_record``)
 
-        # Convert DataFrame to list of rows
-        rows = df.collect()
+        Recently-played rows are history, so every run appends a new recorded_at
+        snapshot; ids are resolved with the same set-based join as owned games.
+        """
+        stage_ddl = OWNED_GAMES_STAGE_DDL.replace("stage_owned_games", "stage_recently_played")
+        merge_sql = """
+            INSERT INTO steam_recently_played (
+                player_id, game_id, appid, playtime_forever, playtime_2weeks
+            )
+            SELECT p.id, g.id, s.appid,
+                COALESCE(s.playtime_forever, 0), COALESCE(s.playtime_2weeks, 0)
+            FROM stage_recently_played s
+            JOIN steam_players p ON p.steamid = s.steamid
+            JOIN steam_games g ON g.appid = s.appid
+        """
+        return self._copy_merge(
+            "stage_recently_played", stage_ddl, ACTIVITY_COLUMNS, merge_sql, records
+        )
 
+    def upsert_players_per_row(self, records: Iterable[tuple]) -> int:
+        """Upsert players with one upsert_steam_player() call per row"""
+        written = 0
         with self.connection.cursor() as cursor:
-            for row in rows:
-                # Use upsert function from our schema
+            for record in records:
                 cursor.execute(
-                    """
-                    SELECT upsert_steam_player(%s, %s, %s, %s, %s, %s, %s, %s, %s)
-                """,
-                    (
-                        row.steamid,
-                        row.personaname,
-                        row.profileurl,
-                        row.avatar,
-                        row.personastate,
-                        row.communityvisibilitystate,
-                        row.profilestate,
-                        "2023-01-01 00:00:00",  # Convert timestamp
-                        "2023-01-01 00:00:00",  # Convert timestamp
-                    ),
+                    "SELECT upsert_steam_player(%s, %s, %s, %s, %s, %s, %s, %s, %s)", record
                 )
+                written += 1
+        return written
 
-    def write_games_data(self, df: DataFrame) -> None:
-        """Write games data to PostgreSQL"""
-        print("Writing games data to PostgreSQL...")
+    def upsert_games_per_row(self, records: Iterable[tuple]) -> int:
+        """Upsert games with one upsert_steam_game() call per row"""
+        written = 0
+        with self.connection.cursor() as cursor:
+            for record in records:
+                cursor.execute("SELECT upsert_steam_game(%s, %s, %s, %s)", record)
+                written += 1
+        return written
 
-        rows = df.collect()
+    def sink_tables(self, dataframes: dict[str, DataFrame]) -> list[SinkTable]:
+        """The PostgreSQL tables of ``dataframes`` as batch sources, in load order
 
-        with self.connection.cursor() as cursor:
-            for row in rows:
-                # Use upsert function for games
-                cursor.execute(
-                    """
-                    SELECT upsert_steam_game(%s, %s, %s, %s)
-                """,
-                    (row.appid, row.name, row.img_icon_url, row.img_logo_url),
+        Players and games come first so owned and recently played games can
+        resolve their ids.
+        """
+
+        def source(name: str, to_record: Callable[[Any], tuple]) -> Callable[[], Iterator]:
+            return lambda: batched(
+                (to_record(row) for row in dataframes[name].toLocalIterator()), self.batch_size
+            )
+
+        tables = []
+        if "player_summary" in dataframes:
+            tables.append(
+                SinkTable(
+                    "steam_players", source("player_summary", player_record), self.upsert_players
+                )
+            )
+        # Recently played games may be missing from the owned list (e.g. family sharing)
+        for name in ("owned_games", "recently_played"):
+            if name in dataframes:
+                tables.append(
+                    SinkTable("steam_games", source(name, game_record), self.upsert_games)
+                )
+        if "owned_games" in dataframes:
+            tables.append(
+                SinkTable(
+                    "steam_owned_games",
+                    source("owned_games", owned_game_record),
+                    self.upsert_owned_games,
                 )
+            )
+        if "recently_played" in dataframes:
+            tables.append(
+                SinkTable(
+                    "steam_recently_played",
+                    source("recently_played", owned_game_record),
+                    self.insert_recently_played,
+                )
+            )
+        return tables
 
     def close(self):
-        """Close database connection"""
-        self.connection.close()
+        """Close database connection, or return it to its pool"""
+        if self.pool is not None:
+            self.pool.release(self.connection)
+        else:
+            self.connection.close()
+
+
+PLACEHOLDER_RELEASE_DATE = date(2023, 1, 1)
+
+DIM_PLAYERS_INSERT = """
+    INSERT INTO dim_players (
+        player_sk, steamid, persona_name, profile_url, avatar_url,
+        account_created_date, community_visibility_state, profile_state,
+        is_active
+    ) VALUES
+"""
+
+DIM_GAMES_INSERT = """
+    INSERT INTO dim_games (
+        game_sk, appid, name, short_description, detailed_description,
+        developer, publisher, release_date, price_initial, price_current,
+        discount_percent, metacritic_score, positive_ratings, negative_ratings,
+        estimated_owners, peak_ccu, required_age, is_free, dlc_count,
+        achievement_count, average_playtime, median_playtime,
+        img_icon_url, img_logo_url, is_active
+    ) VALUES
+"""
+
+FACT_SESSIONS_INSERT = """
+    INSERT INTO fact_gaming_sessions (
+        session_sk, player_sk, game_sk, date_sk, session_start,
+        session_end, session_duration_minutes, playtime_total_minutes,
+        achievements_unlocked, is_first_play, device_type
+    ) VALUES
+"""
+
+
+PIPELINE_RUNS_INSERT = """
+    INSERT INTO pipeline_runs (
+        run_id, job, stage, started_at, duration_seconds, rows, bytes,
+        http_requests, http_retries, rows_per_second, status
+    ) VALUES
+"""
+
+
+def account_created_date(timecreated: int | None) -> date:
+    """dim_players account_created_date; unknown creation times map to 1970-01-01"""
+    created = epoch_to_timestamp(timecreated)
+    return created.date() if created else date(1970, 1, 1)
+
+
+def dim_player_record(row: Any) -> list:
+    """dim_players values for a player summary row"""
+    return [
+        player_sk(row.steamid),
+        row.steamid,
+        row.personaname,
+        row.profileurl,
+        row.avatar,
+        account_created_date(row.timecreated),
+        row.communityvisibilitystate,
+        row.profilestate,
+        1,
+    ]
+
+
+def dim_game_record(row: Any) -> list:
+    """dim_games values for a game row"""
+    return [
+        game_sk(row.appid),
+        row.appid,
+        row.name,
+        "",  # short_description
+        "",  # detailed_description
+        "Unknown",  # developer
+        "Unknown",  # publisher
+        PLACEHOLDER_RELEASE_DATE,  # release_date
+        0.0,  # price_initial
+        0.0,  # price_current
+        0,  # discount_percent
+        0,  # metacritic_score
+        0,  # positive_ratings
+        0,  # negative_ratings
+        "Unknown",  # estimated_owners
+        0,  # peak_ccu
+        0,  # required_age
+        1,  # is_free
+        0,  # dlc_count
+        0,  # achievement_count
+        row.playtime_forever if hasattr(row, "playtime_forever") else 0,  # average_playtime
+        row.playtime_forever if hasattr(row, "playtime_forever") else 0,  # median_playtime
+        row.img_icon_url,
+        row.img_logo_url,
+        1,  # is_active
+    ]
+
+
+def session_record(row: Any) -> list:
+    """fact_gaming_sessions values for a row of ``sessions.reconstruct_sessions``"""
+    return [
+        session_sk(row.steamid, row.appid, row.session_start),
+        player_sk(row.steamid),
+        game_sk(row.appid),
+        row.date_sk,
+        row.session_start,
+        row.session_end,
+        row.session_duration_minutes,
+        row.playtime_total_minutes,
+        row.achievements_unlocked,
+        row.is_first_play,
+        FACT_SESSIONS_CONSTANTS["device_type"],
+    ]
+
+
+SURROGATE_KEY_COLUMNS = {"player_sk", "game_sk", "session_sk", "game_sk_1", "game_sk_2"}
+
+# Columns the Steam API does not provide yet, filled on the driver as constant blocks
+DIM_PLAYERS_CONSTANTS = {"is_active": 1}
+
+DIM_GAMES_CONSTANTS = {
+    "short_description": "",
+    "detailed_description": "",
+    "developer": "Unknown",
+    "publisher": "Unknown",
+    "release_date": PLACEHOLDER_RELEASE_DATE,
+    "price_initial": 0.0,
+    "price_current": 0.0,
+    "discount_percent": 0,
+    "metacritic_score": 0,
+    "positive_ratings": 0,
+    "negative_ratings": 0,
+    "estimated_owners": "Unknown",
+    "peak_ccu": 0,
+    "required_age": 0,
+    "is_free": 1,
+    "dlc_count": 0,
+    "achievement_count": 0,
+    "is_active": 1,
+}
+
+FACT_SESSIONS_CONSTANTS = {
+    "device_type": 1,  # Windows
+}
+
+
+def dim_players_columns(df: DataFrame) -> DataFrame:
+    """Variable dim_players columns, computed in Spark"""
+    created = F.to_date(F.from_unixtime("timecreated"))
+    return df.select(
+        player_sk_col().alias("player_sk"),
+        F.col("steamid"),
+        F.coalesce("personaname", F.lit("")).alias("persona_name"),
+        F.coalesce("profileurl", F.lit("")).alias("profile_url"),
+        F.coalesce("avatar", F.lit("")).alias("avatar_url"),
+        F.coalesce(created, F.lit("1970-01-01").cast("date")).alias("account_created_date"),
+        F.coalesce("communityvisibilitystate", F.lit(0)).alias("community_visibility_state"),
+        F.coalesce("profilestate", F.lit(0)).alias("profile_state"),
+    )
+
+
+def dim_games_columns(df: DataFrame) -> DataFrame:
+    """Variable dim_games columns, computed in Spark"""
+    playtime = F.coalesce("playtime_forever", F.lit(0))
+    return df.select(
+        game_sk_col().alias("game_sk"),
+        F.col("appid"),
+        F.coalesce("name", F.lit("")).alias("name"),
+        playtime.alias("average_playtime"),
+        playtime.alias("median_playtime"),
+        F.coalesce("img_icon_url", F.lit("")).alias("img_icon_url"),
+        F.coalesce("img_logo_url", F.lit("")).alias("img_logo_url"),
+    )
+
+
+def fact_sessions_columns(sessions: DataFrame) -> DataFrame:
+    """Variable fact_gaming_sessions columns of a ``reconstruct_sessions`` frame"""
+    return sessions.select(
+        session_sk_col().alias("session_sk"),
+        player_sk_col().alias("player_sk"),
+        game_sk_col().alias("game_sk"),
+        "date_sk",
+        "session_start",
+        "session_end",
+        "session_duration_minutes",
+        "playtime_total_minutes",
+        "achievements_unlocked",
+        "is_first_play",
+    )
+
+
+def _column_lists(pdf: Any) -> dict[str, list]:
+    """Python value lists per column of a pandas frame, surrogate keys as UInt64"""
+    return {
+        name: to_unsigned(pdf[name]) if name in SURROGATE_KEY_COLUMNS else pdf[name].tolist()
+        for name in pdf.columns
+    }
 
 
 class ClickHouseWriter:
     """Write Steam data to ClickHouse for analytics and ML"""
 
-    def __init__(self, config: Config):
+    def __init__(
+        self, config: Config, client: Client | None = None, pool: ConnectionPool | None = None
+    ):
         self.config = config
         ch_config = config.get_clickhouse_config()
-        self.client = Client(
+        self.batch_size = int(ch_config["batch_size"])
+        self.insert_mode = ch_config["insert_mode"]
+        # An existing client (or a stand-in with the same execute/disconnect) can be passed
+        # in; a pooled client is borrowed here and handed back by close()
+        self.pool = pool if client is None else None
+        if client is None and pool is not None:
+            client = pool.acquire()
+        self.client = client or Client(
             host=ch_config["host"],
             port=ch_config["port"],
             database=ch_config["database"],
             user=ch_config["user"],
             password=ch_config["password"],
+            compression=ch_config["compression"] or False,
         )
 
-    def write_player_data(self, df: DataFrame, steam_id: str) -> None:
-        """Write player data to ClickHouse dimensions"""
-        print("Writing player data to ClickHouse...")
-
-        rows = df.collect()
-
-        for row in rows:
-            # Insert into dim_players
-            self.client.execute(
-                """
-                INSERT INTO dim_players (
-                    player_sk, steamid, persona_name, profile_url, avatar_url,
-                    account_created_date, community_visibility_state, profile_state,
-                    is_active
-                ) VALUES
-            """,
-                [
-                    [
-                        hash(row.steamid) % (2**32),  # Generate player_sk
-                        row.steamid,
-                        row.personaname,
-                        row.profileurl,
-                        row.avatar,
-                        "2023-01-01",  # Convert timestamp to date
-                        row.communityvisibilitystate,
-                        row.profilestate,
-                        1,
-                    ]
-                ],
-            )
+    def _insert(self, query: str, records: Iterable[list]) -> int:
+        """Insert records in blocks of ``batch_size`` rows, one INSERT per block"""
+        written = 0
+        for batch in batched(records, self.batch_size):
+            self.client.execute(query, batch)
+            written += len(batch)
+        return written
+
+    def insert_columnar(
+        self, table: str, columns: dict[str, list], constants: dict[str, Any] | None = None
+    ) -> int:
+        """Insert column blocks with ``columnar=True``, ``batch_size`` rows per INSERT
+
+        ``columns`` maps column names to equally long value lists; ``constants``
+        are expanded to full blocks here instead of being built row by row.
+        """
+        constants = constants or {}
+        names = list(columns) + list(constants)
+        query = f"INSERT INTO {table} ({', '.join(names)}) VALUES"
+        total = len(next(iter(columns.values()), []))
+
+        for start in range(0, total, self.batch_size):
+            block = [values[start : start + self.batch_size] for values in columns.values()]
+            size = len(block[0])
+            block.extend([value] * size for value in constants.values())
+            self.client.execute(query, block, columnar=True)
+
+        return total
+
+    def insert_players(self, records: Iterable[list]) -> int:
+        return self._insert(DIM_PLAYERS_INSERT, records)
+
+    def insert_games(self, records: Iterable[list]) -> int:
+        return self._insert(DIM_GAMES_INSERT, records)
+
+    def insert_sessions(self, records: Iterable[list]) -> int:
+        return self._insert(FACT_SESSIONS_INSERT, records)
+
+    def insert_pipeline_runs(self, records: Iterable[list]) -> int:
+        return self._insert(PIPELINE_RUNS_INSERT, records)
+
+    def write_game_similarity(self, similarity_df: DataFrame, calculated_at: datetime) -> int:
+        """Write a ``game_similarity.compute_similarity`` frame as one run of similarities
+
+        Always columnar: the table is large and every column is already computed.
+        """
+        print("Writing game similarities to ClickHouse...")
+
+        columns = _column_lists(similarity_df.toPandas())
+        return self.insert_columnar(
+            "game_similarity_features", columns, {"calculated_at": calculated_at}
+        )
 
-    def write_games_data(self, df: DataFrame) -> None:
-        """Write games data to ClickHouse dimensions"""
-        print("Writing games data to ClickHouse...")
-
-        rows = df.collect()
-        games_data = []
-
-        for row in rows:
-            games_data.append(
-                [
-                    hash(row.appid) % (2**32),  # Generate game_sk
-                    row.appid,
-                    row.name,
-                    "",  # short_description
-                    "",  # detailed_description
-                    "Unknown",  # developer
-                    "Unknown",  # publisher
-                    "2023-01-01",  # release_date
-                    0.0,  # price_initial
-                    0.0,  # price_current
-                    0,  # discount_percent
-                    0,  # metacritic_score
-                    0,  # positive_ratings
-                    0,  # negative_ratings
-                    "Unknown",  # estimated_owners
-                    0,  # peak_ccu
-                    0,  # required_age
-                    1,  # is_free
-                    0,  # dlc_count
-                    0,  # achievement_count
-                    row.playtime_forever
-                    if hasattr(row, "playtime_forever")
-                    else 0,  # average_playtime
-                    row.playtime_forever
-                    if hasattr(row, "playtime_forever")
-                    else 0,  # median_playtime
-                    row.img_icon_url,
-                    row.img_logo_url,
-                    1,  # is_active
-                ]
+    def write_player_features(self, features_df: DataFrame) -> int:
+        """Write a ``player_features.player_features`` frame to player_behavior_features"""
+        print("Writing player behaviour features to ClickHouse...")
+
+        columns = _column_lists(features_df.toPandas())
+        # Arrow hands array columns over as numpy arrays; the driver wants lists
+        columns["preferred_genres"] = [list(genres) for genres in columns["preferred_genres"]]
+        return self.insert_columnar("player_behavior_features", columns)
+
+    def sink_tables(self, dataframes: dict[str, DataFrame]) -> list[SinkTable]:
+        """The ClickHouse tables of ``dataframes`` as batch sources, in load order"""
+
+        def table(
+            name: str,
+            target: str,
+            columns: Callable[[DataFrame], DataFrame],
+            constants: dict[str, Any],
+            to_record: Callable[[Any], list],
+            insert: Callable[[Iterable[list]], int],
+        ) -> SinkTable:
+            df = dataframes[name]
+            if self.insert_mode == "columnar":
+                return SinkTable(
+                    target,
+                    lambda: column_blocks(_column_lists(columns(df).toPandas()), self.batch_size),
+                    lambda block: self.insert_columnar(target, block, constants),
+                )
+            return SinkTable(
+                target,
+                lambda: batched((to_record(row) for row in df.toLocalIterator()), self.batch_size),
+                insert,
             )
 
-        if games_data:
-            self.client.execute(
-                """
-                INSERT INTO dim_games (
-                    game_sk, appid, name, short_description, detailed_description,
-                    developer, publisher, release_date, price_initial, price_current,
-                    discount_percent, metacritic_score, positive_ratings, negative_ratings,
-                    estimated_owners, peak_ccu, required_age, is_free, dlc_count,
-                    achievement_count, average_playtime, median_playtime,
-                    img_icon_url, img_logo_url, is_active
-                ) VALUES
-            """,
-                games_data,
+        tables = []
+        if "player_summary" in dataframes:
+            tables.append(
+                table(
+                    "player_summary",
+                    "dim_players",
+                    dim_players_columns,
+                    DIM_PLAYERS_CONSTANTS,
+                    dim_player_record,
+                    self.insert_players,
+                )
             )
-
-    def write_gaming_sessions(self, owned_games_df: DataFrame, steam_id: str) -> None:
-        """Create gaming sessions from owned games data"""
-        print("Writing gaming sessions to ClickHouse...")
-
-        rows = owned_games_df.collect()
-        sessions_data = []
-
-        player_sk = hash(steam_id) % (2**32)
-
-        for row in rows:
-            if hasattr(row, "playtime_forever") and row.playtime_forever > 0:
-                game_sk = hash(row.appid) % (2**32)
-                date_sk = 20240115  # Use a fixed date for demo
-
-                sessions_data.append(
-                    [
-                        hash(f"{player_sk}_{game_sk}_{date_sk}") % (2**32),  # session_sk
-                        player_sk,
-                        game_sk,
-                        date_sk,
-                        "2024-01-15 12:00:00",  # session_start
-                        "2024-01-15 14:00:00",  # session_end
-                        120,  # session_duration_minutes
-                        row.playtime_forever,  # playtime_total_minutes
-                        0,  # achievements_unlocked
-                        0,  # is_first_play
-                        1,  # device_type (Windows)
-                    ]
+        if "owned_games" in dataframes:
+            tables.append(
+                table(
+                    "owned_games",
+                    "dim_games",
+                    dim_games_columns,
+                    DIM_GAMES_CONSTANTS,
+                    dim_game_record,
+                    self.insert_games,
                 )
-
-        if sessions_data:
-            self.client.execute(
-                """
-                INSERT INTO fact_gaming_sessions (
-                    session_sk, player_sk, game_sk, date_sk, session_start,
-                    session_end, session_duration_minutes, playtime_total_minutes,
-                    achievements_unlocked, is_first_play, device_type
-                ) VALUES
-            """,
-                sessions_data,
             )
+        if "sessions" in dataframes:
+            tables.append(
+                table(
+                    "sessions",
+                    "fact_gaming_sessions",
+                    fact_sessions_columns,
+                    FACT_SESSIONS_CONSTANTS,
+                    session_record,
+                    self.insert_sessions,
+                )
+            )
+        return tables
 
-    def close(self):
-        """Close ClickHouse connection"""
+    def reset(self) -> None:
+        """Drop the connection after a failed batch; the client reconnects on its next query"""
         self.client.disconnect()
 
-
-def write_to_databases(dataframes: dict[str, DataFrame], config: Config, steam_id: str) -> None:
-    """Write Steam data to both PostgreSQL and ClickHouse"""
-
-    # Write to PostgreSQL (operational data)
-    pg_writer = PostgreSQLWriter(config)
-    try:
-        if "player_summary" in dataframes:
-            pg_writer.write_player_data(dataframes["player_summary"])
-
-        if "owned_games" in dataframes:
-            pg_writer.write_games_data(dataframes["owned_games"])
-
-    finally:
-        pg_writer.close()
-
-    # Write to ClickHouse (analytics data)
-    ch_writer = ClickHouseWriter(config)
-    try:
-        if "player_summary" in dataframes:
-            ch_writer.write_player_data(dataframes["player_summary"], steam_id)
-
-        if "owned_games" in dataframes:
-            ch_writer.write_games_data(dataframes["owned_games"])
-            ch_writer.write_gaming_sessions(dataframes["owned_games"], steam_id)
-
-    finally:
-        ch_writer.close()
+    def close(self):
+        """Close ClickHouse connection, or return it to its pool"""
+        if self.pool is not None:
+            self.pool.release(self.client)
+        else:
+            self.client.disconnect()
+
+
+def write_to_databases(
+    dataframes: dict[str, DataFrame],
+    config: Config,
+    metrics: PipelineMetrics | None = None,
+) -> None:
+    """Write Steam data to PostgreSQL and ClickHouse concurrently, each store timed as a stage
+
+    Both stores load at the same time through ``sink_fanout``, so the write
+    phase takes about as long as the slower one. A store that fails does not
+    stop the other; the failure is raised once both have finished.
+    """
+    metrics = metrics or PipelineMetrics()
+    writer_config = config.get_writer_config()
+    options = {
+        "queue_depth": int(writer_config["queue_depth"]),
+        "max_attempts": int(writer_config["max_attempts"]),
+        "retry_backoff": float(writer_config["retry_backoff"]),
+    }
+
+    fan_out(
+        [
+            # PostgreSQL (operational data)
+            SinkRunner(
+                "postgres",
+                lambda: PostgreSQLWriter(config, pool=postgres_pool(config)),
+                lambda writer: writer.sink_tables(dataframes),
+                **options,
+            ),
+            # ClickHouse (analytics data)
+            SinkRunner(
+                "clickhouse",
+                lambda: ClickHouseWriter(config, pool=clickhouse_pool(config)),
+                lambda writer: writer.sink_tables(dataframes),
+                **options,
+            ),
+        ],
+        metrics,
+    )
 
     print("✅ Successfully wrote data to both PostgreSQL and ClickHouse!")
@@ -0,0 +1,246 @@
+"""Item-item game similarity from player playtime, loaded into game_similarity_features
+
+Every game becomes a sparse vector over players holding log playtime. Candidate
+pairs come from MinHash LSH over the games' player sets, so only games sharing
+a hash bucket are ever compared instead of all pairs. Each candidate gets its
+exact cosine and Jaccard similarity, common player count, playtime correlation
+and genre overlap, and the top K neighbours of every game are bulk-loaded into
+ClickHouse with one ``calculated_at`` per run; readers take the latest run.
+
+Usage: python spark_jobs/src/game_similarity.py [--top-k N] [--metric cosine|jaccard]
+"""
+
+import argparse
+from datetime import datetime
+from typing import Any
+
+import numpy as np
+import pandas as pd
+from base import get_spark_session
+from config import Config
+from connection_pool import clickhouse_pool
+from database_writers import ClickHouseWriter
+from pyspark.ml.feature import MinHashLSH
+from pyspark.ml.linalg import SparseVector, Vectors, VectorUDT
+from pyspark.sql import DataFrame, SparkSession, Window
+from pyspark.sql import functions as F
+from pyspark.sql.types import DoubleType, IntegerType, StructField, StructType
+
+# Aggregated in ClickHouse so only one row per player and game reaches Spark
+PLAYTIME_QUERY = """
+    SELECT player_sk, game_sk, toFloat64(sum(session_duration_minutes)) AS playtime_minutes
+    FROM fact_gaming_sessions FINAL
+    GROUP BY player_sk, game_sk
+    HAVING playtime_minutes > 0
+"""
+PLAYTIME_SCHEMA = "player_sk long, game_sk long, playtime_minutes double"
+
+GENRES_QUERY = """
+    SELECT game_sk, groupUniqArray(category_name) AS genres
+    FROM dim_game_categories
+    WHERE category_type = 'genre'
+    GROUP BY game_sk
+"""
+GENRES_SCHEMA = "game_sk long, genres array<string>"
+
+PAIR_STATS_SCHEMA = StructType(
+    [
+        StructField("cosine", DoubleType()),
+        StructField("common_players", IntegerType()),
+        StructField("playtime_correlation", DoubleType()),
+    ]
+)
+
+
+def clickhouse_frame(
+    spark: SparkSession,
+    client,
+    query: str,
+    schema: str,
+    unsigned: tuple[str, ...] = (),
+    **execute_options: Any,
+) -> DataFrame:
+    """Run ``query`` in ClickHouse and load the result into Spark
+
+    UInt64 surrogate keys named in ``unsigned`` become signed longs, the form the
+    Spark side of the pipeline uses (see ``surrogate_keys``). ``execute_options``
+    (params, external_tables, settings) are passed to ``client.execute``.
+    """
+    columns, types = client.execute(query, columnar=True, with_column_types=True, **execute_options)
+    names = [name for name, _ in types]
+    pdf = pd.DataFrame(dict(zip(names, columns or [[] for _ in names])), columns=names)
+    for name in unsigned:
+        pdf[name] = pdf[name].to_numpy(dtype="uint64").view("int64")
+    return spark.createDataFrame(pdf, schema)
+
+
+def game_vectors(playtime: DataFrame, min_players: int = 2) -> DataFrame:
+    """One row per game with at least ``min_players`` players: game_sk, players, player_count
+
+    Players get dense indexes from ``zipWithIndex``, so vectors are as wide as the
+    number of distinct players and carry log1p(playtime minutes) as values.
+    """
+    players = (
+        playtime.select("player_sk")
+        .distinct()
+        .rdd.map(lambda row: row.player_sk)
+        .zipWithIndex()
+        .toDF(["player_sk", "player_index"])
+    )
+    size = players.count()
+
+    @F.udf(VectorUDT())
+    def to_vector(entries):
+        return Vectors.sparse(size, [e.player_index for e in entries], [e.weight for e in entries])
+
+    entry = F.struct("player_index", F.log1p("playtime_minutes").alias("weight"))
+    return (
+        playtime.join(players, "player_sk")
+        .groupBy("game_sk")
+        .agg(F.sort_array(F.collect_list(entry)).alias("entries"))
+        .where(F.size("entries") >= min_players)
+        .select(
+            "game_sk",
+            to_vector("entries").alias("players"),
+            F.size("entries").alias("player_count"),
+        )
+    )
+
+
+@F.udf(PAIR_STATS_SCHEMA)
+def pair_stats(a: SparseVector, b: SparseVector) -> tuple:
+    """Cosine of the playtime vectors, shared players and playtime correlation over them"""
+    _, in_a, in_b = np.intersect1d(a.indices, b.indices, assume_unique=True, return_indices=True)
+    x, y = a.values[in_a], b.values[in_b]
+    cosine = float(x @ y / (np.linalg.norm(a.values) * np.linalg.norm(b.values)))
+    correlation = 0.0
+    if len(in_a) > 2 and x.std() > 0 and y.std() > 0:
+        correlation = float(np.corrcoef(x, y)[0, 1])
+    return cosine, len(in_a), correlation
+
+
+def candidate_pairs(
+    vectors: DataFrame, hash_tables: int = 5, max_distance: float = 0.9, seed: int = 42
+) -> DataFrame:
+    """Ordered game pairs whose player sets collide in an LSH bucket, with exact Jaccard
+
+    ``max_distance`` is the largest Jaccard distance kept; both (a, b) and (b, a)
+    are returned so every game gets its own neighbour list.
+    """
+    model = MinHashLSH(
+        inputCol="players", outputCol="hashes", numHashTables=hash_tables, seed=seed
+    ).fit(vectors)
+    hashed = model.transform(vectors)
+    pairs = model.approxSimilarityJoin(hashed, hashed, max_distance, distCol="jaccard_distance")
+    return pairs.where(F.col("datasetA.game_sk") != F.col("datasetB.game_sk")).select(
+        F.col("datasetA.game_sk").alias("game_sk_1"),
+        F.col("datasetB.game_sk").alias("game_sk_2"),
+        pair_stats("datasetA.players", "datasetB.players").alias("stats"),
+        (1 - F.col("jaccard_distance")).alias("jaccard"),
+    )
+
+
+def genre_overlap(pairs: DataFrame, genres: DataFrame) -> DataFrame:
+    """Add genre_overlap_score, the Jaccard index of both games' genres (0 when unknown)"""
+    no_genres = F.array().cast("array<string>")
+    for side in ("1", "2"):
+        pairs = pairs.join(
+            genres.select(
+                F.col("game_sk").alias(f"game_sk_{side}"), F.col("genres").alias(f"genres_{side}")
+            ),
+            f"game_sk_{side}",
+            "left",
+        ).withColumn(f"genres_{side}", F.coalesce(f"genres_{side}", no_genres))
+    overlap = F.size(F.array_intersect("genres_1", "genres_2")) / F.size(
+        F.array_union("genres_1", "genres_2")
+    )
+    return pairs.withColumn("genre_overlap_score", F.coalesce(overlap, F.lit(0.0))).drop(
+        "genres_1", "genres_2"
+    )
+
+
+def compute_similarity(
+    playtime: DataFrame,
+    genres: DataFrame | None = None,
+    top_k: int = 20,
+    metric: str = "cosine",
+    hash_tables: int = 5,
+    max_distance: float = 0.9,
+    min_players: int = 2,
+) -> DataFrame:
+    """Top ``top_k`` neighbours per game, ranked by ``metric`` ("cosine" or "jaccard")
+
+    ``playtime`` has player_sk, game_sk and playtime_minutes; the result has the
+    game_similarity_features columns except calculated_at.
+    """
+    pairs = candidate_pairs(game_vectors(playtime, min_players), hash_tables, max_distance)
+    score = F.col("stats.cosine") if metric == "cosine" else F.col("jaccard")
+    pairs = pairs.select(
+        "game_sk_1",
+        "game_sk_2",
+        score.alias("similarity_score"),
+        F.col("stats.common_players").alias("common_players"),
+        F.col("stats.playtime_correlation").alias("playtime_correlation"),
+    )
+    if genres is not None:
+        pairs = genre_overlap(pairs, genres)
+    else:
+        pairs = pairs.withColumn("genre_overlap_score", F.lit(0.0))
+
+    window = Window.partitionBy("game_sk_1").orderBy(F.desc("similarity_score"), "game_sk_2")
+    return (
+        pairs.withColumn("rank", F.row_number().over(window))
+        .where(F.col("rank") <= top_k)
+        .select(
+            "game_sk_1",
+            "game_sk_2",
+            "similarity_score",
+            "common_players",
+            "genre_overlap_score",
+            "playtime_correlation",
+        )
+    )
+
+
+def main() -> None:
+    config = Config()
+    similarity_config = config.get_similarity_config()
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--top-k", type=int, default=int(similarity_config["top_k"]))
+    parser.add_argument(
+        "--metric", choices=("cosine", "jaccard"), default=similarity_config["metric"]
+    )
+    parser.add_argument("--hash-tables", type=int, default=int(similarity_config["hash_tables"]))
+    parser.add_argument(
+        "--max-distance", type=float, default=float(similarity_config["max_distance"])
+    )
+    parser.add_argument("--min-players", type=int, default=int(similarity_config["min_players"]))
+    args = parser.parse_args()
+
+    spark = get_spark_session("joyst-game-similarity", config)
+    writer = ClickHouseWriter(config, pool=clickhouse_pool(config))
+    try:
+        print("Loading player playtime from ClickHouse...")
+        playtime = clickhouse_frame(
+            spark, writer.client, PLAYTIME_QUERY, PLAYTIME_SCHEMA, ("player_sk", "game_sk")
+        )
+        genres = clickhouse_frame(spark, writer.client, GENRES_QUERY, GENRES_SCHEMA, ("game_sk",))
+
+        similarity = compute_similarity(
+            playtime,
+            genres,
+            top_k=args.top_k,
+            metric=args.metric,
+            hash_tables=args.hash_tables,
+            max_distance=args.max_distance,
+            min_players=args.min_players,
+        )
+        rows = writer.write_game_similarity(similarity, datetime.now().replace(microsecond=0))
+        print(f"✅ Wrote {rows} similar-game pairs to game_similarity_features")
+    finally:
+        writer.close()
+        spark.stop()
+
+
+if __name__ == "__main__":
+    main()
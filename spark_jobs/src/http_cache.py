@@ -0,0 +1,166 @@
+"""Persistent on-disk cache for Steam Web API responses"""
+
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+import zlib
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any
+
+# Seconds a cached response stays fresh, per Steam endpoint
+DEFAULT_TTLS = {
+    "GetPlayerSummaries": 6 * 3600,
+    "GetOwnedGames": 24 * 3600,
+    "GetRecentlyPlayedGames": 15 * 60,
+    "GetPlayerAchievements": 7 * 24 * 3600,
+    "GetUserStatsForGame": 24 * 3600,
+}
+DEFAULT_TTL = 3600
+
+# Request parameters that never take part in the cache key
+_IGNORED_PARAMS = {"key"}
+
+
+@dataclass
+class CacheEntry:
+    payload: dict[str, Any]
+    etag: str | None
+    fresh: bool
+
+
+class ResponseCache:
+    """SQLite-backed response cache with per-endpoint TTLs and LRU size bound
+
+    Entries are keyed by endpoint and request parameters (the API key is left
+    out) and stored as compressed JSON. Expired entries are kept so they can be
+    revalidated with their ETag; once the cache outgrows ``max_bytes`` the
+    least recently used entries are evicted.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        max_bytes: int = 512 * 1024 * 1024,
+        ttls: dict[str, float] | None = None,
+    ):
+        Path(path).mkdir(parents=True, exist_ok=True)
+        self.max_bytes = max_bytes
+        self.ttls = {**DEFAULT_TTLS, **(ttls or {})}
+        self.hits = 0
+        self.misses = 0
+        self.revalidations = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(
+            str(Path(path) / "responses.sqlite"), check_same_thread=False, isolation_level=None
+        )
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            """
+            CREATE TABLE IF NOT EXISTS responses (
+                cache_key TEXT PRIMARY KEY,
+                endpoint TEXT NOT NULL,
+                body BLOB NOT NULL,
+                etag TEXT,
+                size INTEGER NOT NULL,
+                stored_at REAL NOT NULL,
+                accessed_at REAL NOT NULL
+            )
+            """
+        )
+        self._db.execute(
+            "CREATE INDEX IF NOT EXISTS idx_responses_accessed_at ON responses(accessed_at)"
+        )
+        self._total_bytes = self._db.execute(
+            "SELECT COALESCE(SUM(size), 0) FROM responses"
+        ).fetchone()[0]
+
+    @staticmethod
+    def cache_key(endpoint: str, params: dict[str, Any]) -> str:
+        items = sorted((k, str(v)) for k, v in params.items() if k not in _IGNORED_PARAMS)
+        return hashlib.sha256(json.dumps([endpoint, items]).encode()).hexdigest()
+
+    def get(self, endpoint: str, params: dict[str, Any]) -> CacheEntry | None:
+        """Look up a response; stale entries are returned with ``fresh=False``"""
+        key = self.cache_key(endpoint, params)
+        now = time.time()
+        with self._lock:
+            row = self._db.execute(
+                "SELECT body, etag, stored_at FROM responses WHERE cache_key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+
+            body, etag, stored_at = row
+            fresh = now - stored_at < self.ttls.get(endpoint, DEFAULT_TTL)
+            if fresh:
+                self.hits += 1
+            else:
+                self.misses += 1
+            self._db.execute("UPDATE responses SET accessed_at = ? WHERE cache_key = ?", (now, key))
+        return CacheEntry(json.loads(zlib.decompress(body)), etag, fresh)
+
+    def put(
+        self, endpoint: str, params: dict[str, Any], payload: dict[str, Any], etag: str | None
+    ) -> None:
+        """Store a response, evicting least recently used entries if over budget"""
+        key = self.cache_key(endpoint, params)
+        body = zlib.compress(json.dumps(payload).encode())
+        now = time.time()
+        with self._lock:
+            previous = self._db.execute(
+                "SELECT size FROM responses WHERE cache_key = ?", (key,)
+            ).fetchone()
+            self._db.execute(
+                """
+                INSERT OR REPLACE INTO responses
+                    (cache_key, endpoint, body, etag, size, stored_at, accessed_at)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+                """,
+                (key, endpoint, body, etag, len(body), now, now),
+            )
+            self._total_bytes += len(body) - (previous[0] if previous else 0)
+            self._evict()
+
+    def revalidated(self, endpoint: str, params: dict[str, Any]) -> None:
+        """Mark a stale entry fresh again after a 304 Not Modified"""
+        now = time.time()
+        with self._lock:
+            self.revalidations += 1
+            self._db.execute(
+                "UPDATE responses SET stored_at = ?, accessed_at = ? WHERE cache_key = ?",
+                (now, now, self.cache_key(endpoint, params)),
+            )
+
+    def _evict(self) -> None:
+        while self._total_bytes > self.max_bytes:
+            rows = self._db.execute(
+                "SELECT cache_key, size FROM responses ORDER BY accessed_at LIMIT 64"
+            ).fetchall()
+            if not rows:
+                self._total_bytes = 0
+                return
+            for key, size in rows:
+                if self._total_bytes <= self.max_bytes:
+                    break
+                self._db.execute("DELETE FROM responses WHERE cache_key = ?", (key,))
+                self._total_bytes -= size
+                self.evictions += 1
+
+    def stats(self) -> dict[str, int]:
+        """Hit/miss counters and current size"""
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "revalidations": self.revalidations,
+                "evictions": self.evictions,
+                "size_bytes": self._total_bytes,
+            }
+
+    def close(self) -> None:
+        self._db.close()
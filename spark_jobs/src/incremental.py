@@ -0,0 +1,241 @@
+"""Incremental ingestion: per-account watermarks and owned-games deltas
+
+Each account's last ingested state is kept in the ``steam_account_watermarks``
+PostgreSQL table: a fingerprint and compact snapshot of its owned games,
+its recently-played playtimes and a fingerprint of its profile. A run compares
+the freshly fetched payload against these watermarks and keeps only what
+changed, so unchanged accounts cost no writes at all.
+"""
+
+import hashlib
+import json
+from datetime import datetime
+from typing import Any
+
+from config import Config
+from connection_pool import postgres_pool
+from psycopg2.extras import Json, execute_values
+
+# Profile fields whose change triggers a player rewrite (personastate flips constantly)
+PLAYER_FINGERPRINT_FIELDS = ("personaname", "profileurl", "avatar", "communityvisibilitystate")
+
+
+def _fingerprint(value: Any) -> str:
+    return hashlib.sha256(json.dumps(value, sort_keys=True).encode()).hexdigest()
+
+
+def owned_games_snapshot(games: list[dict[str, Any]]) -> dict[str, list[int]]:
+    """appid -> [playtime_forever, playtime_2weeks, rtime_last_played]"""
+    return {
+        str(game["appid"]): [
+            game.get("playtime_forever") or 0,
+            game.get("playtime_2weeks") or 0,
+            game.get("rtime_last_played") or 0,
+        ]
+        for game in games
+    }
+
+
+def player_fingerprint(player: dict[str, Any]) -> str:
+    return _fingerprint({field: player.get(field) for field in PLAYER_FINGERPRINT_FIELDS})
+
+
+def _group_by_steamid(rows: list[dict[str, Any]]) -> dict[str, list[dict[str, Any]]]:
+    grouped: dict[str, list[dict[str, Any]]] = {}
+    for row in rows:
+        grouped.setdefault(row["steamid"], []).append(row)
+    return grouped
+
+
+def payload_steam_ids(steam_data: dict[str, Any]) -> list[str]:
+    """Accounts present in a payload"""
+    players = steam_data.get("player_summary", {}).get("response", {}).get("players", [])
+    games = steam_data.get("owned_games", {}).get("response", {}).get("games", [])
+    recent = steam_data.get("recently_played", {}).get("response", {}).get("games", [])
+    return sorted({row["steamid"] for row in [*players, *games, *recent]})
+
+
+def drop_accounts(steam_data: dict[str, Any], steam_ids: set[str]) -> dict[str, Any]:
+    """Payload without the rows of ``steam_ids``, e.g. accounts whose fetch failed"""
+    if not steam_ids:
+        return steam_data
+    sections = {"player_summary": "players", "owned_games": "games", "recently_played": "games"}
+    dropped = dict(steam_data)
+    for section, key in sections.items():
+        rows = steam_data.get(section, {}).get("response", {}).get(key)
+        if rows is not None:
+            kept = [row for row in rows if row["steamid"] not in steam_ids]
+            dropped[section] = {"response": {key: kept}}
+    return dropped
+
+
+def compute_deltas(
+    steam_data: dict[str, Any],
+    watermarks: dict[str, dict[str, Any]],
+    extracted_at: datetime,
+) -> tuple[dict[str, Any], dict[str, dict[str, Any]], dict[str, int]]:
+    """Reduce a fetched payload to what changed since each account's watermark
+
+    Returns the delta payload (same shape as ``fetch_steam_data``), the new
+    watermarks to store once the delta is written, and change counters. An
+    owned game is kept when it is new or its ``playtime_forever`` changed; a
+    recently-played entry when its ``playtime_2weeks`` changed; a player when it
+    has no watermark yet or its profile fingerprint changed. Accounts seen for
+    the first time without owned games get no watermark.
+    """
+    players = steam_data.get("player_summary", {}).get("response", {}).get("players", [])
+    owned = _group_by_steamid(
+        steam_data.get("owned_games", {}).get("response", {}).get("games", [])
+    )
+    recent = _group_by_steamid(
+        steam_data.get("recently_played", {}).get("response", {}).get("games", [])
+    )
+    players_by_id = {player["steamid"]: player for player in players}
+
+    delta_players: list[dict[str, Any]] = []
+    delta_owned: list[dict[str, Any]] = []
+    delta_recent: list[dict[str, Any]] = []
+    new_watermarks: dict[str, dict[str, Any]] = {}
+    stats = {"accounts_unchanged": 0, "new_games": 0, "changed_games": 0, "recent_entries": 0}
+
+    for steam_id in set(players_by_id) | set(owned) | set(recent):
+        previous = watermarks.get(steam_id)
+        games = owned.get(steam_id, [])
+        snapshot = owned_games_snapshot(games)
+        fingerprint = _fingerprint(sorted((appid, values[0]) for appid, values in snapshot.items()))
+        recent_snapshot = {
+            str(game["appid"]): game.get("playtime_2weeks") or 0
+            for game in recent.get(steam_id, [])
+        }
+        player = players_by_id.get(steam_id)
+        profile = player_fingerprint(player) if player else None
+
+        if previous is None:
+            # First sight of this account: everything is new
+            delta_players.extend([player] if player else [])
+            delta_owned.extend(games)
+            delta_recent.extend(recent.get(steam_id, []))
+            stats["new_games"] += len(games)
+            stats["recent_entries"] += len(recent.get(steam_id, []))
+        else:
+            if player and profile != previous["player_fingerprint"]:
+                delta_players.append(player)
+
+            if fingerprint != previous["owned_games_fingerprint"]:
+                old = previous["owned_games_snapshot"]
+                for game in games:
+                    appid = str(game["appid"])
+                    if appid not in old:
+                        delta_owned.append(game)
+                        stats["new_games"] += 1
+                    elif old[appid][0] != snapshot[appid][0]:
+                        delta_owned.append(game)
+                        stats["changed_games"] += 1
+
+            old_recent = previous["recently_played_snapshot"]
+            for game in recent.get(steam_id, []):
+                if old_recent.get(str(game["appid"])) != recent_snapshot[str(game["appid"])]:
+                    delta_recent.append(game)
+                    stats["recent_entries"] += 1
+
+            if (
+                fingerprint == previous["owned_games_fingerprint"]
+                and recent_snapshot == old_recent
+                and (player is None or profile == previous["player_fingerprint"])
+            ):
+                stats["accounts_unchanged"] += 1
+
+        if previous is None and not games:
+            # Private profile or failed fetch on first sight: the owned games are unknown,
+            # and an empty snapshot would make every game look new and unplayed next run
+            continue
+        if previous is not None and not games:
+            # Owned games failed to fetch or the profile went private: keep the old state
+            snapshot = previous["owned_games_snapshot"]
+            fingerprint = previous["owned_games_fingerprint"]
+        if previous is not None and profile is None:
+            profile = previous["player_fingerprint"]
+
+        new_watermarks[steam_id] = {
+            "owned_games_fingerprint": fingerprint,
+            "owned_games_snapshot": snapshot,
+            "recently_played_snapshot": recent_snapshot,
+            "player_fingerprint": profile,
+            "extracted_at": extracted_at,
+        }
+
+    delta = {
+        **steam_data,
+        "player_summary": {"response": {"players": delta_players}},
+        "owned_games": {"response": {"games": delta_owned}},
+        "recently_played": {"response": {"games": delta_recent}},
+    }
+    return delta, new_watermarks, stats
+
+
+class WatermarkStore:
+    """Read and write per-account watermarks in PostgreSQL"""
+
+    def __init__(self, config: Config):
+        self.pool = postgres_pool(config)
+        self.connection = self.pool.acquire()
+
+    def load(self, steam_ids: list[str]) -> dict[str, dict[str, Any]]:
+        """Watermarks of the given accounts, fetched in one query"""
+        with self.connection.cursor() as cursor:
+            cursor.execute(
+                """
+                SELECT steamid, owned_games_fingerprint, owned_games_snapshot,
+                       recently_played_snapshot, player_fingerprint, extracted_at
+                FROM steam_account_watermarks
+                WHERE steamid = ANY(%s)
+                """,
+                (list(steam_ids),),
+            )
+            return {
+                row[0]: {
+                    "owned_games_fingerprint": row[1],
+                    "owned_games_snapshot": row[2],
+                    "recently_played_snapshot": row[3],
+                    "player_fingerprint": row[4],
+                    "extracted_at": row[5],
+                }
+                for row in cursor.fetchall()
+            }
+
+    def save(self, watermarks: dict[str, dict[str, Any]]) -> None:
+        """Upsert watermarks in one statement; call only after the delta is written"""
+        if not watermarks:
+            return
+        with self.connection.cursor() as cursor:
+            execute_values(
+                cursor,
+                """
+                INSERT INTO steam_account_watermarks (
+                    steamid, owned_games_fingerprint, owned_games_snapshot,
+                    recently_played_snapshot, player_fingerprint, extracted_at
+                ) VALUES %s
+                ON CONFLICT (steamid) DO UPDATE SET
+                    owned_games_fingerprint = EXCLUDED.owned_games_fingerprint,
+                    owned_games_snapshot = EXCLUDED.owned_games_snapshot,
+                    recently_played_snapshot = EXCLUDED.recently_played_snapshot,
+                    player_fingerprint = EXCLUDED.player_fingerprint,
+                    extracted_at = EXCLUDED.extracted_at,
+                    updated_at = CURRENT_TIMESTAMP
+                """,
+                [
+                    (
+                        steam_id,
+                        w["owned_games_fingerprint"],
+                        Json(w["owned_games_snapshot"]),
+                        Json(w["recently_played_snapshot"]),
+                        w["player_fingerprint"],
+                        w["extracted_at"],
+                    )
+                    for steam_id, w in watermarks.items()
+                ],
+            )
+
+    def close(self) -> None:
+        """Return the connection to the pool"""
+        self.pool.release(self.connection)
@@ -0,0 +1,155 @@
+"""Per-stage pipeline metrics: wall time, rows, bytes, HTTP requests and retries
+
+Stages are timed with ``PipelineMetrics.stage``. Each finished stage is logged
+as one JSON line; a whole run can be written as a Prometheus textfile (for the
+node_exporter textfile collector) and inserted into the ClickHouse
+``pipeline_runs`` table for trend dashboards.
+"""
+
+import json
+import os
+import threading
+import time
+import uuid
+from collections.abc import Iterator
+from contextlib import contextmanager
+from dataclasses import asdict, dataclass
+from datetime import datetime
+from pathlib import Path
+from typing import Any
+
+
+class HttpStats:
+    """Process-wide Steam API counters, shared by every client thread"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counts = {"requests": 0, "retries": 0, "bytes": 0}
+
+    def record(self, requests: int = 0, retries: int = 0, bytes: int = 0) -> None:
+        with self._lock:
+            self._counts["requests"] += requests
+            self._counts["retries"] += retries
+            self._counts["bytes"] += bytes
+
+    def snapshot(self) -> dict[str, int]:
+        with self._lock:
+            return dict(self._counts)
+
+
+HTTP_STATS = HttpStats()
+
+
+@dataclass
+class StageMetrics:
+    """Measurements of one pipeline stage; callers fill in rows and bytes"""
+
+    stage: str
+    started_at: datetime
+    seconds: float = 0.0
+    rows: int | None = None
+    bytes: int | None = None
+    http_requests: int = 0
+    http_retries: int = 0
+    status: str = "ok"
+
+    @property
+    def rows_per_second(self) -> float | None:
+        if self.rows is None or self.seconds <= 0:
+            return None
+        return self.rows / self.seconds
+
+    def as_dict(self) -> dict[str, Any]:
+        record = asdict(self)
+        record["started_at"] = self.started_at.isoformat(timespec="seconds")
+        record["seconds"] = round(self.seconds, 4)
+        record["rows_per_second"] = (
+            round(self.rows_per_second, 1) if self.rows_per_second is not None else None
+        )
+        return record
+
+
+class PipelineMetrics:
+    """Collects the stages of one pipeline run"""
+
+    def __init__(self, job: str = "steam-account-processor", run_id: str | None = None):
+        self.job = job
+        self.run_id = run_id or uuid.uuid4().hex
+        self.stages: list[StageMetrics] = []
+
+    @contextmanager
+    def stage(self, name: str) -> Iterator[StageMetrics]:
+        """Time a block; HTTP requests, retries and bytes made inside it are attributed to it"""
+        http_before = HTTP_STATS.snapshot()
+        record = StageMetrics(name, datetime.now())
+        start = time.perf_counter()
+        try:
+            yield record
+        except BaseException:
+            record.status = "error"
+            raise
+        finally:
+            record.seconds = time.perf_counter() - start
+            http = {k: v - http_before[k] for k, v in HTTP_STATS.snapshot().items()}
+            record.http_requests = http["requests"]
+            record.http_retries = http["retries"]
+            if record.bytes is None and http["bytes"]:
+                record.bytes = http["bytes"]
+            self.stages.append(record)
+            print(
+                json.dumps(
+                    {"event": "pipeline_stage", "job": self.job, "run_id": self.run_id}
+                    | record.as_dict()
+                )
+            )
+
+    def to_prometheus(self) -> str:
+        """The run's stages in Prometheus text exposition format"""
+        series = {
+            "seconds": ("joyst_pipeline_stage_duration_seconds", "Stage wall time"),
+            "rows": ("joyst_pipeline_stage_rows", "Rows processed by the stage"),
+            "bytes": ("joyst_pipeline_stage_bytes", "Bytes transferred by the stage"),
+            "http_retries": ("joyst_pipeline_stage_http_retries", "Steam API retries"),
+            "rows_per_second": ("joyst_pipeline_stage_rows_per_second", "Stage throughput"),
+        }
+        lines = []
+        for field, (metric, help_text) in series.items():
+            lines += [f"# HELP {metric} {help_text}", f"# TYPE {metric} gauge"]
+            for record in self.stages:
+                value = getattr(record, field)
+                if value is not None:
+                    labels = f'job="{self.job}",stage="{record.stage}",status="{record.status}"'
+                    lines.append(f"{metric}{{{labels}}} {value}")
+        lines += [
+            "# HELP joyst_pipeline_last_run_timestamp_seconds End of the last run",
+            "# TYPE joyst_pipeline_last_run_timestamp_seconds gauge",
+            f'joyst_pipeline_last_run_timestamp_seconds{{job="{self.job}"}} {time.time():.0f}',
+        ]
+        return "\n".join(lines) + "\n"
+
+    def write_prometheus(self, path: str) -> None:
+        """Write the textfile atomically so a collector never reads it half-written"""
+        target = Path(path)
+        target.parent.mkdir(parents=True, exist_ok=True)
+        tmp = target.with_suffix(f"{target.suffix}.{os.getpid()}.tmp")
+        tmp.write_text(self.to_prometheus())
+        tmp.replace(target)
+
+    def pipeline_run_records(self) -> list[list]:
+        """Rows for the ClickHouse ``pipeline_runs`` table"""
+        return [
+            [
+                self.run_id,
+                self.job,
+                record.stage,
+                record.started_at,
+                record.seconds,
+                record.rows or 0,
+                record.bytes or 0,
+                record.http_requests,
+                record.http_retries,
+                record.rows_per_second or 0.0,
+                record.status,
+            ]
+            for record in self.stages
+        ]
@@ -0,0 +1,179 @@
+"""Partition-parallel database writes: every executor writes its own partitions
+
+Instead of streaming rows to the driver, each DataFrame is repartitioned and
+written with ``foreachPartition``. Executors keep one PostgreSQL and one
+ClickHouse writer per Python worker, reused across the tasks that worker runs,
+and write their partitions with the same batched paths as the driver writers.
+
+Connection settings are resolved on the driver and shipped to the executors as
+plain dicts, since variables exported only on the driver are not set there.
+Spark ends Python workers with ``os._exit``, which skips ``atexit`` hooks, so a
+worker's connections are not closed explicitly: they stay open while the worker
+lives and are dropped with its process. A writer whose task fails is closed and
+replaced, as its connection may be mid-transaction.
+"""
+
+from collections.abc import Callable, Iterator
+from functools import partial
+from typing import Any
+
+from config import Config
+from database_writers import (
+    ClickHouseWriter,
+    PostgreSQLWriter,
+    dim_game_record,
+    dim_player_record,
+    game_record,
+    owned_game_record,
+    player_record,
+    session_record,
+)
+from metrics import PipelineMetrics, StageMetrics
+from pyspark import Accumulator
+from pyspark.sql import DataFrame
+
+# Writers opened on this executor's Python worker, keyed by sink and connection settings
+_EXECUTOR_WRITERS: dict[tuple, Any] = {}
+
+_WRITER_CLASSES = {"postgres": PostgreSQLWriter, "clickhouse": ClickHouseWriter}
+
+
+class ConnectionSettings:
+    """The PostgreSQL and ClickHouse settings of a Config, resolved on the driver
+
+    Stands in for Config in the executor-side writers, which only read these two.
+    """
+
+    def __init__(self, config: Config):
+        self.postgres = config.get_postgres_config()
+        self.clickhouse = config.get_clickhouse_config()
+
+    def get_postgres_config(self) -> dict[str, Any]:
+        return dict(self.postgres)
+
+    def get_clickhouse_config(self) -> dict[str, Any]:
+        return dict(self.clickhouse)
+
+
+def _writer_key(sink: str, settings: ConnectionSettings) -> tuple:
+    connection = settings.postgres if sink == "postgres" else settings.clickhouse
+    return (sink, tuple(sorted(connection.items())))
+
+
+def _executor_writer(sink: str, settings: ConnectionSettings) -> Any:
+    """Return this worker's writer for ``sink``, opening it on first use"""
+    key = _writer_key(sink, settings)
+    if key not in _EXECUTOR_WRITERS:
+        _EXECUTOR_WRITERS[key] = _WRITER_CLASSES[sink](settings)
+    return _EXECUTOR_WRITERS[key]
+
+
+def _write_partition(
+    sink: str,
+    method: str,
+    to_record: Callable[[Any], Any],
+    settings: ConnectionSettings,
+    rows_written: Accumulator,
+    bytes_sent: Accumulator,
+    rows: Iterator,
+) -> None:
+    writer = _executor_writer(sink, settings)
+    bytes_before = getattr(writer, "bytes_sent", 0)
+    try:
+        rows_written.add(getattr(writer, method)(to_record(row) for row in rows))
+    except BaseException:
+        _EXECUTOR_WRITERS.pop(_writer_key(sink, settings), None)
+        writer.close()
+        raise
+    bytes_sent.add(getattr(writer, "bytes_sent", 0) - bytes_before)
+
+
+def write_partitioned(
+    df: DataFrame,
+    sink: str,
+    method: str,
+    to_record: Callable[[Any], Any],
+    config: Config | ConnectionSettings,
+    parallelism: int,
+    key: str | None = None,
+) -> tuple[int, int]:
+    """Write ``df`` from the executors through ``writer.method(records)``
+
+    Rows are spread over ``parallelism`` partitions, hashed on ``key`` when given
+    so concurrent upserts of the same key never land in different transactions.
+    Returns the rows written and bytes sent, summed over the executors.
+    """
+    context = df.sparkSession.sparkContext
+    rows_written, bytes_sent = context.accumulator(0), context.accumulator(0)
+    settings = config if isinstance(config, ConnectionSettings) else ConnectionSettings(config)
+    partitioned = df.repartition(parallelism, key) if key else df.repartition(parallelism)
+    partitioned.foreachPartition(
+        partial(_write_partition, sink, method, to_record, settings, rows_written, bytes_sent)
+    )
+    return rows_written.value, bytes_sent.value
+
+
+def write_to_databases_partitioned(
+    dataframes: dict[str, DataFrame],
+    config: Config,
+    parallelism: int,
+    metrics: PipelineMetrics | None = None,
+) -> None:
+    """Write Steam data to PostgreSQL and ClickHouse from the executors"""
+    metrics = metrics or PipelineMetrics()
+    write = partial(write_partitioned, config=ConnectionSettings(config), parallelism=parallelism)
+
+    def run(stage: StageMetrics, *args: Any, **kwargs: Any) -> None:
+        rows, sent = write(*args, **kwargs)
+        stage.rows = (stage.rows or 0) + rows
+        stage.bytes = (stage.bytes or 0) + sent
+
+    # PostgreSQL: players and games must exist before owned games resolve their ids
+    print(f"Writing to PostgreSQL from {parallelism} partitions...")
+    with metrics.stage("postgres") as stage:
+        if "player_summary" in dataframes:
+            run(
+                stage,
+                dataframes["player_summary"],
+                "postgres",
+                "upsert_players",
+                player_record,
+                key="steamid",
+            )
+        for name in ("owned_games", "recently_played"):
+            if name in dataframes:
+                run(stage, dataframes[name], "postgres", "upsert_games", game_record, key="appid")
+        if "owned_games" in dataframes:
+            run(
+                stage,
+                dataframes["owned_games"],
+                "postgres",
+                "upsert_owned_games",
+                owned_game_record,
+                key="steamid",
+            )
+        if "recently_played" in dataframes:
+            run(
+                stage,
+                dataframes["recently_played"],
+                "postgres",
+                "insert_recently_played",
+                owned_game_record,
+            )
+
+    print(f"Writing to ClickHouse from {parallelism} partitions...")
+    with metrics.stage("clickhouse") as stage:
+        if "player_summary" in dataframes:
+            run(
+                stage,
+                dataframes["player_summary"],
+                "clickhouse",
+                "insert_players",
+                dim_player_record,
+            )
+        if "owned_games" in dataframes:
+            run(stage, dataframes["owned_games"], "clickhouse", "insert_games", dim_game_record)
+        if "sessions" in dataframes:
+            run(stage, dataframes["sessions"], "clickhouse", "insert_sessions", session_record)
+
+    print("✅ Successfully wrote data to both PostgreSQL and ClickHouse!")
@@ -0,0 +1,218 @@
+"""player_behavior_features from gaming sessions, recomputed only for touched players
+
+ClickHouse does the heavy, set-based part: sessions of the requested players
+are aggregated to one row per player, game and day, with the weekend flag from
+``dim_time`` (or the session date when the calendar does not cover it). Spark
+turns those rows into one feature row per player with grouped aggregates,
+a window ranking genres by playtime and a pandas UDF for genre diversity, and
+the rows are bulk-loaded into the ReplacingMergeTree keyed by
+(player_sk, feature_date), so a rerun on the same day replaces its rows.
+
+Each pipeline run refreshes the players that got new sessions; run this module
+directly for a full recompute: python spark_jobs/src/player_features.py [--steamid ID ...]
+"""
+
+import argparse
+from datetime import date
+
+import numpy as np
+import pandas as pd
+from base import get_spark_session
+from config import Config
+from connection_pool import clickhouse_pool
+from database_writers import ClickHouseWriter
+from game_similarity import GENRES_QUERY, GENRES_SCHEMA, clickhouse_frame
+from pyspark.sql import DataFrame, SparkSession, Window
+from pyspark.sql import functions as F
+from pyspark.sql.functions import pandas_udf
+from pyspark.sql.types import DoubleType
+from surrogate_keys import player_sk
+
+DAILY_QUERY = """
+    SELECT
+        s.player_sk,
+        s.game_sk,
+        s.date_sk,
+        toFloat64(sum(s.session_duration_minutes)) AS minutes,
+        count() AS sessions,
+        countIf(s.achievements_unlocked > 0) AS achievement_sessions,
+        toUInt8(max(if(t.date_sk = 0, toDayOfWeek(toDate(s.session_start)) >= 6, t.is_weekend = 1)))
+            AS is_weekend
+    FROM fact_gaming_sessions AS s FINAL
+    LEFT JOIN dim_time t ON t.date_sk = s.date_sk
+    {where}
+    GROUP BY s.player_sk, s.game_sk, s.date_sk
+"""
+DAILY_SCHEMA = (
+    "player_sk long, game_sk long, date_sk int, minutes double, sessions long, "
+    "achievement_sessions long, is_weekend int"
+)
+
+PURCHASES_QUERY = """
+    SELECT player_sk, avg(discount_percent) / 100 AS price_sensitivity_score
+    FROM fact_game_purchases
+    WHERE purchase_method = 'Store' AND refunded = 0 {players}
+    GROUP BY player_sk
+"""
+PURCHASES_SCHEMA = "player_sk long, price_sensitivity_score double"
+
+PREFERRED_GENRES = 3
+
+
+@pandas_udf(DoubleType())
+def normalized_entropy(minutes: pd.Series) -> float:
+    """Shannon entropy of a playtime split, scaled to 0 (one genre) .. 1 (even split)"""
+    shares = minutes.to_numpy() / minutes.sum()
+    shares = shares[shares > 0]
+    if len(shares) < 2:
+        return 0.0
+    return float(-(shares * np.log(shares)).sum() / np.log(len(shares)))
+
+
+def month_number(date_sk: str) -> F.Column:
+    """Months since year 0 of a yyyyMMdd date_sk, for month spans"""
+    return F.floor(F.col(date_sk) / 10000) * 12 + F.floor(F.col(date_sk) / 100) % 100
+
+
+def player_features(
+    daily: DataFrame,
+    genres: DataFrame,
+    feature_date: date,
+    purchases: DataFrame | None = None,
+) -> DataFrame:
+    """One player_behavior_features row per player of ``daily``
+
+    ``daily`` has the DAILY_QUERY columns, ``genres`` maps game_sk to its genre
+    array and ``purchases`` optionally carries price_sensitivity_score.
+    """
+    per_day = daily.groupBy("player_sk", "date_sk").agg(
+        F.sum("minutes").alias("day_minutes"), F.max("is_weekend").alias("is_weekend")
+    )
+    days = per_day.groupBy("player_sk").agg(
+        F.avg("day_minutes").alias("avg_daily_playtime"),
+        F.avg(F.when(F.col("is_weekend") == 1, F.col("day_minutes"))).alias("weekend_avg"),
+        F.avg(F.when(F.col("is_weekend") == 0, F.col("day_minutes"))).alias("weekday_avg"),
+    )
+    sessions = daily.groupBy("player_sk").agg(
+        (F.sum("minutes") / F.sum("sessions")).alias("avg_session_duration"),
+        (F.sum("achievement_sessions") / F.sum("sessions")).alias("achievement_rate"),
+        F.countDistinct("game_sk").alias("games_played"),
+        (F.max(month_number("date_sk")) - F.min(month_number("date_sk")) + 1).alias("months"),
+    )
+
+    genre_minutes = (
+        daily.join(genres, "game_sk")
+        .select("player_sk", "minutes", F.explode("genres").alias("genre"))
+        .groupBy("player_sk", "genre")
+        .agg(F.sum("minutes").alias("minutes"))
+    )
+    rank = F.row_number().over(Window.partitionBy("player_sk").orderBy(F.desc("minutes"), "genre"))
+    preferred = (
+        genre_minutes.withColumn("rank", rank)
+        .where(F.col("rank") <= PREFERRED_GENRES)
+        .groupBy("player_sk")
+        .agg(F.sort_array(F.collect_list(F.struct("rank", "genre"))).alias("ranked"))
+        .select("player_sk", F.col("ranked.genre").alias("preferred_genres"))
+    )
+    diversity = genre_minutes.groupBy("player_sk").agg(
+        normalized_entropy("minutes").alias("genre_diversity_score")
+    )
+
+    features = (
+        days.join(sessions, "player_sk")
+        .join(preferred, "player_sk", "left")
+        .join(diversity, "player_sk", "left")
+    )
+    if purchases is not None:
+        features = features.join(purchases, "player_sk", "left")
+    else:
+        features = features.withColumn("price_sensitivity_score", F.lit(None).cast("double"))
+
+    return features.select(
+        "player_sk",
+        F.lit(feature_date).alias("feature_date"),
+        F.col("avg_daily_playtime").cast("float"),
+        F.coalesce("preferred_genres", F.array().cast("array<string>")).alias("preferred_genres"),
+        F.col("avg_session_duration").cast("float"),
+        (F.col("games_played") / F.col("months")).cast("float").alias("games_per_month"),
+        F.col("achievement_rate").cast("float"),
+        # 0 unless the player has both weekend and weekday play
+        F.coalesce(F.col("weekend_avg") / F.col("weekday_avg"), F.lit(0.0))
+        .cast("float")
+        .alias("weekend_vs_weekday_ratio"),
+        F.coalesce("genre_diversity_score", F.lit(0.0))
+        .cast("float")
+        .alias("genre_diversity_score"),
+        F.coalesce("price_sensitivity_score", F.lit(0.0))
+        .cast("float")
+        .alias("price_sensitivity_score"),
+    )
+
+
+def refresh_player_features(
+    spark: SparkSession,
+    config: Config,
+    steam_ids: list[str] | None = None,
+    feature_date: date | None = None,
+) -> int:
+    """Recompute and load the features of ``steam_ids`` (every player when None)
+
+    The players are sent to ClickHouse as an external table, so the session
+    scan is pruned by the fact table's player_sk sort key. Returns rows written.
+    """
+    feature_date = feature_date or date.today()
+    options = {}
+    where, players = "", ""
+    if steam_ids is not None:
+        if not steam_ids:
+            return 0
+        options["external_tables"] = [
+            {
+                "name": "touched_players",
+                "structure": [("player_sk", "UInt64")],
+                "data": [{"player_sk": player_sk(steam_id)} for steam_id in set(steam_ids)],
+            }
+        ]
+        where = "WHERE s.player_sk IN touched_players"
+        players = "AND player_sk IN touched_players"
+
+    writer = ClickHouseWriter(config, pool=clickhouse_pool(config))
+    try:
+        daily = clickhouse_frame(
+            spark,
+            writer.client,
+            DAILY_QUERY.format(where=where),
+            DAILY_SCHEMA,
+            ("player_sk", "game_sk"),
+            **options,
+        )
+        genres = clickhouse_frame(spark, writer.client, GENRES_QUERY, GENRES_SCHEMA, ("game_sk",))
+        purchases = clickhouse_frame(
+            spark,
+            writer.client,
+            PURCHASES_QUERY.format(players=players),
+            PURCHASES_SCHEMA,
+            ("player_sk",),
+            **options,
+        )
+        return writer.write_player_features(player_features(daily, genres, feature_date, purchases))
+    finally:
+        writer.close()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--steamid", action="append", help="only these players (repeatable)")
+    args = parser.parse_args()
+
+    config = Config()
+    spark = get_spark_session("joyst-player-features", config)
+    try:
+        rows = refresh_player_features(spark, config, args.steamid)
+        print(f"✅ Wrote behaviour features of {rows} players")
+    finally:
+        spark.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,46 @@
+"""Token-bucket rate limiting for Steam Web API calls"""
+
+import threading
+import time
+
+
+class TokenBucket:
+    """Thread-safe token bucket shared by every worker hitting the same API key
+
+    Tokens refill continuously at ``rate`` per second up to ``capacity``. Each
+    request takes one token and blocks until one is available, so bursts are
+    allowed up to ``capacity`` while the long-run average stays at ``rate``.
+    """
+
+    def __init__(self, rate: float, capacity: float | None = None):
+        if rate <= 0:
+            raise ValueError("rate must be positive")
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else max(1.0, rate)
+        self._tokens = self.capacity
+        self._updated_at = time.monotonic()
+        self._blocked_until = 0.0
+        self._lock = threading.Lock()
+
+    def _refill(self, now: float) -> None:
+        elapsed = now - self._updated_at
+        self._tokens = min(self.capacity, self._tokens + elapsed * self.rate)
+        self._updated_at = now
+
+    def acquire(self, tokens: float = 1.0) -> None:
+        """Block until ``tokens`` are available, then consume them"""
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._refill(now)
+                if now >= self._blocked_until and self._tokens >= tokens:
+                    self._tokens -= tokens
+                    return
+                wait = max(self._blocked_until - now, (tokens - self._tokens) / self.rate)
+            time.sleep(wait)
+
+    def penalize(self, seconds: float) -> None:
+        """Pause all callers for ``seconds`` (e.g. after an HTTP 429 Retry-After)"""
+        with self._lock:
+            self._blocked_until = max(self._blocked_until, time.monotonic() + seconds)
+            self._tokens = 0.0
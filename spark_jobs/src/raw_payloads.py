@@ -0,0 +1,162 @@
+"""Raw Steam payload recording and loading, for offline replays
+
+A recording is one gzip-compressed NDJSON file per run. The first line holds
+the run's metadata; every other line is one item of a payload section::
+
+    {"section": "meta", "data": {"extracted_at": "2024-03-01T12:00:00"}}
+    {"section": "owned_games", "data": {"steamid": "...", "appid": 730, ...}}
+
+so files are written and read as streams, never as one large JSON document.
+Replays read them with Spark (``recording_batches``), so the driver holds one
+batch of accounts at a time instead of the whole recording.
+"""
+
+import gzip
+import json
+import mmap
+from collections.abc import Iterable, Iterator
+from datetime import datetime
+from itertools import chain
+from pathlib import Path
+from typing import Any
+
+from pyspark.sql import DataFrame, SparkSession
+from pyspark.sql import functions as F
+
+# Payload sections wrapped as {"response": {<key>: [...]}}, and plain list sections
+RESPONSE_SECTIONS = {
+    "player_summary": "players",
+    "owned_games": "games",
+    "recently_played": "games",
+}
+LIST_SECTIONS = ("achievements", "game_stats")
+
+RECORDING_GLOB = "steam_*.ndjson.gz"
+
+
+def payload_records(steam_data: dict[str, Any]) -> Iterator[dict[str, Any]]:
+    """Flatten a ``fetch_steam_data`` payload into one record per item"""
+    for section, key in RESPONSE_SECTIONS.items():
+        for item in steam_data.get(section, {}).get("response", {}).get(key, []):
+            yield {"section": section, "data": item}
+    for section in LIST_SECTIONS:
+        for item in steam_data.get(section, []):
+            yield {"section": section, "data": item}
+
+
+def payload_from_records(records: Iterable[dict[str, Any]]) -> dict[str, Any]:
+    """Rebuild a payload from ``payload_records`` output, metadata under ``meta``"""
+    steam_data: dict[str, Any] = {
+        section: {"response": {key: []}} for section, key in RESPONSE_SECTIONS.items()
+    }
+    steam_data.update({section: [] for section in LIST_SECTIONS})
+    steam_data["meta"] = {}
+    for record in records:
+        section = record["section"]
+        if section in RESPONSE_SECTIONS:
+            steam_data[section]["response"][RESPONSE_SECTIONS[section]].append(record["data"])
+        elif section in LIST_SECTIONS:
+            steam_data[section].append(record["data"])
+        elif section == "meta":
+            steam_data["meta"].update(record["data"])
+    return steam_data
+
+
+class PayloadRecorder:
+    """Append payload records of one run to ``<directory>/steam_<timestamp>.ndjson.gz``"""
+
+    def __init__(self, directory: str, extracted_at: datetime, compresslevel: int = 6):
+        Path(directory).mkdir(parents=True, exist_ok=True)
+        self.path = Path(directory) / f"steam_{extracted_at:%Y%m%dT%H%M%S}.ndjson.gz"
+        self.records = 0
+        self._file = gzip.open(self.path, "wt", encoding="utf-8", compresslevel=compresslevel)
+        self._write({"section": "meta", "data": {"extracted_at": extracted_at.isoformat()}})
+
+    def _write(self, record: dict[str, Any]) -> None:
+        self._file.write(json.dumps(record, separators=(",", ":")))
+        self._file.write("\n")
+
+    def record(self, steam_data: dict[str, Any]) -> int:
+        """Write every item of ``steam_data``; returns the number of records written"""
+        written = 0
+        for record in payload_records(steam_data):
+            self._write(record)
+            written += 1
+        self.records += written
+        return written
+
+    def close(self) -> None:
+        self._file.close()
+
+    def __enter__(self) -> "PayloadRecorder":
+        return self
+
+    def __exit__(self, *exc_info: Any) -> None:
+        self.close()
+
+
+def read_records(path: str | Path, use_mmap: bool = False) -> Iterator[dict[str, Any]]:
+    """Stream the records of one recording
+
+    With ``use_mmap`` the compressed file is memory-mapped and decompressed from
+    the mapping, so large recordings are paged in by the OS instead of being
+    copied through read buffers.
+    """
+    with open(path, "rb") as raw:
+        source = mmap.mmap(raw.fileno(), 0, access=mmap.ACCESS_READ) if use_mmap else raw
+        try:
+            with gzip.GzipFile(fileobj=source, mode="rb") as lines:
+                for line in lines:
+                    if line.strip():
+                        yield json.loads(line)
+        finally:
+            if use_mmap:
+                source.close()
+
+
+def load_recording(path: str | Path, use_mmap: bool = False) -> dict[str, Any]:
+    """Whole payload of one recording, read on this process, with its metadata under ``meta``"""
+    return payload_from_records(read_records(path, use_mmap))
+
+
+def recording_frame(spark: SparkSession, path: str | Path) -> DataFrame:
+    """Records of one recording as (section, steamid, record) rows
+
+    Spark decompresses the file on an executor; ``record`` is the raw JSON line.
+    """
+    lines = spark.read.text(str(path))
+    return lines.select(
+        F.get_json_object("value", "$.section").alias("section"),
+        F.get_json_object("value", "$.data.steamid").alias("steamid"),
+        F.col("value").alias("record"),
+    ).filter(F.col("section").isNotNull())
+
+
+def recording_batches(
+    spark: SparkSession, path: str | Path, batch_accounts: int = 1000
+) -> Iterator[dict[str, Any]]:
+    """Payloads of one recording, ``batch_accounts`` accounts each, metadata under ``meta``
+
+    The parsed recording stays cached in Spark; the driver only collects the
+    account ids and streams one batch of records at a time.
+    """
+    records = recording_frame(spark, path).persist()
+    try:
+        meta = [json.loads(row.record) for row in records.filter("section = 'meta'").collect()]
+        steam_ids = sorted(
+            row.steamid for row in records.select("steamid").distinct().collect() if row.steamid
+        )
+        for start in range(0, len(steam_ids), batch_accounts):
+            batch = records.filter(F.col("steamid").isin(steam_ids[start : start + batch_accounts]))
+            rows = batch.select("record").toLocalIterator()
+            yield payload_from_records(chain(meta, (json.loads(row.record) for row in rows)))
+    finally:
+        records.unpersist()
+
+
+def recording_paths(paths: Iterable[str]) -> list[Path]:
+    """Recordings named by ``paths`` (files or directories), in chronological order"""
+    found: list[Path] = []
+    for path in map(Path, paths):
+        found.extend(sorted(path.glob(RECORDING_GLOB)) if path.is_dir() else [path])
+    return sorted(found, key=lambda p: p.name)
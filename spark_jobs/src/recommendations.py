@@ -0,0 +1,555 @@
+"""Low-latency "games you may like" serving from in-memory array indexes
+
+``RecommendationIndex`` keeps the latest run of ``game_similarity_features`` as
+a CSR neighbour list (one slice of neighbour ids and scores per game) and every
+player's library as a second CSR matrix over the same game ids, all in numpy
+arrays. A query sums the neighbour scores of the player's games weighted by
+log playtime, drops games the player owns and ranks the rest; the ranked
+candidates of hot players stay in an LRU cache.
+
+``IndexRefresher`` keeps a running index fresh: libraries of players whose
+owned games changed since the last poll are patched in, and a newer similarity
+run replaces the neighbour lists. ``main`` serves the index over HTTP:
+
+    GET /recommendations/<steamid>?n=10
+    GET /health
+"""
+
+import json
+import threading
+import time
+from collections import OrderedDict
+from collections.abc import Callable, Hashable, Mapping
+from dataclasses import dataclass, field, replace
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any
+from urllib.parse import parse_qs, urlparse
+
+import numpy as np
+import xxhash
+from config import Config
+from connection_pool import clickhouse_pool, postgres_pool
+
+SIMILARITY_QUERY = """
+    SELECT game_sk_1, game_sk_2, similarity_score
+    FROM game_similarity_features
+    WHERE calculated_at = %(calculated_at)s
+"""
+
+LIBRARY_QUERY = """
+    SELECT p.steamid, o.appid, o.playtime_forever
+    FROM steam_owned_games o
+    JOIN steam_players p ON p.id = o.player_id
+"""
+
+
+def game_sks(appids: np.ndarray) -> np.ndarray:
+    """``surrogate_keys.game_sk`` of many appids, as a UInt64 array"""
+    return np.fromiter(
+        (xxhash.xxh64_intdigest(str(appid).encode()) for appid in appids),
+        dtype="uint64",
+        count=len(appids),
+    )
+
+
+def csr_rows(rows: np.ndarray, row_count: int) -> tuple[np.ndarray, np.ndarray]:
+    """Sort order of ``rows`` and the CSR pointer array of ``row_count`` rows"""
+    order = np.argsort(rows, kind="stable")
+    indptr = np.zeros(row_count + 1, dtype="int64")
+    np.cumsum(np.bincount(rows, minlength=row_count), out=indptr[1:])
+    return order, indptr
+
+
+class LRUCache:
+    """Thread-safe least-recently-used cache"""
+
+    def __init__(self, capacity: int):
+        self.capacity = capacity
+        self.hits = 0
+        self.misses = 0
+        self._entries: OrderedDict = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: Hashable, valid: Callable[[Any], bool] | None = None) -> Any:
+        """Cached value of ``key``; entries failing ``valid`` are dropped as misses"""
+        with self._lock:
+            if key in self._entries:
+                value = self._entries[key]
+                if valid is None or valid(value):
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return value
+                del self._entries[key]
+            self.misses += 1
+            return None
+
+    def put(self, key: Hashable, value: Any) -> None:
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.capacity:
+                self._entries.popitem(last=False)
+
+    def discard(self, key: Hashable) -> None:
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+@dataclass(frozen=True)
+class IndexState:
+    """Everything a query reads, replaced as a whole and never modified
+
+    ``generation`` grows with every replacement. ``rebuilt`` is the generation of
+    the last change that can move any player's ranking (similarities, a full
+    library load, a compaction); each patched library carries the generation it
+    arrived in.
+    """
+
+    generation: int = 0
+    rebuilt: int = 0
+    calculated_at: datetime | None = None
+    # game_sks, appids, indptr, neighbours, scores
+    games: tuple[np.ndarray, ...] = (
+        np.zeros(0, "uint64"),
+        np.zeros(0, "int64"),
+        np.zeros(1, "int64"),
+        np.zeros(0, "int32"),
+        np.zeros(0, "float32"),
+    )
+    # steamids, indptr, games, weights of the last full load
+    libraries: tuple[np.ndarray, ...] = (
+        np.zeros(0, "int64"),
+        np.zeros(1, "int64"),
+        np.zeros(0, "int32"),
+        np.zeros(0, "float32"),
+    )
+    # steamid -> (generation, games, weights) patched in since the last full load
+    updates: Mapping[int, tuple[int, np.ndarray, np.ndarray]] = field(default_factory=dict)
+
+    def valid_from(self, steamid: int) -> int:
+        """Oldest generation whose ranking of ``steamid`` is still current"""
+        updated = self.updates.get(steamid)
+        return self.rebuilt if updated is None else max(self.rebuilt, updated[0])
+
+    def library(self, steamid: int) -> tuple[np.ndarray, np.ndarray]:
+        """Game numbers and weights of a player's library (empty when unknown)"""
+        updated = self.updates.get(steamid)
+        if updated is not None:
+            return updated[1], updated[2]
+        players, indptr, games, weights = self.libraries
+        row = np.searchsorted(players, steamid)
+        if row == len(players) or players[row] != steamid:
+            return games[:0], weights[:0]
+        return games[indptr[row] : indptr[row + 1]], weights[indptr[row] : indptr[row + 1]]
+
+
+class RecommendationIndex:
+    """Game neighbour lists and player libraries as numpy CSR arrays
+
+    Games are numbered by their position in the sorted ``game_sk`` array of the
+    similarity run. Libraries hold those numbers and log1p(playtime) weights;
+    games without similarities are left out of them since they cannot vote.
+
+    Queries read ``_state`` once and never take the lock; changes build a new
+    ``IndexState`` under the lock and swap it in with one assignment. Cached
+    rankings are tagged with the generation they were computed from, so a query
+    that finishes after a swap cannot serve its stale result to later ones.
+    """
+
+    def __init__(self, cache_size: int = 10_000, max_candidates: int = 200):
+        self.max_candidates = max_candidates
+        self.cache = LRUCache(cache_size)
+        self._lock = threading.Lock()
+        self._state = IndexState()
+        # Raw libraries, kept to re-map them onto a new similarity run
+        self._raw_libraries = (np.zeros(0, "int64"), np.zeros(0, "int64"), np.zeros(0, "int64"))
+
+    @property
+    def calculated_at(self) -> datetime | None:
+        return self._state.calculated_at
+
+    @property
+    def game_count(self) -> int:
+        return len(self._state.games[0])
+
+    @property
+    def player_count(self) -> int:
+        state = self._state
+        return len(state.libraries[0]) + len(state.updates)
+
+    @property
+    def pending_updates(self) -> int:
+        """Players patched in since the library arrays were last rebuilt"""
+        return len(self._state.updates)
+
+    def _swap(self, rebuilt: bool = False, **changes: Any) -> None:
+        """Replace the state with ``changes`` applied; call with the lock held"""
+        generation = self._state.generation + 1
+        if rebuilt:
+            changes["rebuilt"] = generation
+        self._state = replace(self._state, generation=generation, **changes)
+
+    def set_similarities(
+        self,
+        game_sk_1: np.ndarray,
+        game_sk_2: np.ndarray,
+        scores: np.ndarray,
+        appids: np.ndarray,
+        calculated_at: datetime | None = None,
+    ) -> None:
+        """Replace the neighbour lists with one similarity run
+
+        ``appids`` are the known appids; similar games whose appid is unknown are
+        never recommended.
+        """
+        sks = np.unique(np.concatenate([game_sk_1, game_sk_2]).astype("uint64"))
+        rows = np.searchsorted(sks, game_sk_1.astype("uint64"))
+        columns = np.searchsorted(sks, game_sk_2.astype("uint64")).astype("int32")
+        _, indptr = csr_rows(rows, len(sks))
+        # Grouped by game, best neighbours first
+        order = np.lexsort((-scores, rows))
+
+        game_appids = np.zeros(len(sks), dtype="int64")
+        if len(sks):
+            known_sks = game_sks(appids)
+            position = np.searchsorted(sks, known_sks).clip(max=len(sks) - 1)
+            found = sks[position] == known_sks
+            game_appids[position[found]] = appids[found]
+
+        games = (sks, game_appids, indptr, columns[order], scores[order].astype("float32"))
+        with self._lock:
+            self._swap(
+                rebuilt=True,
+                games=games,
+                calculated_at=calculated_at,
+                libraries=_library_arrays(games, *self._raw_libraries),
+                updates={},
+            )
+        self.cache.clear()
+
+    def set_libraries(self, steamids: np.ndarray, appids: np.ndarray, playtime: np.ndarray) -> None:
+        """Replace every library with (steamid, appid, playtime minutes) rows"""
+        raw = (steamids.astype("int64"), appids.astype("int64"), playtime.astype("int64"))
+        with self._lock:
+            self._raw_libraries = raw
+            self._swap(rebuilt=True, libraries=_library_arrays(self._state.games, *raw), updates={})
+        self.cache.clear()
+
+    def update_libraries(
+        self, steamids: np.ndarray, appids: np.ndarray, playtime: np.ndarray
+    ) -> int:
+        """Patch in the full current libraries of the players in ``steamids``
+
+        The base arrays stay untouched; updates are folded into them by
+        ``compact``. Returns the number of players updated.
+        """
+        players, rows = np.unique(steamids.astype("int64"), return_inverse=True)
+        weights = np.log1p(np.maximum(playtime, 0)).astype("float32")
+        with self._lock:
+            state = self._state
+            generation = state.generation + 1
+            games, known = _game_numbers(state.games, appids)
+            order, indptr = csr_rows(rows[known], len(players))
+            games, weights = games[known][order], weights[known][order]
+            updates = {
+                int(steamid): (
+                    generation,
+                    games[indptr[i] : indptr[i + 1]],
+                    weights[indptr[i] : indptr[i + 1]],
+                )
+                for i, steamid in enumerate(players)
+            }
+            self._swap(updates={**state.updates, **updates})
+            base_ids, raw_appids, raw_playtime = self._raw_libraries
+            keep = ~np.isin(base_ids, players)
+            self._raw_libraries = (
+                np.concatenate([base_ids[keep], steamids.astype("int64")]),
+                np.concatenate([raw_appids[keep], appids.astype("int64")]),
+                np.concatenate([raw_playtime[keep], playtime.astype("int64")]),
+            )
+        for steamid in updates:
+            self.cache.discard(steamid)
+        return len(updates)
+
+    def compact(self) -> None:
+        """Rebuild the library arrays with the patched-in players folded in"""
+        with self._lock:
+            libraries = _library_arrays(self._state.games, *self._raw_libraries)
+            self._swap(rebuilt=True, libraries=libraries, updates={})
+        self.cache.clear()
+
+    def library(self, steamid: int) -> tuple[np.ndarray, np.ndarray]:
+        """Game numbers and weights of a player's library (empty when unknown)"""
+        return self._state.library(steamid)
+
+    def _rank(self, state: IndexState, steamid: int) -> tuple[np.ndarray, np.ndarray]:
+        """Best ``max_candidates`` unowned games of a player and their scores"""
+        _, appids, indptr, neighbours, scores = state.games
+        owned, weights = state.library(steamid)
+        starts, lengths = indptr[owned], indptr[owned + 1] - indptr[owned]
+        if not lengths.sum():
+            return np.zeros(0, "int64"), np.zeros(0, "float32")
+
+        # Positions of every owned game's neighbour slice, gathered in one go
+        offsets = np.repeat(starts - np.cumsum(lengths) + lengths, lengths)
+        positions = offsets + np.arange(lengths.sum())
+        candidates, inverse = np.unique(neighbours[positions], return_inverse=True)
+        totals = np.bincount(inverse, weights=scores[positions] * np.repeat(weights, lengths))
+
+        keep = ~np.isin(candidates, owned) & (appids[candidates] != 0)
+        candidates, totals = candidates[keep], totals[keep]
+        if len(candidates) > self.max_candidates:
+            top = np.argpartition(-totals, self.max_candidates)[: self.max_candidates]
+            candidates, totals = candidates[top], totals[top]
+        order = np.argsort(-totals, kind="stable")
+        return appids[candidates[order]], totals[order].astype("float32")
+
+    def recommend(self, steamid: str | int, n: int = 10) -> list[tuple[int, float]]:
+        """Top ``n`` (appid, score) for a player; empty for unknown players"""
+        if n < 1:
+            raise ValueError(f"n must be a positive integer, got {n}")
+        key = int(steamid)
+        state = self._state
+        valid_from = state.valid_from(key)
+        cached = self.cache.get(key, lambda entry: entry[0] >= valid_from)
+        if cached is None:
+            ranked = self._rank(state, key)
+            self.cache.put(key, (state.generation, ranked))
+        else:
+            ranked = cached[1]
+        appids, scores = ranked
+        return list(zip(appids[:n].tolist(), scores[:n].tolist()))
+
+    def nbytes(self) -> int:
+        """Memory held by the index arrays"""
+        state = self._state
+        patched = [array for _, *arrays in state.updates.values() for array in arrays]
+        arrays = [*state.games, *state.libraries, *patched, *self._raw_libraries]
+        return sum(array.nbytes for array in arrays)
+
+
+def _game_numbers(
+    games: tuple[np.ndarray, ...], appids: np.ndarray
+) -> tuple[np.ndarray, np.ndarray]:
+    """Game numbers of ``appids`` and the mask of those with similarities"""
+    sks = games[0]
+    if not len(sks):
+        return np.zeros(len(appids), "int32"), np.zeros(len(appids), bool)
+    wanted = game_sks(appids)
+    position = np.searchsorted(sks, wanted).clip(max=len(sks) - 1)
+    return position.astype("int32"), sks[position] == wanted
+
+
+def _library_arrays(
+    games: tuple[np.ndarray, ...], steamids: np.ndarray, appids: np.ndarray, playtime: np.ndarray
+) -> tuple[np.ndarray, ...]:
+    """CSR library arrays of (steamid, appid, playtime) rows over the games of ``games``"""
+    players, rows = np.unique(steamids, return_inverse=True)
+    numbers, known = _game_numbers(games, appids)
+    rows, numbers = rows[known], numbers[known]
+    weights = np.log1p(np.maximum(playtime[known], 0)).astype("float32")
+    order, indptr = csr_rows(rows, len(players))
+    return players, indptr, numbers[order], weights[order]
+
+
+def latest_similarity_run(client) -> datetime | None:
+    [(calculated_at,)] = client.execute("SELECT max(calculated_at) FROM game_similarity_features")
+    # An empty table yields the DateTime zero value
+    return calculated_at if calculated_at and calculated_at.year > 1970 else None
+
+
+def load_similarities(index: RecommendationIndex, config: Config) -> bool:
+    """Load the latest similarity run into ``index`` if it is newer; True if loaded"""
+    with clickhouse_pool(config).connection() as client:
+        calculated_at = latest_similarity_run(client)
+        if calculated_at is None or calculated_at == index.calculated_at:
+            return False
+        columns = client.execute(SIMILARITY_QUERY, {"calculated_at": calculated_at}, columnar=True)
+    sk1, sk2, scores = columns or [[], [], []]
+    with postgres_pool(config).connection() as connection, connection.cursor() as cursor:
+        cursor.execute("SELECT appid FROM steam_games")
+        appids = np.array([row[0] for row in cursor.fetchall()], dtype="int64")
+
+    index.set_similarities(
+        np.array(sk1, dtype="uint64"),
+        np.array(sk2, dtype="uint64"),
+        np.array(scores, dtype="float32"),
+        appids,
+        calculated_at,
+    )
+    print(f"Loaded {len(scores)} similarities of {index.game_count} games ({calculated_at})")
+    return True
+
+
+def _library_rows(cursor) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    rows = cursor.fetchall()
+    return (
+        np.array([int(row[0]) for row in rows], dtype="int64"),
+        np.array([row[1] for row in rows], dtype="int64"),
+        np.array([row[2] or 0 for row in rows], dtype="int64"),
+    )
+
+
+def load_libraries(index: RecommendationIndex, config: Config) -> datetime:
+    """Load every player's owned games into ``index``; returns the database time of the read"""
+    with postgres_pool(config).connection() as connection, connection.cursor() as cursor:
+        cursor.execute("SELECT now()")
+        [(read_at,)] = cursor.fetchall()
+        cursor.execute(LIBRARY_QUERY)
+        index.set_libraries(*_library_rows(cursor))
+    print(f"Loaded libraries of {index.player_count} players")
+    return read_at
+
+
+def refresh_libraries(index: RecommendationIndex, config: Config, since: datetime) -> datetime:
+    """Patch in the libraries of players whose owned games changed after ``since``"""
+    with postgres_pool(config).connection() as connection, connection.cursor() as cursor:
+        cursor.execute("SELECT now()")
+        [(read_at,)] = cursor.fetchall()
+        cursor.execute(
+            LIBRARY_QUERY
+            + """
+            WHERE o.player_id IN (
+                SELECT player_id FROM steam_owned_games WHERE updated_at > %s
+            )
+            """,
+            (since,),
+        )
+        steamids, appids, playtime = _library_rows(cursor)
+    if len(steamids):
+        print(f"Refreshed {index.update_libraries(steamids, appids, playtime)} player libraries")
+    return read_at
+
+
+class IndexRefresher:
+    """Background thread polling for changed libraries and new similarity runs"""
+
+    def __init__(
+        self, index: RecommendationIndex, config: Config, since: datetime, interval: float
+    ):
+        self.index = index
+        self.config = config
+        self.since = since
+        self.interval = interval
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="index-refresher", daemon=True)
+
+    def poll(self) -> None:
+        self.since = refresh_libraries(self.index, self.config, self.since)
+        load_similarities(self.index, self.config)
+        # Fold patches into the base arrays once they are a sizeable share of players
+        if self.index.pending_updates > max(1000, self.index.player_count // 10):
+            self.index.compact()
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.interval):
+            try:
+                self.poll()
+            except Exception as e:
+                print(f"⚠️ Index refresh failed: {e}")
+
+    def start(self) -> "IndexRefresher":
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._stop.set()
+        self._thread.join()
+
+
+def recommendation_server(index: RecommendationIndex, host: str, port: int) -> ThreadingHTTPServer:
+    """HTTP server answering /recommendations/<steamid>?n=N and /health from ``index``"""
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+        # Headers and body go out in separate writes; don't let Nagle hold the body back
+        disable_nagle_algorithm = True
+
+        def _reply(self, status: int, payload: dict) -> None:
+            body = json.dumps(payload).encode()
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_GET(self):
+            url = urlparse(self.path)
+            if url.path == "/health":
+                self._reply(
+                    200,
+                    {
+                        "games": index.game_count,
+                        "players": index.player_count,
+                        "similarity_run": str(index.calculated_at),
+                        "cache_entries": len(index.cache),
+                        "cache_hits": index.cache.hits,
+                        "cache_misses": index.cache.misses,
+                    },
+                )
+                return
+
+            steamid = url.path.removeprefix("/recommendations/")
+            if url.path == steamid or not steamid.isdigit():
+                self._reply(404, {"error": "use /recommendations/<steamid>?n=10"})
+                return
+            try:
+                n = int(parse_qs(url.query).get("n", ["10"])[0])
+            except ValueError:
+                n = 0
+            if n < 1:
+                self._reply(400, {"error": "n must be a positive integer"})
+                return
+            start = time.perf_counter()
+            games = index.recommend(steamid, n)
+            self._reply(
+                200,
+                {
+                    "steamid": steamid,
+                    "recommendations": [{"appid": a, "score": round(s, 4)} for a, s in games],
+                    "latency_ms": round((time.perf_counter() - start) * 1000, 3),
+                },
+            )
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer((host, port), Handler)
+    server.daemon_threads = True
+    return server
+
+
+def main() -> None:
+    config = Config()
+    serving_config = config.get_serving_config()
+    index = RecommendationIndex(
+        cache_size=int(serving_config["cache_size"]),
+        max_candidates=int(serving_config["max_candidates"]),
+    )
+    since = load_libraries(index, config)
+    load_similarities(index, config)
+    refresher = IndexRefresher(
+        index, config, since, float(serving_config["refresh_seconds"])
+    ).start()
+
+    server = recommendation_server(index, serving_config["host"], int(serving_config["port"]))
+    print(f"Serving recommendations on http://{serving_config['host']}:{serving_config['port']}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        refresher.stop()
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,76 @@
+"""Run the pipeline offline from raw payload recordings
+
+    python replay.py [--config config.json] [--batch-accounts N] [--mmap] RECORDING_OR_DIR [...]
+
+Recordings are replayed in chronological order through the same delta,
+DataFrame, writer and snapshot stages as a live run, stamped with their
+original extraction time and without calling the Steam API. Spark reads each
+recording and the pipeline runs once per batch of ``--batch-accounts``
+accounts, so the driver never holds a whole recording. ``--mmap`` instead
+reads each recording on the driver, memory-mapped, as one batch.
+"""
+
+import argparse
+import time
+from collections.abc import Iterator
+from datetime import datetime
+from typing import Any
+
+from base import get_spark_session
+from config import Config
+from metrics import PipelineMetrics
+from raw_payloads import load_recording, recording_batches, recording_paths
+from steam_job import publish_metrics, run_pipeline
+
+
+def replay_recordings(
+    paths: list[str],
+    config_file: str = None,
+    use_mmap: bool = False,
+    batch_accounts: int = 1000,
+) -> None:
+    """Replay every recording found under ``paths``"""
+    config = Config(config_file)
+    recordings = recording_paths(paths)
+    if not recordings:
+        raise ValueError(f"No recordings found in {paths}")
+
+    spark = get_spark_session("steam-account-replay", config)
+    try:
+        for path in recordings:
+            start = time.perf_counter()
+            batches: Iterator[dict[str, Any]] = (
+                iter([load_recording(path, use_mmap=True)])
+                if use_mmap
+                else recording_batches(spark, path, batch_accounts)
+            )
+            for number, steam_data in enumerate(batches, 1):
+                meta = steam_data.pop("meta")
+                extracted_at = datetime.fromisoformat(meta["extracted_at"])
+                print(f"Replaying {path} batch {number} (extracted {extracted_at})...")
+                metrics = PipelineMetrics("steam-account-replay")
+                try:
+                    run_pipeline(spark, config, steam_data, extracted_at, metrics=metrics)
+                finally:
+                    publish_metrics(metrics, config)
+            print(f"Replayed {path} in {time.perf_counter() - start:.2f}s")
+    finally:
+        spark.stop()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Replay recorded Steam payloads")
+    parser.add_argument("paths", nargs="+", help="Recording files or directories")
+    parser.add_argument("--config", default=None, help="Config file")
+    parser.add_argument(
+        "--batch-accounts", type=int, default=1000, help="Accounts per pipeline run"
+    )
+    parser.add_argument(
+        "--mmap", action="store_true", help="Read each recording on the driver, memory-mapped"
+    )
+    args = parser.parse_args()
+    replay_recordings(args.paths, args.config, args.mmap, args.batch_accounts)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,174 @@
+"""Gaming session reconstruction from successive owned-games snapshots
+
+Steam only reports cumulative playtime, so sessions are inferred by diffing
+snapshots of each (player, game) pair with a Spark window:
+
+* a pair observed before yields a session when ``playtime_forever`` grew; its
+  duration is the growth, at most the time between the two snapshots, and it
+  lies between them,
+* a pair seen for the first time can only be dated through ``playtime_2weeks``,
+  so it yields one session of that length inside the last two weeks.
+
+Sessions end at ``rtime_last_played`` when that falls inside the window and at
+the snapshot time otherwise.
+"""
+
+from datetime import datetime
+from typing import Any
+
+from pyspark.sql import DataFrame, SparkSession, Window
+from pyspark.sql import functions as F
+from pyspark.sql.types import LongType, StringType, StructField, StructType, TimestampType
+
+SNAPSHOT_SCHEMA = StructType(
+    [
+        StructField("steamid", StringType(), False),
+        StructField("appid", LongType(), False),
+        StructField("snapshot_ts", TimestampType(), False),
+        StructField("playtime_forever", LongType(), True),
+        StructField("playtime_2weeks", LongType(), True),
+        StructField("rtime_last_played", LongType(), True),
+    ]
+)
+
+# How far back playtime_2weeks reaches
+RECENT_WINDOW_SECONDS = 14 * 24 * 3600
+
+
+def previous_snapshot_rows(
+    watermarks: dict[str, dict[str, Any]], games: list[dict[str, Any]]
+) -> list[tuple]:
+    """Baseline snapshot rows for ``games`` from the accounts' stored watermarks
+
+    Games missing from a watermarked account's snapshot are new to the account
+    and get a zero-playtime baseline, so all their playtime counts as a session
+    in the window since the watermark. An empty snapshot says nothing about
+    what the account owned, so its games get no baseline and fall back to
+    ``playtime_2weeks``.
+    """
+    rows = []
+    for game in games:
+        watermark = watermarks.get(game["steamid"])
+        if watermark is None or not watermark["owned_games_snapshot"]:
+            continue
+        forever, two_weeks, last_played = watermark["owned_games_snapshot"].get(
+            str(game["appid"]), [0, 0, 0]
+        )
+        rows.append(
+            (
+                game["steamid"],
+                game["appid"],
+                watermark["extracted_at"],
+                forever,
+                two_weeks,
+                last_played,
+            )
+        )
+    return rows
+
+
+def snapshot_frame(
+    spark: SparkSession,
+    owned_games_df: DataFrame,
+    extracted_at: datetime,
+    previous_rows: list[tuple] | None = None,
+) -> DataFrame:
+    """Current owned games stamped with ``extracted_at``, plus earlier snapshot rows"""
+    current = owned_games_df.select(
+        "steamid",
+        F.col("appid").cast("long"),
+        F.lit(extracted_at).cast("timestamp").alias("snapshot_ts"),
+        F.col("playtime_forever").cast("long"),
+        F.col("playtime_2weeks").cast("long"),
+        F.col("rtime_last_played").cast("long"),
+    )
+    if not previous_rows:
+        return current
+    return current.unionByName(spark.createDataFrame(previous_rows, SNAPSHOT_SCHEMA))
+
+
+def reconstruct_sessions(snapshots: DataFrame, achievements: DataFrame | None = None) -> DataFrame:
+    """Session facts from a ``SNAPSHOT_SCHEMA`` frame
+
+    Returns one row per session with steamid, appid, session_start, session_end,
+    session_duration_minutes, playtime_total_minutes, achievements_unlocked,
+    is_first_play and date_sk (yyyyMMdd of session_start).
+    """
+    pair = Window.partitionBy("steamid", "appid")
+    ordered = pair.orderBy("snapshot_ts")
+    snapshot_seconds = F.unix_timestamp("snapshot_ts")
+    forever = F.coalesce(F.col("playtime_forever"), F.lit(0))
+    two_weeks = F.coalesce(F.col("playtime_2weeks"), F.lit(0))
+
+    diffed = (
+        snapshots.withColumn("prev_forever", F.lag("playtime_forever").over(ordered))
+        .withColumn("prev_ts", F.lag("snapshot_ts").over(ordered))
+        .withColumn("observations", F.count(F.lit(1)).over(pair))
+    )
+
+    # Diff against the previous snapshot; single observations fall back to playtime_2weeks.
+    # No more minutes can be played than elapsed between the two snapshots.
+    has_baseline = F.col("prev_ts").isNotNull()
+    growth = forever - F.coalesce(F.col("prev_forever"), F.lit(0))
+    elapsed_minutes = F.floor((snapshot_seconds - F.unix_timestamp("prev_ts")) / 60)
+    duration = F.when(has_baseline, F.least(growth, elapsed_minutes)).when(
+        F.col("observations") == 1, two_weeks
+    )
+    window_start = F.when(has_baseline, F.unix_timestamp("prev_ts")).otherwise(
+        snapshot_seconds - RECENT_WINDOW_SECONDS
+    )
+    first_play = F.when(has_baseline, F.coalesce(F.col("prev_forever"), F.lit(0)) == 0).otherwise(
+        forever == two_weeks
+    )
+
+    sessions = (
+        diffed.withColumn("session_duration_minutes", duration)
+        .filter(F.col("session_duration_minutes") > 0)
+        .withColumn("window_start", window_start)
+        .withColumn("window_end", snapshot_seconds)
+        .withColumn(
+            "end_seconds",
+            F.when(
+                F.col("rtime_last_played").between(F.col("window_start"), F.col("window_end")),
+                F.col("rtime_last_played"),
+            ).otherwise(F.col("window_end")),
+        )
+        .withColumn(
+            "start_seconds",
+            F.greatest(
+                F.col("window_start"),
+                F.col("end_seconds") - F.col("session_duration_minutes") * 60,
+            ),
+        )
+        .select(
+            "steamid",
+            "appid",
+            "window_start",
+            "window_end",
+            F.col("start_seconds").cast("timestamp").alias("session_start"),
+            F.col("end_seconds").cast("timestamp").alias("session_end"),
+            F.col("session_duration_minutes").cast("int"),
+            forever.cast("int").alias("playtime_total_minutes"),
+            first_play.cast("int").alias("is_first_play"),
+        )
+    )
+
+    if achievements is None:
+        unlocked = sessions.withColumn("achievements_unlocked", F.lit(0))
+    else:
+        unlocks = achievements.filter(F.col("achieved") == 1).select(
+            "steamid", F.col("appid").cast("long").alias("appid"), "unlocktime"
+        )
+        in_window = (F.col("unlocktime") > F.col("window_start")) & (
+            F.col("unlocktime") <= F.col("window_end")
+        )
+        count_in_window = F.sum(F.when(in_window, 1).otherwise(0)).cast("int")
+        unlocked = (
+            sessions.join(unlocks, ["steamid", "appid"], "left")
+            .groupBy(*sessions.columns)
+            .agg(count_in_window.alias("achievements_unlocked"))
+        )
+
+    return unlocked.drop("window_start", "window_end").withColumn(
+        "date_sk", F.date_format("session_start", "yyyyMMdd").cast("int")
+    )
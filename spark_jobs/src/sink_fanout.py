@@ -0,0 +1,175 @@
+"""Concurrent fan-out of record batches to the PostgreSQL and ClickHouse writers
+
+Every sink runs in its own thread with its own connection. Inside a sink, a
+producer thread streams record batches out of the (cached) DataFrames into a
+bounded queue and the sink thread writes them; the queue bound is the
+backpressure, so the producer never runs more than ``queue_depth`` batches
+ahead of a slow store.
+
+A batch that fails is parked on the sink's retry queue and retried with
+exponential backoff once the current table has been sent, before the next
+table starts, so tables that depend on each other (owned games need their
+players and games) still load in order. After a failure the writer is reset
+(rolled back, or given a fresh connection when its own died), so the retries
+don't hit the same broken connection. A sink that runs out of attempts stops
+on its own; the other sink finishes and the failure is raised afterwards.
+"""
+
+import queue
+import threading
+import time
+from collections import deque
+from collections.abc import Callable, Iterator
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Any
+
+from metrics import PipelineMetrics
+
+# Queue markers: end of one table's batches, end of the sink's work
+TABLE_END = object()
+DONE = object()
+
+
+@dataclass
+class SinkTable:
+    """One target table: where its batches come from and how one batch is written"""
+
+    name: str
+    batches: Callable[[], Iterator[Any]]
+    write: Callable[[Any], int]
+
+
+@dataclass
+class SinkResult:
+    sink: str
+    rows: int = 0
+    batches: int = 0
+    retries: int = 0
+    error: BaseException | None = None
+
+
+class SinkRunner:
+    """Load the tables of one sink through a bounded batch queue with a retry queue
+
+    ``connect`` opens the sink's writer and ``tables`` lists the writer's
+    ``SinkTable``s in load order. The writer's ``reset`` is called after a
+    failed batch and its ``close`` when the sink is done.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        connect: Callable[[], Any],
+        tables: Callable[[Any], list[SinkTable]],
+        queue_depth: int = 4,
+        max_attempts: int = 3,
+        retry_backoff: float = 1.0,
+    ):
+        self.name = name
+        self.connect = connect
+        self.tables = tables
+        self.max_attempts = max_attempts
+        self.retry_backoff = retry_backoff
+        self.queue: queue.Queue = queue.Queue(maxsize=queue_depth)
+        self.retry_queue: deque[tuple[SinkTable, Any, int]] = deque()
+        self.failed = threading.Event()
+        self.result = SinkResult(name)
+        self.writer: Any = None
+
+    def _fail(self, error: BaseException) -> None:
+        if self.result.error is None:
+            self.result.error = error
+        self.failed.set()
+
+    def _produce(self, tables: list[SinkTable]) -> None:
+        try:
+            for table in tables:
+                for batch in table.batches():
+                    if self.failed.is_set():
+                        return
+                    self.queue.put((table, batch))
+                self.queue.put(TABLE_END)
+        except Exception as e:
+            self._fail(e)
+        finally:
+            self.queue.put(DONE)
+
+    def _write(self, table: SinkTable, batch: Any, attempt: int) -> None:
+        try:
+            self.result.rows += table.write(batch)
+            self.result.batches += 1
+        except Exception as e:
+            if attempt >= self.max_attempts:
+                print(f"❌ {self.name}: {table.name} batch failed after {attempt} attempts: {e}")
+                self._fail(e)
+            else:
+                print(f"⚠️ {self.name}: {table.name} batch failed (attempt {attempt}), queued: {e}")
+                self.retry_queue.append((table, batch, attempt + 1))
+                self._reset_writer()
+
+    def _reset_writer(self) -> None:
+        try:
+            self.writer.reset()
+        except Exception as e:
+            # The retry will fail too and count against its attempts
+            print(f"⚠️ {self.name}: could not reset the writer: {e}")
+
+    def _drain_retries(self) -> None:
+        while self.retry_queue and not self.failed.is_set():
+            table, batch, attempt = self.retry_queue.popleft()
+            time.sleep(self.retry_backoff * 2 ** (attempt - 2))
+            self.result.retries += 1
+            self._write(table, batch, attempt)
+
+    def _consume(self) -> None:
+        while (item := self.queue.get()) is not DONE:
+            # After a failure keep draining so the producer is never left blocked
+            if self.failed.is_set():
+                continue
+            if item is TABLE_END:
+                self._drain_retries()
+            else:
+                self._write(*item, attempt=1)
+        self._drain_retries()
+
+    def run(self, metrics: PipelineMetrics) -> SinkResult:
+        """Load every table, timed as the ``name`` stage; raises the sink's first error"""
+        with metrics.stage(self.name) as stage:
+            writer = self.writer = self.connect()
+            try:
+                producer = threading.Thread(
+                    target=self._produce,
+                    args=(self.tables(writer),),
+                    name=f"{self.name}-producer",
+                    daemon=True,
+                )
+                producer.start()
+                self._consume()
+                producer.join()
+            finally:
+                writer.close()
+                stage.rows = self.result.rows
+                stage.bytes = getattr(writer, "bytes_sent", None)
+            if self.result.error is not None:
+                raise self.result.error
+        return self.result
+
+
+def fan_out(runners: list[SinkRunner], metrics: PipelineMetrics) -> dict[str, SinkResult]:
+    """Run every sink at once; raises after all finished if any of them failed"""
+    with ThreadPoolExecutor(max_workers=len(runners), thread_name_prefix="sink") as pool:
+        futures = [(runner, pool.submit(runner.run, metrics)) for runner in runners]
+
+    results = {}
+    for runner, future in futures:
+        if future.exception() is not None and runner.result.error is None:
+            runner.result.error = future.exception()
+        results[runner.name] = runner.result
+
+    failed = [result for result in results.values() if result.error is not None]
+    if failed:
+        raise RuntimeError(
+            "Sink writes failed: " + "; ".join(f"{r.sink}: {r.error}" for r in failed)
+        )
+    return results
@@ -0,0 +1,151 @@
+"""Append-only Parquet snapshot lake of every extracted DataFrame
+
+Each run appends its DataFrames under ``<root>/<name>/``, partitioned by
+``extraction_date`` and ``account_bucket`` (xxHash64 of the steamid modulo the
+bucket count) and stamped with ``extracted_at``. Reads filter on those
+partition columns, so Spark prunes directories and pushes the steamid filter
+down into the Parquet scan instead of reading the whole history.
+"""
+
+from datetime import date, datetime
+from typing import Any
+
+from pyspark.errors import AnalysisException
+from pyspark.sql import Column, DataFrame, SparkSession, Window
+from pyspark.sql import functions as F
+
+PARTITION_COLUMNS = ("extraction_date", "account_bucket")
+
+
+def account_bucket(steamid: str | Column, buckets: int) -> Column:
+    """Bucket of a steamid column, stable across runs and Spark versions"""
+    column = F.col(steamid) if isinstance(steamid, str) else steamid
+    return F.pmod(F.xxhash64(column), F.lit(buckets)).cast("int")
+
+
+def write_snapshot(
+    df: DataFrame,
+    path: str,
+    extracted_at: datetime,
+    buckets: int = 16,
+    compression: str = "zstd",
+) -> None:
+    """Append one DataFrame to the lake at ``path``
+
+    Rows are shuffled by partition columns, so each extraction_date/account_bucket
+    directory receives one file written by one task, in parallel across buckets.
+    """
+    bucket = account_bucket("steamid", buckets) if "steamid" in df.columns else F.lit(0)
+    stamped = (
+        df.withColumn("extracted_at", F.lit(extracted_at).cast("timestamp"))
+        .withColumn("extraction_date", F.lit(extracted_at.date()).cast("date"))
+        .withColumn("account_bucket", bucket)
+    )
+    (
+        stamped.repartition(*PARTITION_COLUMNS)
+        .write.mode("append")
+        .partitionBy(*PARTITION_COLUMNS)
+        .option("compression", compression)
+        .parquet(path)
+    )
+
+
+def write_snapshots(
+    dataframes: dict[str, DataFrame],
+    root: str,
+    extracted_at: datetime,
+    buckets: int = 16,
+    compression: str = "zstd",
+) -> None:
+    """Append every DataFrame of a run to ``<root>/<name>``"""
+    for name, df in dataframes.items():
+        write_snapshot(df, f"{root}/{name}", extracted_at, buckets, compression)
+        print(f"Snapshot saved: {name} to {root}/{name}")
+
+
+def read_snapshot(
+    spark: SparkSession,
+    root: str,
+    name: str,
+    start_date: date | None = None,
+    end_date: date | None = None,
+    steam_ids: list[str] | None = None,
+    buckets: int = 16,
+) -> DataFrame:
+    """Read one DataFrame's history, pruned to a date range and a set of accounts
+
+    ``buckets`` must match the value the snapshots were written with.
+    """
+    df = spark.read.parquet(f"{root}/{name}")
+    if start_date is not None:
+        df = df.filter(F.col("extraction_date") >= F.lit(start_date))
+    if end_date is not None:
+        df = df.filter(F.col("extraction_date") <= F.lit(end_date))
+    if steam_ids:
+        # Bucket values are computed on the driver so the filter prunes partitions
+        bucket_ids = sorted(
+            {
+                row[0]
+                for row in spark.createDataFrame([(s,) for s in steam_ids], "steamid string")
+                .select(account_bucket("steamid", buckets))
+                .collect()
+            }
+        )
+        df = df.filter(F.col("account_bucket").isin(bucket_ids)).filter(
+            F.col("steamid").isin(steam_ids)
+        )
+    return df
+
+
+def lake_watermarks(
+    spark: SparkSession,
+    root: str,
+    steam_ids: list[str],
+    before: datetime,
+    buckets: int = 16,
+) -> dict[str, dict[str, Any]]:
+    """Owned-games state of accounts as of their last lake snapshot before ``before``
+
+    For accounts without a stored watermark (e.g. history written before
+    watermarks were kept). Returns the ``owned_games_snapshot`` and
+    ``extracted_at`` parts of ``WatermarkStore.load``, enough for
+    ``sessions.previous_snapshot_rows``; an empty dict when there is no lake yet.
+    """
+    if not steam_ids:
+        return {}
+    try:
+        history = read_snapshot(
+            spark, root, "owned_games", end_date=before.date(), steam_ids=steam_ids, buckets=buckets
+        )
+    except AnalysisException:
+        return {}
+
+    # Incremental runs only append changed games, so take the latest row of each pair
+    latest = Window.partitionBy("steamid", "appid").orderBy(F.desc("extracted_at"))
+    rows = (
+        history.filter(F.col("extracted_at") < F.lit(before).cast("timestamp"))
+        .withColumn("rank", F.row_number().over(latest))
+        .filter(F.col("rank") == 1)
+        .select(
+            "steamid",
+            "appid",
+            "extracted_at",
+            "playtime_forever",
+            "playtime_2weeks",
+            "rtime_last_played",
+        )
+        .collect()
+    )
+
+    watermarks: dict[str, dict[str, Any]] = {}
+    for row in rows:
+        watermark = watermarks.setdefault(
+            row.steamid, {"owned_games_snapshot": {}, "extracted_at": row.extracted_at}
+        )
+        watermark["owned_games_snapshot"][str(row.appid)] = [
+            row.playtime_forever or 0,
+            row.playtime_2weeks or 0,
+            row.rtime_last_played or 0,
+        ]
+        watermark["extracted_at"] = max(watermark["extracted_at"], row.extracted_at)
+    return watermarks
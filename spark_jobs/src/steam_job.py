@@ -1,25 +1,153 @@
+import time
+from collections.abc import Callable
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
 from typing import Any
 
 import requests
-from base import get_spark_session
+from base import (
+    add_job_modules,
+    get_spark_session,
+    persist_dataframes,
+    size_shuffle_partitions,
+    unpersist_dataframes,
+)
 from config import Config
-from database_writers import write_to_databases
+from database_writers import ClickHouseWriter, write_to_databases
+from http_cache import ResponseCache
+from incremental import WatermarkStore, compute_deltas, payload_steam_ids
+from metrics import HTTP_STATS, PipelineMetrics
+from partition_writers import write_to_databases_partitioned
+from player_features import refresh_player_features
 from pyspark.sql import DataFrame, SparkSession
-from pyspark.sql.types import IntegerType, StringType, StructField, StructType
+from pyspark.sql.types import (
+    DoubleType,
+    IntegerType,
+    LongType,
+    StringType,
+    StructField,
+    StructType,
+)
+from rate_limit import TokenBucket
+from raw_payloads import PayloadRecorder, payload_records
+from requests.adapters import HTTPAdapter
+from sessions import previous_snapshot_rows, reconstruct_sessions, snapshot_frame
+from snapshot_lake import lake_watermarks, write_snapshots
+
+STEAM_API_BASE_URL = "https://api.steampowered.com"
+
+# GetPlayerSummaries accepts at most 100 comma-separated steamids per call
+MAX_STEAMIDS_PER_SUMMARY_CALL = 100
+
+# Per-account endpoints fetched for every steam ID, keyed by payload name
+ACCOUNT_ENDPOINTS = {
+    "owned_games": "get_owned_games",
+    "recently_played": "get_recently_played_games",
+}
+
+
+def create_http_session(pool_size: int = 16) -> requests.Session:
+    """Create a requests session whose keep-alive pool serves ``pool_size`` threads"""
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+
+def retry_after_seconds(value: str | None) -> float | None:
+    """Seconds to wait from a Retry-After header, given as seconds or as an HTTP date"""
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        when = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if when.tzinfo is None:
+        when = when.replace(tzinfo=timezone.utc)
+    return max(0.0, (when - datetime.now(timezone.utc)).total_seconds())
 
 
 class SteamAPIClient:
-    def __init__(self, api_key: str, steam_id: str):
+    def __init__(
+        self,
+        api_key: str,
+        steam_id: str,
+        session: requests.Session | None = None,
+        rate_limiter: TokenBucket | None = None,
+        base_url: str = STEAM_API_BASE_URL,
+        max_retries: int = 3,
+        timeout: float = 30.0,
+        cache: ResponseCache | None = None,
+    ):
         self.api_key = api_key
         self.steam_id = steam_id
-        self.base_url = "https://api.steampowered.com"
+        self.base_url = base_url
+        self.session = session if session is not None else requests.Session()
+        self.rate_limiter = rate_limiter
+        self.max_retries = max_retries
+        self.timeout = timeout
+        self.cache = cache
+
+    def _get(self, url: str, params: dict[str, Any]) -> dict[str, Any]:
+        """GET a Steam endpoint, honouring the cache and rate limiter and retrying 429/5xx"""
+        # Endpoint name, e.g. ".../IPlayerService/GetOwnedGames/v0001/" -> "GetOwnedGames"
+        endpoint = url.rstrip("/").split("/")[-2]
+        cached = self.cache.get(endpoint, params) if self.cache is not None else None
+        if cached is not None and cached.fresh:
+            return cached.payload
+        headers = {"If-None-Match": cached.etag} if cached is not None and cached.etag else {}
+
+        for attempt in range(self.max_retries + 1):
+            if self.rate_limiter is not None:
+                self.rate_limiter.acquire()
+            response = self.session.get(url, params=params, headers=headers, timeout=self.timeout)
+            HTTP_STATS.record(
+                requests=1,
+                retries=1 if attempt else 0,
+                bytes=len(getattr(response, "content", b"") or b""),
+            )
 
-    def get_player_summaries(self) -> dict[str, Any]:
-        """Get basic player profile information"""
+            if response.status_code == 304 and cached is not None:
+                self.cache.revalidated(endpoint, params)
+                return cached.payload
+
+            retryable = response.status_code == 429 or response.status_code >= 500
+            if not retryable or attempt == self.max_retries:
+                try:
+                    payload = response.json()
+                except ValueError:
+                    # Error pages (e.g. a proxy's HTML 502) are not JSON: raise the HTTP error
+                    response.raise_for_status()
+                    raise
+                if self.cache is not None and response.status_code == 200:
+                    self.cache.put(endpoint, params, payload, response.headers.get("ETag"))
+                return payload
+
+            delay = retry_after_seconds(response.headers.get("Retry-After"))
+            if delay is None:
+                delay = 2**attempt
+            if self.rate_limiter is not None:
+                # Back off every worker sharing the key, not just this one
+                self.rate_limiter.penalize(delay)
+            else:
+                time.sleep(delay)
+
+    def get_player_summaries(self, steam_ids: list[str] | None = None) -> dict[str, Any]:
+        """Get basic player profile information, optionally for up to 100 steam IDs at once"""
+        if steam_ids is not None and len(steam_ids) > MAX_STEAMIDS_PER_SUMMARY_CALL:
+            raise ValueError(
+                f"GetPlayerSummaries accepts at most {MAX_STEAMIDS_PER_SUMMARY_CALL} steamids"
+            )
         url = f"{self.base_url}/ISteamUser/GetPlayerSummaries/v0002/"
-        params = {"key": self.api_key, "steamids": self.steam_id, "format": "json"}
-        response = requests.get(url, params=params)
-        return response.json()
+        steamids = ",".join(steam_ids) if steam_ids else self.steam_id
+        params = {"key": self.api_key, "steamids": steamids, "format": "json"}
+        return self._get(url, params)
 
     def get_owned_games(self) -> dict[str, Any]:
         """Get list of games owned by the player"""
@@ -31,44 +159,249 @@ class SteamAPIClient:
             "include_appinfo": True,
             "include_played_free_games": True,
         }
-        response = requests.get(url, params=params)
-        return response.json()
+        return self._get(url, params)
 
     def get_recently_played_games(self) -> dict[str, Any]:
         """Get recently played games"""
         url = f"{self.base_url}/IPlayerService/GetRecentlyPlayedGames/v0001/"
         params = {"key": self.api_key, "steamid": self.steam_id, "format": "json", "count": 100}
-        response = requests.get(url, params=params)
-        return response.json()
+        return self._get(url, params)
 
     def get_player_achievements(self, app_id: int) -> dict[str, Any]:
         """Get player achievements for a specific game"""
         url = f"{self.base_url}/ISteamUserStats/GetPlayerAchievements/v0001/"
         params = {"key": self.api_key, "steamid": self.steam_id, "appid": app_id, "format": "json"}
-        response = requests.get(url, params=params)
-        return response.json()
+        return self._get(url, params)
 
     def get_user_stats_for_game(self, app_id: int) -> dict[str, Any]:
         """Get user statistics for a specific game"""
         url = f"{self.base_url}/ISteamUserStats/GetUserStatsForGame/v0002/"
         params = {"key": self.api_key, "steamid": self.steam_id, "appid": app_id, "format": "json"}
-        response = requests.get(url, params=params)
-        return response.json()
+        return self._get(url, params)
 
 
-def fetch_steam_data(api_key: str, steam_id: str) -> dict[str, Any]:
+def _tag_games(payload: dict[str, Any], steam_id: str) -> list[dict[str, Any]]:
+    """Return the games of an owned/recently-played payload, each tagged with its owner"""
+    games = payload.get("response", {}).get("games", [])
+    for game in games:
+        game["steamid"] = steam_id
+    return games
+
+
+def fetch_steam_data(
+    api_key: str,
+    steam_id: str,
+    base_url: str = STEAM_API_BASE_URL,
+    cache: ResponseCache | None = None,
+) -> dict[str, Any]:
     """Fetch comprehensive Steam account data"""
-    client = SteamAPIClient(api_key, steam_id)
+    client = SteamAPIClient(api_key, steam_id, base_url=base_url, cache=cache)
 
     data = {
         "player_summary": client.get_player_summaries(),
         "owned_games": client.get_owned_games(),
         "recently_played": client.get_recently_played_games(),
     }
+    _tag_games(data["owned_games"], steam_id)
+    _tag_games(data["recently_played"], steam_id)
 
     return data
 
 
+def chunk_steam_ids(
+    steam_ids: list[str], size: int = MAX_STEAMIDS_PER_SUMMARY_CALL
+) -> list[list[str]]:
+    """Split steam IDs into de-duplicated chunks of at most ``size``"""
+    unique_ids = list(dict.fromkeys(steam_ids))
+    return [unique_ids[i : i + size] for i in range(0, len(unique_ids), size)]
+
+
+def fetch_player_summaries_bulk(
+    api_key: str,
+    steam_ids: list[str],
+    max_workers: int = 4,
+    rate_limiter: TokenBucket | None = None,
+    session: requests.Session | None = None,
+    base_url: str = STEAM_API_BASE_URL,
+    cache: ResponseCache | None = None,
+) -> dict[str, Any]:
+    """Fetch player summaries in 100-ID chunks, merged into a single payload
+
+    The result has the ``player_summary`` shape of ``fetch_steam_data``, so
+    ``create_steam_dataframes`` turns it into one player DataFrame.
+    """
+    client = SteamAPIClient(
+        api_key, "", session=session, rate_limiter=rate_limiter, base_url=base_url, cache=cache
+    )
+    players: list[dict[str, Any]] = []
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        for payload in executor.map(client.get_player_summaries, chunk_steam_ids(steam_ids)):
+            players.extend(payload.get("response", {}).get("players", []))
+    return {"response": {"players": players}}
+
+
+def fetch_steam_data_batch(
+    api_key: str,
+    steam_ids: list[str],
+    max_workers: int = 16,
+    rate_limiter: TokenBucket | None = None,
+    base_url: str = STEAM_API_BASE_URL,
+    cache: ResponseCache | None = None,
+) -> dict[str, Any]:
+    """Fetch many Steam accounts concurrently over one pooled session
+
+    Player summaries are requested in 100-ID chunks; every other (account, endpoint)
+    call is scheduled on the same thread pool and throttled by the shared token
+    bucket. The result has the same shape as ``fetch_steam_data``
+    with all accounts merged, so it feeds ``create_steam_dataframes`` unchanged.
+    Accounts whose calls fail are listed under ``failed_steam_ids``.
+    """
+    session = create_http_session(max_workers)
+    clients = {
+        steam_id: SteamAPIClient(
+            api_key,
+            steam_id,
+            session=session,
+            rate_limiter=rate_limiter,
+            base_url=base_url,
+            cache=cache,
+        )
+        for steam_id in dict.fromkeys(steam_ids)
+    }
+
+    players: list[dict[str, Any]] = []
+    owned_games: list[dict[str, Any]] = []
+    recent_games: list[dict[str, Any]] = []
+    failed: set[str] = set()
+
+    summary_client = SteamAPIClient(
+        api_key, "", session=session, rate_limiter=rate_limiter, base_url=base_url, cache=cache
+    )
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = {
+            executor.submit(summary_client.get_player_summaries, chunk): (chunk, "player_summary")
+            for chunk in chunk_steam_ids(list(clients))
+        }
+        futures.update(
+            {
+                executor.submit(getattr(client, method)): ([steam_id], name)
+                for steam_id, client in clients.items()
+                for name, method in ACCOUNT_ENDPOINTS.items()
+            }
+        )
+        for future in as_completed(futures):
+            ids, name = futures[future]
+            try:
+                payload = future.result()
+            except (requests.RequestException, ValueError) as e:
+                print(f"Warning: {name} fetch failed for {', '.join(ids)}: {e}")
+                failed.update(ids)
+                continue
+
+            steam_id = ids[0]
+            if name == "player_summary":
+                players.extend(payload.get("response", {}).get("players", []))
+            elif name == "owned_games":
+                owned_games.extend(_tag_games(payload, steam_id))
+            else:
+                recent_games.extend(_tag_games(payload, steam_id))
+
+    session.close()
+
+    return {
+        "player_summary": {"response": {"players": players}},
+        "owned_games": {"response": {"games": owned_games}},
+        "recently_played": {"response": {"games": recent_games}},
+        "failed_steam_ids": sorted(failed),
+    }
+
+
+def _eligible_for_stats(game: dict[str, Any]) -> bool:
+    """Only played games that expose community stats have achievements to fetch"""
+    return (game.get("playtime_forever") or 0) > 0 and bool(game.get("has_community_visible_stats"))
+
+
+def _fetch_game_stats(
+    client: SteamAPIClient, appid: int
+) -> tuple[list[dict[str, Any]], list[dict[str, Any]]]:
+    """Fetch achievements and stats rows for one (account, game)"""
+    achievements = client.get_player_achievements(appid).get("playerstats", {})
+    stats = client.get_user_stats_for_game(appid).get("playerstats", {})
+    achievement_rows = [
+        {
+            "steamid": client.steam_id,
+            "appid": appid,
+            "apiname": a.get("apiname"),
+            "achieved": a.get("achieved"),
+            "unlocktime": a.get("unlocktime"),
+        }
+        for a in achievements.get("achievements", [])
+    ]
+    stat_rows = [
+        {
+            "steamid": client.steam_id,
+            "appid": appid,
+            "name": s.get("name"),
+            "value": float(s["value"]) if s.get("value") is not None else None,
+        }
+        for s in stats.get("stats", [])
+    ]
+    return achievement_rows, stat_rows
+
+
+def fetch_game_enrichment(
+    api_key: str,
+    owned_games: list[dict[str, Any]],
+    max_workers: int = 16,
+    rate_limiter: TokenBucket | None = None,
+    base_url: str = STEAM_API_BASE_URL,
+    cache: ResponseCache | None = None,
+) -> dict[str, list[dict[str, Any]]]:
+    """Fan per-game achievement and stats calls out over a bounded thread pool
+
+    ``owned_games`` are the steamid-tagged rows of an owned-games payload. Games
+    never played or without community stats are skipped. Returns flat
+    ``achievements`` and ``game_stats`` row lists for ``create_steam_dataframes``.
+    """
+    session = create_http_session(max_workers)
+    clients: dict[str, SteamAPIClient] = {}
+    for game in owned_games:
+        steam_id = game["steamid"]
+        if steam_id not in clients:
+            clients[steam_id] = SteamAPIClient(
+                api_key,
+                steam_id,
+                session=session,
+                rate_limiter=rate_limiter,
+                base_url=base_url,
+                cache=cache,
+            )
+
+    achievements: list[dict[str, Any]] = []
+    game_stats: list[dict[str, Any]] = []
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = {
+            executor.submit(_fetch_game_stats, clients[game["steamid"]], game["appid"]): game
+            for game in owned_games
+            if _eligible_for_stats(game)
+        }
+        for future in as_completed(futures):
+            game = futures[future]
+            try:
+                achievement_rows, stat_rows = future.result()
+            except (requests.RequestException, ValueError) as e:
+                print(f"Warning: stats fetch failed for {game['steamid']}/{game['appid']}: {e}")
+                continue
+            achievements.extend(achievement_rows)
+            game_stats.extend(stat_rows)
+
+    session.close()
+
+    return {"achievements": achievements, "game_stats": game_stats}
+
+
 def create_steam_dataframes(
     spark: SparkSession, steam_data: dict[str, Any]
 ) -> dict[str, DataFrame]:
@@ -98,6 +431,27 @@ def create_steam_dataframes(
             StructField("playtime_2weeks", IntegerType(), True),
             StructField("img_icon_url", StringType(), True),
             StructField("img_logo_url", StringType(), True),
+            StructField("steamid", StringType(), True),
+            StructField("rtime_last_played", LongType(), True),
+        ]
+    )
+
+    # Per-game achievements and stats schemas
+    achievements_schema = StructType(
+        [
+            StructField("steamid", StringType(), True),
+            StructField("appid", IntegerType(), True),
+            StructField("apiname", StringType(), True),
+            StructField("achieved", IntegerType(), True),
+            StructField("unlocktime", LongType(), True),
+        ]
+    )
+    game_stats_schema = StructType(
+        [
+            StructField("steamid", StringType(), True),
+            StructField("appid", IntegerType(), True),
+            StructField("name", StringType(), True),
+            StructField("value", DoubleType(), True),
         ]
     )
 
@@ -124,6 +478,16 @@ def create_steam_dataframes(
             recent_df = spark.createDataFrame(recent_games, games_schema)
             dataframes["recently_played"] = recent_df
 
+    # Create per-game achievements and stats DataFrames
+    if steam_data.get("achievements"):
+        dataframes["achievements"] = spark.createDataFrame(
+            steam_data["achievements"], achievements_schema
+        )
+    if steam_data.get("game_stats"):
+        dataframes["game_stats"] = spark.createDataFrame(
+            steam_data["game_stats"], game_stats_schema
+        )
+
     return dataframes
 
 
@@ -133,7 +497,7 @@ def process_steam_account_data(config_file: str = None) -> None:
     steam_config = config.get_steam_config()
 
     # Validate required configuration
-    if not steam_config["api_key"] or not steam_config["steam_id"]:
+    if not steam_config["api_key"] or not (steam_config["steam_id"] or steam_config["steam_ids"]):
         raise ValueError(
             "Steam API key and Steam ID must be provided via config file or environment variables"
         )
@@ -156,28 +520,235 @@ def process_steam_account_data(config_file: str = None) -> None:
     spark = get_spark_session(app_name, config)
 
     # Fetch data from Steam API
-    print("Fetching Steam account data...")
-    steam_data = fetch_steam_data(steam_config["api_key"], steam_config["steam_id"])
+    metrics = PipelineMetrics(app_name)
+    rate_limiter = TokenBucket(
+        float(steam_config["requests_per_second"]), float(steam_config["burst"])
+    )
+    cache = None
+    if steam_config["cache_dir"]:
+        cache = ResponseCache(
+            steam_config["cache_dir"],
+            max_bytes=int(steam_config["cache_max_mb"]) * 1024 * 1024,
+        )
+    with metrics.stage("fetch") as stage:
+        if steam_config["steam_ids"]:
+            steam_ids = steam_config["steam_ids"]
+            print(f"Fetching Steam data for {len(steam_ids)} accounts...")
+            steam_data = fetch_steam_data_batch(
+                steam_config["api_key"],
+                steam_ids,
+                max_workers=int(steam_config["max_workers"]),
+                rate_limiter=rate_limiter,
+                cache=cache,
+            )
+            if steam_data["failed_steam_ids"]:
+                print(f"Warning: {len(steam_data['failed_steam_ids'])} accounts failed to fetch")
+        else:
+            print("Fetching Steam account data...")
+            steam_data = fetch_steam_data(
+                steam_config["api_key"], steam_config["steam_id"], cache=cache
+            )
+        stage.rows = payload_rows(steam_data)
 
-    # Convert to DataFrames
-    print("Creating Spark DataFrames...")
-    dataframes = create_steam_dataframes(spark, steam_data)
+    extracted_at = datetime.now().replace(microsecond=0)
+    recorder = None
+    if steam_config["record_dir"]:
+        recorder = PayloadRecorder(steam_config["record_dir"], extracted_at)
+        recorder.record(steam_data)
 
-    # Display DataFrames for debugging
-    for name, df in dataframes.items():
-        print(f"Processing {name}...")
-        df.show(10)
+    try:
+        run_pipeline(
+            spark,
+            config,
+            steam_data,
+            extracted_at,
+            game_enricher(steam_config, metrics, rate_limiter, cache, recorder),
+            metrics=metrics,
+        )
+    finally:
+        if recorder is not None:
+            recorder.close()
+            print(f"Raw payloads recorded: {recorder.records} records to {recorder.path}")
+        if cache is not None:
+            print(f"Steam API cache: {cache.stats()}")
+            cache.close()
+        publish_metrics(metrics, config)
 
-    # Write to databases
-    print("Writing data to PostgreSQL and ClickHouse...")
-    write_to_databases(dataframes, config, steam_config["steam_id"])
+    spark.stop()
 
-    # Also save as JSON for backup/debugging
-    for name, df in dataframes.items():
-        df.coalesce(1).write.mode("overwrite").json(f"{steam_config['output_path']}/{name}")
-        print(f"Backup saved: {name} to {steam_config['output_path']}/{name}")
 
-    spark.stop()
+def game_enricher(
+    steam_config: dict[str, Any],
+    metrics: PipelineMetrics,
+    rate_limiter: TokenBucket | None = None,
+    cache: ResponseCache | None = None,
+    recorder: PayloadRecorder | None = None,
+) -> Callable[[list[dict[str, Any]]], dict[str, Any]] | None:
+    """The ``enrich`` step of run_pipeline, or None when achievements are not fetched"""
+    if str(steam_config["fetch_achievements"]).lower() != "true":
+        return None
+
+    def enrich(owned_games: list[dict[str, Any]]) -> dict[str, Any]:
+        print("Fetching per-game achievements and stats...")
+        with metrics.stage("enrich") as stage:
+            enrichment = fetch_game_enrichment(
+                steam_config["api_key"],
+                owned_games,
+                max_workers=int(steam_config["max_workers"]),
+                rate_limiter=rate_limiter,
+                cache=cache,
+            )
+            stage.rows = payload_rows(enrichment)
+        if recorder is not None:
+            recorder.record(enrichment)
+        return enrichment
+
+    return enrich
+
+
+def payload_rows(steam_data: dict[str, Any]) -> int:
+    """Number of items (players, games, achievements, stats) in a payload"""
+    return sum(1 for _ in payload_records(steam_data))
+
+
+def publish_metrics(metrics: PipelineMetrics, config: Config) -> None:
+    """Export a run's stage metrics to the configured Prometheus file and ClickHouse"""
+    metrics_config = config.get_metrics_config()
+    if metrics_config["prometheus_path"]:
+        metrics.write_prometheus(metrics_config["prometheus_path"])
+    if str(metrics_config["clickhouse"]).lower() == "true":
+        writer = ClickHouseWriter(config)
+        try:
+            writer.insert_pipeline_runs(metrics.pipeline_run_records())
+        finally:
+            writer.close()
+
+
+def run_pipeline(
+    spark: SparkSession,
+    config: Config,
+    steam_data: dict[str, Any],
+    extracted_at: datetime,
+    enrich: Callable[[list[dict[str, Any]]], dict[str, Any]] | None = None,
+    metrics: PipelineMetrics | None = None,
+) -> None:
+    """Turn one extracted payload into DataFrames and write them everywhere
+
+    ``enrich`` receives the owned games left after the incremental delta and
+    returns the achievements/game_stats sections to add; replays pass none since
+    recordings already hold them. Each stage is timed into ``metrics``.
+    """
+    steam_config = config.get_steam_config()
+    metrics = metrics or PipelineMetrics()
+
+    watermark_store = None
+    watermarks: dict[str, dict[str, Any]] = {}
+    dataframes: dict[str, DataFrame] = {}
+    try:
+        # Both modes keep watermarks: sessions are diffed against them, so a
+        # payload seen twice yields its sessions once; full mode still writes all of it
+        incremental = steam_config["ingestion_mode"] == "incremental"
+        with metrics.stage("delta") as stage:
+            watermark_store = WatermarkStore(config)
+            watermarks = watermark_store.load(payload_steam_ids(steam_data))
+            delta, new_watermarks, delta_stats = compute_deltas(
+                steam_data, watermarks, extracted_at
+            )
+            if incremental:
+                steam_data = delta
+            stage.rows = payload_rows(steam_data)
+        print(f"{'Incremental' if incremental else 'Full'} run: {delta_stats}")
+
+        if enrich is not None:
+            steam_data.update(
+                enrich(steam_data["owned_games"].get("response", {}).get("games", []))
+            )
+
+        # Convert to DataFrames; each is computed once, cached and shared by every sink
+        print("Creating Spark DataFrames...")
+        spark_config = config.get_spark_config()
+        with metrics.stage("transform") as stage:
+            partitions = size_shuffle_partitions(spark, config, payload_rows(steam_data))
+            print(f"Shuffle partitions: {partitions} ({spark_config['profile']} profile)")
+            dataframes.update(create_steam_dataframes(spark, steam_data))
+            row_counts = persist_dataframes(dataframes, spark_config["storage_level"])
+            if "owned_games" in dataframes:
+                # Sessions come from diffing this snapshot against the accounts' watermarks,
+                # or their last snapshot in the lake when they have none
+                games = steam_data["owned_games"]["response"]["games"]
+                unseen = sorted({game["steamid"] for game in games} - set(watermarks))
+                baselines = {
+                    **lake_watermarks(
+                        spark,
+                        steam_config["output_path"],
+                        unseen,
+                        extracted_at,
+                        buckets=int(steam_config["snapshot_buckets"]),
+                    ),
+                    **watermarks,
+                }
+                previous_rows = previous_snapshot_rows(baselines, games)
+                snapshots = snapshot_frame(
+                    spark, dataframes["owned_games"], extracted_at, previous_rows
+                )
+                dataframes["sessions"] = reconstruct_sessions(
+                    snapshots, dataframes.get("achievements")
+                )
+                row_counts.update(
+                    persist_dataframes(
+                        {"sessions": dataframes["sessions"]}, spark_config["storage_level"]
+                    )
+                )
+            stage.rows = sum(row_counts.values())
+        print(f"DataFrame rows: {row_counts}")
+
+        if str(spark_config["debug_show"]).lower() == "true":
+            with metrics.stage("debug_show"):
+                for name, df in dataframes.items():
+                    print(f"Processing {name}...")
+                    df.show(10)
+
+        # Write to databases
+        print("Writing data to PostgreSQL and ClickHouse...")
+        writer_config = config.get_writer_config()
+        if writer_config["mode"] == "partition":
+            add_job_modules(spark)
+            write_to_databases_partitioned(
+                dataframes, config, int(writer_config["parallelism"]), metrics=metrics
+            )
+        else:
+            write_to_databases(dataframes, config, metrics=metrics)
+
+        # Advance watermarks only once the data is safely written
+        watermark_store.save(new_watermarks)
+
+        # Refresh behaviour features of the players that got new sessions
+        if (
+            "sessions" in dataframes
+            and str(config.get_features_config()["refresh"]).lower() == "true"
+        ):
+            with metrics.stage("features") as stage:
+                touched = [
+                    row.steamid
+                    for row in dataframes["sessions"].select("steamid").distinct().collect()
+                ]
+                stage.rows = refresh_player_features(spark, config, touched, extracted_at.date())
+
+        # Append this run to the Parquet snapshot lake
+        with metrics.stage("snapshot") as stage:
+            write_snapshots(
+                dataframes,
+                steam_config["output_path"],
+                extracted_at,
+                buckets=int(steam_config["snapshot_buckets"]),
+                compression=steam_config["snapshot_compression"],
+            )
+            stage.rows = sum(row_counts.values())
+    finally:
+        # Only the frames created before a failure exist here
+        unpersist_dataframes(dataframes)
+        if watermark_store is not None:
+            watermark_store.close()
 
 
 def main() -> None:
@@ -0,0 +1,85 @@
+"""Deterministic 64-bit surrogate keys for the ClickHouse star schema
+
+Keys are xxHash64 (seed 0) of the natural key rendered as a string, so they are
+identical across runs, processes and executors, and can be reproduced inside
+ClickHouse:
+
+    player_sk  = xxHash64(steamid)
+    game_sk    = xxHash64(toString(appid))
+    session_sk = xxHash64(concat(steamid, ':', toString(appid), ':', toString(session_start)))
+
+ClickHouse stores them as UInt64. Spark has no unsigned long, so the column
+variants return the same 64 bits as a signed long; ``to_unsigned`` restores the
+UInt64 value on the driver before insert.
+"""
+
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+import xxhash
+from pyspark.sql import Column
+from pyspark.sql import functions as F
+from pyspark.sql.functions import pandas_udf
+from pyspark.sql.types import LongType
+
+SESSION_START_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+
+def stable_hash64(value: object) -> int:
+    """xxHash64 of ``str(value)``, as an unsigned 64-bit integer"""
+    return xxhash.xxh64_intdigest(str(value).encode())
+
+
+def player_sk(steamid: str) -> int:
+    return stable_hash64(steamid)
+
+
+def game_sk(appid: int) -> int:
+    return stable_hash64(appid)
+
+
+def session_sk(steamid: str, appid: int, session_start: datetime) -> int:
+    return stable_hash64(f"{steamid}:{appid}:{session_start.strftime(SESSION_START_FORMAT)}")
+
+
+def to_unsigned(values: pd.Series) -> list[int]:
+    """Reinterpret signed Spark longs from the ``*_col`` helpers as UInt64 values"""
+    return values.to_numpy(dtype="int64").view("uint64").tolist()
+
+
+@pandas_udf(LongType())
+def _hash64_signed(values: pd.Series) -> pd.Series:
+    hashes = np.fromiter(
+        (xxhash.xxh64_intdigest(v.encode()) for v in values.astype(str)),
+        dtype="uint64",
+        count=len(values),
+    )
+    return pd.Series(hashes.view("int64"), index=values.index)
+
+
+def player_sk_col(steamid: str | Column = "steamid") -> Column:
+    """Spark column computing ``player_sk`` on the executors (signed, see ``to_unsigned``)"""
+    return _hash64_signed(F.col(steamid) if isinstance(steamid, str) else steamid)
+
+
+def game_sk_col(appid: str | Column = "appid") -> Column:
+    """Spark column computing ``game_sk`` on the executors (signed, see ``to_unsigned``)"""
+    column = F.col(appid) if isinstance(appid, str) else appid
+    return _hash64_signed(column.cast("string"))
+
+
+def session_sk_col(
+    steamid: str | Column = "steamid",
+    appid: str | Column = "appid",
+    session_start: str | Column = "session_start",
+) -> Column:
+    """Spark column computing ``session_sk`` on the executors (signed, see ``to_unsigned``)"""
+    return _hash64_signed(
+        F.concat_ws(
+            ":",
+            steamid,
+            F.col(appid).cast("string") if isinstance(appid, str) else appid.cast("string"),
+            F.date_format(session_start, "yyyy-MM-dd HH:mm:ss"),
+        )
+    )
@@ -0,0 +1,155 @@
+"""Long-running ingestion worker fed by the steam account queue
+
+    python worker.py [--config config.json] [--worker-id ID] [--drain]
+
+The worker keeps one Spark session and one set of pooled connections open and
+loops: claim a micro-batch of accounts from ``steam_account_queue``, fetch them
+from the Steam API, run them through the same delta, DataFrame, writer and
+snapshot stages as a batch run, then checkpoint the batch. Accounts whose fetch
+failed, or whole batches whose pipeline failed, go back to the queue for a
+retry. Run as many workers as the Steam API rate limit allows, on one node or
+several; SIGTERM or Ctrl-C lets the current batch finish first.
+"""
+
+import argparse
+import signal
+import threading
+import time
+from collections.abc import Callable
+from datetime import datetime
+from typing import Any
+
+from account_queue import AccountQueue
+from base import get_spark_session
+from config import Config
+from http_cache import ResponseCache
+from incremental import drop_accounts
+from metrics import PipelineMetrics
+from rate_limit import TokenBucket
+from steam_job import (
+    fetch_steam_data_batch,
+    game_enricher,
+    payload_rows,
+    publish_metrics,
+    run_pipeline,
+)
+
+
+def process_batch(
+    queue: AccountQueue,
+    steam_ids: list[str],
+    fetch: Callable[[list[str]], dict[str, Any]],
+    pipeline: Callable[[dict[str, Any]], None],
+) -> tuple[int, int]:
+    """Fetch and write one claimed batch, then checkpoint it; returns (done, failed)
+
+    Accounts whose fetch failed are left out of the pipeline and retried whole.
+    """
+    try:
+        with queue.keep_leased(steam_ids):
+            steam_data = fetch(steam_ids)
+            failed = set(steam_data.get("failed_steam_ids", []))
+            # Partial rows of failed accounts would be written and watermarked as complete
+            pipeline(drop_accounts(steam_data, failed))
+    except Exception as e:
+        print(f"❌ Batch of {len(steam_ids)} accounts failed: {e}")
+        queue.fail(steam_ids, str(e))
+        return 0, len(steam_ids)
+
+    queue.fail(sorted(failed), "Steam API fetch failed")
+    done = queue.complete([steam_id for steam_id in steam_ids if steam_id not in failed])
+    return done, len(failed)
+
+
+def run_worker(config: Config, worker_id: str | None = None, drain: bool = False) -> None:
+    """Consume the queue until stopped, or until it has nothing due with ``drain``"""
+    steam_config = config.get_steam_config()
+    queue_config = config.get_queue_config()
+    if not steam_config["api_key"]:
+        raise ValueError("Steam API key must be provided via config file or environment variables")
+
+    queue = AccountQueue(config, worker_id)
+    app_name = f"steam-account-worker-{queue.worker_id}"
+    batch_size = int(queue_config["batch_size"])
+    poll_seconds = float(queue_config["poll_seconds"])
+
+    stop = threading.Event()
+    for signum in (signal.SIGINT, signal.SIGTERM):
+        signal.signal(signum, lambda *_: stop.set())
+
+    rate_limiter = TokenBucket(
+        float(steam_config["requests_per_second"]), float(steam_config["burst"])
+    )
+    cache = None
+    if steam_config["cache_dir"]:
+        cache = ResponseCache(
+            steam_config["cache_dir"],
+            max_bytes=int(steam_config["cache_max_mb"]) * 1024 * 1024,
+        )
+
+    spark = get_spark_session(app_name, config)
+    print(f"Worker {queue.worker_id} started, queue: {queue.counts()}")
+    try:
+        while not stop.is_set():
+            steam_ids = queue.claim(batch_size)
+            if not steam_ids:
+                if drain:
+                    break
+                stop.wait(poll_seconds)
+                continue
+
+            start = time.perf_counter()
+            metrics = PipelineMetrics(app_name)
+
+            def fetch(steam_ids: list[str], metrics: PipelineMetrics = metrics) -> dict[str, Any]:
+                with metrics.stage("fetch") as stage:
+                    steam_data = fetch_steam_data_batch(
+                        steam_config["api_key"],
+                        steam_ids,
+                        max_workers=int(steam_config["max_workers"]),
+                        rate_limiter=rate_limiter,
+                        cache=cache,
+                    )
+                    stage.rows = payload_rows(steam_data)
+                return steam_data
+
+            def pipeline(steam_data: dict[str, Any], metrics: PipelineMetrics = metrics) -> None:
+                run_pipeline(
+                    spark,
+                    config,
+                    steam_data,
+                    datetime.now().replace(microsecond=0),
+                    game_enricher(steam_config, metrics, rate_limiter, cache),
+                    metrics=metrics,
+                )
+
+            try:
+                done, failed = process_batch(queue, steam_ids, fetch, pipeline)
+            finally:
+                publish_metrics(metrics, config)
+            print(
+                f"✅ Batch of {len(steam_ids)} accounts in {time.perf_counter() - start:.1f}s: "
+                f"{done} done, {failed} to retry"
+            )
+    finally:
+        released = queue.release()
+        if released:
+            print(f"⚠️ Released {released} unfinished accounts back to the queue")
+        if cache is not None:
+            print(f"Steam API cache: {cache.stats()}")
+            cache.close()
+        spark.stop()
+        print(f"Worker {queue.worker_id} stopped, queue: {queue.counts()}")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Consume the steam account queue")
+    parser.add_argument("--config", default=None, help="Config file")
+    parser.add_argument("--worker-id", default=None, help="Stable worker name (QUEUE_WORKER_ID)")
+    parser.add_argument("--drain", action="store_true", help="Exit once nothing is due")
+    args = parser.parse_args()
+    run_worker(Config(args.config), args.worker_id, args.drain)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,18 @@
+import sys
+from pathlib import Path
+
+import pytest
+
+# Spark job modules import each other by bare name (as spark-submit runs them)
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "src"))
+
+
+@pytest.fixture(scope="session")
+def spark():
+    """One local Spark session shared by every test that needs it"""
+    pytest.importorskip("pyspark")
+    from pyspark.sql import SparkSession
+
+    session = SparkSession.builder.master("local[1]").appName("joyst-tests").getOrCreate()
+    yield session
+    session.stop()
@@ -1,3 +1,6 @@
+import pytest
+
+
 def test_basic_functionality():
     """Basic test to ensure pytest is working"""
     assert 1 + 1 == 2
@@ -25,3 +28,1128 @@ def test_import_modules():
         # If import fails, just pass the test with a warning
         print(f"Warning: Could not import steam_job module: {e}")
         assert True  # Don't fail the test
+
+
+def test_token_bucket_throttles_after_burst():
+    """Bucket allows a burst up to capacity, then paces at the refill rate"""
+    import time
+
+    from rate_limit import TokenBucket
+
+    bucket = TokenBucket(rate=50.0, capacity=5)
+    start = time.monotonic()
+    for _ in range(10):
+        bucket.acquire()
+    elapsed = time.monotonic() - start
+
+    # 5 burst tokens are free, the other 5 need ~0.1s of refill at 50/s
+    assert 0.08 <= elapsed < 1.0
+
+
+def test_config_list_from_env(monkeypatch, tmp_path):
+    """Comma-separated environment variables are parsed into lists"""
+    from config import Config
+
+    monkeypatch.setenv("STEAM_IDS", "1, 2,,3")
+    config = Config(str(tmp_path / "missing.json"))
+
+    assert config.get_steam_config()["steam_ids"] == ["1", "2", "3"]
+
+
+def test_player_summaries_bulk_chunks_steam_ids():
+    """Summaries are requested 100 steamids at a time and merged into one payload"""
+    import steam_job
+
+    class FakeResponse:
+        status_code = 200
+        headers: dict = {}
+
+        def __init__(self, steamids):
+            self.steamids = steamids
+
+        def json(self):
+            return {"response": {"players": [{"steamid": i} for i in self.steamids.split(",")]}}
+
+    class FakeSession:
+        def __init__(self):
+            self.calls = []
+
+        def get(self, url, params, timeout, **kwargs):
+            self.calls.append(params["steamids"])
+            return FakeResponse(params["steamids"])
+
+    session = FakeSession()
+    steam_ids = [str(i) for i in range(250)] + ["0"]
+    payload = steam_job.fetch_player_summaries_bulk("key", steam_ids, session=session)
+
+    assert sorted(len(call.split(",")) for call in session.calls) == [50, 100, 100]
+    assert len(payload["response"]["players"]) == 250
+
+
+def test_steam_client_retries_http_date_retry_after_and_html_errors():
+    """Retry-After may be an HTTP date; 5xx error pages that are not JSON are retried"""
+    import json
+    from datetime import datetime, timedelta, timezone
+    from email.utils import format_datetime
+
+    import requests
+    import steam_job
+
+    later = format_datetime(datetime.now(timezone.utc) + timedelta(seconds=30), usegmt=True)
+    assert 25 < steam_job.retry_after_seconds(later) <= 30
+    assert steam_job.retry_after_seconds("Wed, 21 Oct 2015 07:28:00 GMT") == 0
+    assert steam_job.retry_after_seconds("120") == 120
+    assert steam_job.retry_after_seconds("soon") is None
+
+    class FakeResponse:
+        def __init__(self, status_code, body, headers=None):
+            self.status_code = status_code
+            self.content = body.encode()
+            self.headers = headers or {}
+
+        def json(self):
+            return json.loads(self.content)
+
+        def raise_for_status(self):
+            if self.status_code >= 400:
+                raise requests.HTTPError(f"{self.status_code} Server Error")
+
+    class FakeSession:
+        def __init__(self, responses):
+            self.responses = list(responses)
+
+        def get(self, url, params, timeout, **kwargs):
+            return self.responses.pop(0)
+
+    class FakeLimiter:
+        def __init__(self):
+            self.penalties = []
+
+        def acquire(self):
+            pass
+
+        def penalize(self, delay):
+            self.penalties.append(delay)
+
+    html = "<html><body>502 Bad Gateway</body></html>"
+    limiter = FakeLimiter()
+    session = FakeSession(
+        [
+            FakeResponse(429, "", {"Retry-After": later}),
+            FakeResponse(502, html),
+            FakeResponse(200, '{"response": {"games": []}}'),
+        ]
+    )
+    client = steam_job.SteamAPIClient("key", "1", session=session, rate_limiter=limiter)
+    assert client.get_owned_games() == {"response": {"games": []}}
+    assert 25 < limiter.penalties[0] <= 30 and limiter.penalties[1] == 2
+
+    client = steam_job.SteamAPIClient(
+        "key",
+        "1",
+        session=FakeSession([FakeResponse(502, html)] * 2),
+        rate_limiter=FakeLimiter(),
+        max_retries=1,
+    )
+    with pytest.raises(requests.HTTPError, match="502"):
+        client.get_owned_games()
+
+
+def test_game_enrichment_skips_unplayed_and_statless_games(monkeypatch):
+    """Only played games with community stats trigger per-game API calls"""
+    import steam_job
+
+    requested = []
+
+    class FakeResponse:
+        status_code = 200
+        headers: dict = {}
+
+        def json(self):
+            return {
+                "playerstats": {
+                    "achievements": [{"apiname": "WIN", "achieved": 1, "unlocktime": 1}],
+                    "stats": [{"name": "kills", "value": 3}],
+                }
+            }
+
+    class FakeSession:
+        def get(self, url, params, timeout, **kwargs):
+            requested.append(params["appid"])
+            return FakeResponse()
+
+        def close(self):
+            pass
+
+    monkeypatch.setattr(steam_job, "create_http_session", lambda pool_size: FakeSession())
+    games = [
+        {"steamid": "1", "appid": 10, "playtime_forever": 30, "has_community_visible_stats": True},
+        {"steamid": "1", "appid": 20, "playtime_forever": 0, "has_community_visible_stats": True},
+        {"steamid": "1", "appid": 30, "playtime_forever": 30, "has_community_visible_stats": False},
+    ]
+    result = steam_job.fetch_game_enrichment("key", games)
+
+    assert requested == [10, 10]
+    assert result["achievements"][0]["apiname"] == "WIN"
+    assert result["game_stats"][0]["value"] == 3.0
+
+
+def test_response_cache_ttl_and_lru_eviction(tmp_path):
+    """Fresh entries hit, expired ones miss but stay revalidatable, LRU evicts by size"""
+    from http_cache import ResponseCache
+
+    cache = ResponseCache(str(tmp_path), ttls={"GetOwnedGames": 60, "GetRecentlyPlayedGames": 0})
+    params = {"key": "secret", "steamid": "1"}
+
+    assert cache.get("GetOwnedGames", params) is None
+    cache.put("GetOwnedGames", params, {"response": {"game_count": 1}}, etag='"v1"')
+    cache.put("GetRecentlyPlayedGames", params, {"response": {}}, etag=None)
+
+    # The API key is not part of the cache key
+    entry = cache.get("GetOwnedGames", {"key": "other", "steamid": "1"})
+    assert entry.fresh and entry.payload == {"response": {"game_count": 1}}
+    assert entry.etag == '"v1"'
+    assert not cache.get("GetRecentlyPlayedGames", params).fresh
+    assert cache.stats()["hits"] == 1 and cache.stats()["misses"] == 2
+
+    cache.max_bytes = cache.stats()["size_bytes"]
+    cache.get("GetRecentlyPlayedGames", params)
+    cache.put("GetOwnedGames", {"steamid": "2"}, {"response": {"game_count": 2}}, etag=None)
+
+    assert cache.stats()["evictions"] >= 1
+    assert cache.get("GetOwnedGames", params) is None
+
+
+def test_copy_encoding_and_batching():
+    """COPY text encoding escapes control characters and keeps NULL distinct from ''"""
+    import database_writers
+
+    assert database_writers._copy_field(None) == "\\N"
+    assert database_writers._copy_field("") == ""
+    assert database_writers._copy_field("a\tb\\c\nd") == "a\\tb\\\\c\\nd"
+    assert [len(b) for b in database_writers.batched(range(25), 10)] == [10, 10, 5]
+
+
+class StubCursor:
+    """Records the statements and COPY payloads a writer sends"""
+
+    def __init__(self, log):
+        self.log = log
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def execute(self, sql, params=None):
+        self.log.append(("execute", " ".join(sql.split())))
+
+    def copy_expert(self, sql, buffer):
+        self.log.append(("copy", sql, buffer.read().splitlines()))
+
+
+class StubConnection:
+    def __init__(self):
+        self.log = []
+        self.autocommit = True
+        self.closed = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.log.append(("rollback" if exc[0] else "commit",))
+        return False
+
+    def cursor(self):
+        return StubCursor(self.log)
+
+
+def test_owned_and_recent_games_bulk_merge(monkeypatch):
+    """Owned games upsert on (player_id, appid), recent games append, in load order"""
+    from datetime import datetime
+    from types import SimpleNamespace
+
+    import database_writers
+    from config import Config
+
+    row = SimpleNamespace(
+        steamid="1", appid=10, playtime_forever=90, playtime_2weeks=None, rtime_last_played=0
+    )
+    assert database_writers.owned_game_record(row) == ("1", 10, 90, None, None)
+    row.rtime_last_played = 1709294400
+    record = database_writers.owned_game_record(row)
+    assert record[4] == datetime(2024, 3, 1, 12, 0)
+    assert len(record) == len(database_writers.ACTIVITY_COLUMNS)
+
+    monkeypatch.setenv("POSTGRES_BATCH_SIZE", "2")
+    connection = StubConnection()
+    pool = SimpleNamespace(acquire=lambda: connection)
+    writer = database_writers.PostgreSQLWriter(Config(), pool=pool)
+
+    # The same game twice in one batch must not hit ON CONFLICT twice
+    assert writer.upsert_owned_games([record, record, ("2", 20, 5, 5, None)]) == 3
+    statements = [entry for entry in connection.log if entry[0] == "execute"]
+    copies = [entry for entry in connection.log if entry[0] == "copy"]
+    assert [entry[0] for entry in connection.log].count("commit") == 2
+    assert copies[0][1] == (
+        "COPY stage_owned_games (steamid, appid, playtime_forever, playtime_2weeks, "
+        "last_played) FROM STDIN"
+    )
+    assert copies[0][2][0] == "1\t10\t90\t\\N\t2024-03-01 12:00:00"
+    assert copies[1][2] == ["2\t20\t5\t5\t\\N"]
+    merge = statements[1][1]
+    assert "SELECT DISTINCT ON (p.id, s.appid)" in merge
+    assert "ON CONFLICT (player_id, appid) DO UPDATE SET" in merge
+
+    connection.log.clear()
+    assert writer.insert_recently_played([record]) == 1
+    stage, merge = [entry[1] for entry in connection.log if entry[0] == "execute"]
+    assert stage.startswith("CREATE TEMP TABLE stage_recently_played")
+    assert merge.startswith("INSERT INTO steam_recently_played")
+    assert "ON CONFLICT" not in merge and "FROM stage_recently_played s" in merge
+
+    # Players and games load before the rows that reference them
+    frames = dict.fromkeys(["recently_played", "owned_games", "player_summary"])
+    assert [table.name for table in writer.sink_tables(frames)] == [
+        "steam_players",
+        "steam_games",
+        "steam_games",
+        "steam_owned_games",
+        "steam_recently_played",
+    ]
+
+
+def clickhouse_columns(table):
+    """Column names and types of a table in the ClickHouse DDL, in order"""
+    import re
+    from pathlib import Path
+
+    schema = Path(__file__).resolve().parents[2] / "sql" / "clickhouse" / "03_clickhouse_schema.sql"
+    body = re.search(rf"CREATE TABLE {table} \((.*?)\n\) ENGINE", schema.read_text(), re.S)
+    lines = [line.strip() for line in body.group(1).splitlines()]
+    return dict(
+        line.rstrip(",").split()[:2] for line in lines if line and not line.startswith("--")
+    )
+
+
+def test_clickhouse_columnar_insert_matches_ddl(monkeypatch):
+    """Column blocks go out with columnar=True, in DDL order, keys as UInt64"""
+    from datetime import datetime
+
+    import database_writers
+    import pandas as pd
+    from config import Config
+
+    class Client:
+        def __init__(self):
+            self.calls = []
+
+        def execute(self, query, data, columnar=False):
+            self.calls.append((query, data, columnar))
+
+    start = datetime(2024, 3, 1, 12, 0)
+    sessions = pd.DataFrame(
+        {
+            "session_sk": [-1, 2, 3],
+            "player_sk": [-(2**63), 5, 6],
+            "game_sk": [7, 8, 9],
+            "date_sk": [20240301] * 3,
+            "session_start": [start] * 3,
+            "session_end": [start] * 3,
+            "session_duration_minutes": [30, 60, 90],
+            "playtime_total_minutes": [30, 60, 90],
+            "achievements_unlocked": [0, 1, 0],
+            "is_first_play": [1, 0, 0],
+        }
+    )
+    columns = database_writers._column_lists(sessions)
+    assert columns["session_sk"][0] == 2**64 - 1 and columns["player_sk"][0] == 2**63
+    assert all(type(value) is int for value in columns["session_sk"] + columns["date_sk"])
+
+    monkeypatch.setenv("CLICKHOUSE_BATCH_SIZE", "2")
+    client = Client()
+    writer = database_writers.ClickHouseWriter(Config(), client=client)
+    total = writer.insert_columnar(
+        "fact_gaming_sessions", columns, database_writers.FACT_SESSIONS_CONSTANTS
+    )
+    assert total == 3 and [len(data[0]) for _, data, _ in client.calls] == [2, 1]
+    assert all(columnar for _, _, columnar in client.calls)
+
+    query, block, _ = client.calls[1]
+    ddl = clickhouse_columns("fact_gaming_sessions")
+    names = query.split("(", 1)[1].split(")")[0].split(", ")
+    assert names == [name for name in ddl if name != "created_at"]
+    row = dict(zip(names, (values[0] for values in block)))
+    assert row["session_sk"] == 3 and row["device_type"] == 1
+    for name, value in row.items():
+        # UInt*, DateTime and Enum8 (sent as its int value) columns
+        expected = datetime if ddl[name] == "DateTime" else int
+        assert isinstance(value, expected), (name, ddl[name], value)
+        if ddl[name] == "UInt64":
+            assert 0 <= value < 2**64
+
+    # Constant blocks of the dimensions only name columns the tables have
+    assert set(database_writers.DIM_PLAYERS_CONSTANTS) <= set(clickhouse_columns("dim_players"))
+    assert set(database_writers.DIM_GAMES_CONSTANTS) <= set(clickhouse_columns("dim_games"))
+
+
+def test_surrogate_keys_match_clickhouse_xxhash64():
+    """Keys are xxHash64 of the natural key, so they match ClickHouse and never vary per run"""
+    pytest.importorskip("xxhash")
+    from datetime import datetime
+
+    import surrogate_keys
+
+    # SELECT xxHash64('') in ClickHouse
+    assert surrogate_keys.stable_hash64("") == 17241709254077376921
+    assert surrogate_keys.game_sk(730) == surrogate_keys.stable_hash64("730")
+    assert surrogate_keys.session_sk(
+        "76561197960287930", 730, datetime(2024, 1, 15, 12, 0)
+    ) == surrogate_keys.stable_hash64("76561197960287930:730:2024-01-15 12:00:00")
+
+
+def test_incremental_deltas_against_watermark():
+    """Only new games, changed playtime and changed recent activity survive the delta"""
+    from datetime import datetime
+
+    import incremental
+
+    def payload(owned, recent):
+        return {
+            "player_summary": {"response": {"players": [{"steamid": "1", "personaname": "a"}]}},
+            "owned_games": {"response": {"games": owned}},
+            "recently_played": {"response": {"games": recent}},
+        }
+
+    first = [
+        {"steamid": "1", "appid": 10, "playtime_forever": 60},
+        {"steamid": "1", "appid": 20, "playtime_forever": 5},
+    ]
+    delta, watermarks, _ = incremental.compute_deltas(payload(first, []), {}, datetime.now())
+    assert len(delta["owned_games"]["response"]["games"]) == 2
+    assert len(delta["player_summary"]["response"]["players"]) == 1
+
+    # Same state again: nothing to write
+    delta, _, stats = incremental.compute_deltas(payload(first, []), watermarks, datetime.now())
+    assert delta["owned_games"]["response"]["games"] == []
+    assert delta["player_summary"]["response"]["players"] == []
+    assert stats["accounts_unchanged"] == 1
+
+    second = [
+        {"steamid": "1", "appid": 10, "playtime_forever": 90, "playtime_2weeks": 30},
+        {"steamid": "1", "appid": 20, "playtime_forever": 5},
+        {"steamid": "1", "appid": 30, "playtime_forever": 0},
+    ]
+    delta, _, stats = incremental.compute_deltas(
+        payload(second, second[:1]), watermarks, datetime.now()
+    )
+    assert [g["appid"] for g in delta["owned_games"]["response"]["games"]] == [10, 30]
+    assert [g["appid"] for g in delta["recently_played"]["response"]["games"]] == [10]
+    assert stats["new_games"] == 1 and stats["changed_games"] == 1
+
+
+def test_first_seen_account_without_owned_games_gets_no_watermark():
+    """A private or failed owned-games fetch must not store an empty games snapshot"""
+    from datetime import datetime
+
+    import incremental
+
+    private = {
+        "player_summary": {"response": {"players": [{"steamid": "1", "personaname": "a"}]}},
+        "owned_games": {"response": {}},
+        "recently_played": {"response": {"games": []}},
+    }
+    delta, watermarks, _ = incremental.compute_deltas(private, {}, datetime.now())
+    assert watermarks == {}
+    assert len(delta["player_summary"]["response"]["players"]) == 1
+
+    games = [{"steamid": "1", "appid": 10, "playtime_forever": 600}]
+    public = {**private, "owned_games": {"response": {"games": games}}}
+    delta, watermarks, stats = incremental.compute_deltas(public, watermarks, datetime.now())
+    assert stats["new_games"] == 1
+    assert watermarks["1"]["owned_games_snapshot"] == {"10": [600, 0, 0]}
+
+
+def test_sessions_reconstructed_from_snapshot_diffs(spark):
+    """Playtime growth between snapshots becomes a dated session; first sights use 2 weeks"""
+    from datetime import datetime
+
+    import sessions
+
+    day1, day2 = datetime(2024, 3, 1, 12, 0), datetime(2024, 3, 2, 12, 0)
+    last_played = int(datetime(2024, 3, 2, 9, 0).timestamp())
+    snapshots = spark.createDataFrame(
+        [
+            ("1", 10, day1, 100, 0, 0),
+            ("1", 10, day2, 190, 90, last_played),  # +90 minutes, ended 09:00
+            ("1", 20, day2, 100, 0, 0),  # unchanged since day1
+            ("1", 20, day1, 100, 0, 0),
+            ("2", 30, day2, 45, 45, last_played),  # first sight, new game
+        ],
+        sessions.SNAPSHOT_SCHEMA,
+    )
+
+    rows = {r.appid: r for r in sessions.reconstruct_sessions(snapshots).collect()}
+    assert set(rows) == {10, 30}
+    assert rows[10].session_end == datetime(2024, 3, 2, 9, 0)
+    assert rows[10].session_start == datetime(2024, 3, 2, 7, 30)
+    assert rows[10].session_duration_minutes == 90 and rows[10].date_sk == 20240302
+    assert rows[10].is_first_play == 0
+    assert rows[30].session_duration_minutes == 45 and rows[30].is_first_play == 1
+
+
+def test_sessions_never_turn_lifetime_playtime_into_one_session(spark):
+    """Empty watermark snapshots give no baseline; diffs are capped by elapsed time"""
+    from datetime import datetime
+
+    import sessions
+
+    day1, day2 = datetime(2024, 3, 1, 12, 0), datetime(2024, 3, 2, 12, 0)
+    lifetime = {"steamid": "1", "appid": 10, "playtime_forever": 300_000, "playtime_2weeks": 30}
+    unknown = {"1": {"owned_games_snapshot": {}, "extracted_at": day1}}
+    assert sessions.previous_snapshot_rows(unknown, [lifetime]) == []
+
+    games = spark.createDataFrame(
+        [lifetime],
+        "steamid string, appid long, "
+        "playtime_forever long, playtime_2weeks long, rtime_last_played long",
+    )
+    # A known snapshot without the game still gives it a zero baseline
+    known = {"1": {"owned_games_snapshot": {"20": [5, 0, 0]}, "extracted_at": day1}}
+    previous = sessions.previous_snapshot_rows(known, [lifetime])
+    [capped] = sessions.reconstruct_sessions(
+        sessions.snapshot_frame(spark, games, day2, previous)
+    ).collect()
+    assert capped.session_duration_minutes == 24 * 60
+
+    [recent] = sessions.reconstruct_sessions(
+        sessions.snapshot_frame(spark, games, day2, [])
+    ).collect()
+    assert recent.session_duration_minutes == 30
+
+
+def test_snapshot_lake_appends_and_prunes(tmp_path, spark):
+    """Runs append history; reads prune to the requested dates and accounts"""
+    from datetime import date, datetime
+
+    import snapshot_lake
+
+    games = spark.createDataFrame(
+        [("1", 10, 60), ("2", 10, 5), ("3", 20, 0)], "steamid string, appid int, playtime int"
+    )
+    root = str(tmp_path / "lake")
+    for day in (datetime(2024, 3, 1, 6), datetime(2024, 3, 2, 6)):
+        snapshot_lake.write_snapshots({"owned_games": games}, root, day, buckets=4)
+
+    history = snapshot_lake.read_snapshot(spark, root, "owned_games", buckets=4)
+    assert history.count() == 6
+
+    latest = snapshot_lake.read_snapshot(
+        spark, root, "owned_games", start_date=date(2024, 3, 2), steam_ids=["2"], buckets=4
+    )
+    assert [(r.steamid, r.playtime) for r in latest.collect()] == [("2", 5)]
+
+
+@pytest.mark.parametrize("use_mmap", [False, True])
+def test_raw_payload_recording_round_trip(tmp_path, use_mmap):
+    """Recorded payloads replay into the same sections, plain or memory-mapped"""
+    from datetime import datetime
+
+    from raw_payloads import PayloadRecorder, load_recording, recording_paths
+
+    steam_data = {
+        "player_summary": {"response": {"players": [{"steamid": "1", "personaname": "é"}]}},
+        "owned_games": {"response": {"games": [{"steamid": "1", "appid": 10}]}},
+        "recently_played": {"response": {"games": []}},
+    }
+    enrichment = {"achievements": [{"steamid": "1", "appid": 10, "achieved": 1}]}
+    with PayloadRecorder(str(tmp_path), datetime(2024, 3, 1, 12)) as recorder:
+        recorder.record(steam_data)
+        recorder.record(enrichment)
+
+    [path] = recording_paths([str(tmp_path)])
+    replayed = load_recording(path, use_mmap=use_mmap)
+    assert replayed.pop("meta") == {"extracted_at": "2024-03-01T12:00:00"}
+    assert replayed == {**steam_data, **enrichment, "game_stats": []}
+
+
+def test_recording_batches_stream_accounts_through_spark(tmp_path, spark):
+    """Spark reads a recording and hands it back a few accounts at a time"""
+    from datetime import datetime
+
+    from raw_payloads import PayloadRecorder, load_recording, recording_batches
+
+    players = [{"steamid": str(i), "personaname": f"p{i}"} for i in range(3)]
+    games = [{"steamid": str(i), "appid": 10 + i, "playtime_forever": i} for i in range(3)]
+    with PayloadRecorder(str(tmp_path), datetime(2024, 3, 1, 12)) as recorder:
+        recorder.record(
+            {
+                "player_summary": {"response": {"players": players}},
+                "owned_games": {"response": {"games": games}},
+                "achievements": [{"steamid": "2", "appid": 12, "achieved": 1}],
+            }
+        )
+
+    batches = list(recording_batches(spark, recorder.path, batch_accounts=2))
+    assert [b["meta"] for b in batches] == [{"extracted_at": "2024-03-01T12:00:00"}] * 2
+    assert [
+        [p["steamid"] for p in b["player_summary"]["response"]["players"]] for b in batches
+    ] == [
+        ["0", "1"],
+        ["2"],
+    ]
+    assert batches[1]["owned_games"]["response"]["games"] == games[2:]
+    assert batches[1]["achievements"] == [{"steamid": "2", "appid": 12, "achieved": 1}]
+
+    whole = load_recording(recorder.path)
+    assert (
+        sorted(
+            (g for b in batches for g in b["owned_games"]["response"]["games"]),
+            key=lambda g: g["steamid"],
+        )
+        == whole["owned_games"]["response"]["games"]
+    )
+
+
+def test_pipeline_metrics_stages_and_prometheus(tmp_path):
+    """Stages record rows, HTTP retries made inside them and export as Prometheus gauges"""
+    from metrics import HTTP_STATS, PipelineMetrics
+
+    metrics = PipelineMetrics("test-job", run_id="run-1")
+    with metrics.stage("fetch") as stage:
+        HTTP_STATS.record(requests=3, retries=1, bytes=2048)
+        stage.rows = 100
+    with pytest.raises(RuntimeError), metrics.stage("postgres"):
+        raise RuntimeError("connection lost")
+
+    fetch, postgres = metrics.stages
+    assert (fetch.http_requests, fetch.http_retries, fetch.bytes) == (3, 1, 2048)
+    assert fetch.rows_per_second > 0 and postgres.status == "error"
+
+    path = tmp_path / "textfile" / "joyst.prom"
+    metrics.write_prometheus(str(path))
+    text = path.read_text()
+    assert 'joyst_pipeline_stage_rows{job="test-job",stage="fetch",status="ok"} 100' in text
+    assert (
+        'joyst_pipeline_stage_http_retries{job="test-job",stage="postgres",status="error"} 0'
+        in (text)
+    )
+    assert [r[2] for r in metrics.pipeline_run_records()] == ["fetch", "postgres"]
+
+
+def test_persist_dataframes_materializes_once_and_unpersists(spark):
+    """Frames are cached at the configured level, counted once and released afterwards"""
+    import base
+    from pyspark import StorageLevel
+
+    frames = {"a": spark.range(5), "b": spark.range(3)}
+    assert base.persist_dataframes(frames, "DISK_ONLY") == {"a": 5, "b": 3}
+    assert frames["a"].storageLevel == StorageLevel.DISK_ONLY
+
+    base.unpersist_dataframes(frames)
+    assert not frames["b"].is_cached
+
+
+def test_sink_fan_out_runs_sinks_concurrently_and_isolates_failures():
+    """Stores load in parallel, flaky batches are retried, a dead store spares the other"""
+    import threading
+
+    from metrics import PipelineMetrics
+    from sink_fanout import SinkRunner, SinkTable, fan_out
+
+    class Writer:
+        def reset(self):
+            pass
+
+        def close(self):
+            pass
+
+    attempts = []
+
+    # Each sink's first batch waits for the other's: sequential sinks would break it
+    together = threading.Barrier(2, timeout=10)
+
+    def meet(batch):
+        if batch == [1, 2]:
+            together.wait()
+        return len(batch)
+
+    def flaky(batch):
+        attempts.append(batch)
+        if len(attempts) == 1:
+            raise ConnectionError("connection reset")
+        return len(batch)
+
+    def broken(batch):
+        raise ConnectionError("server gone")
+
+    def runner(name, *writes):
+        tables = [SinkTable(f"t{i}", lambda: iter([[1, 2], [3]]), w) for i, w in enumerate(writes)]
+        return SinkRunner(name, Writer, lambda _: tables, queue_depth=1, retry_backoff=0)
+
+    metrics = PipelineMetrics()
+    results = fan_out([runner("a", meet), runner("b", meet, flaky)], metrics)
+    assert not together.broken
+    assert results["a"].rows == 3
+    assert results["b"].rows == 6 and results["b"].retries == 1
+
+    ok = runner("ok", len)
+    with pytest.raises(RuntimeError, match="dead: server gone"):
+        fan_out([ok, runner("dead", broken)], PipelineMetrics())
+    assert ok.result.rows == 3
+
+
+def test_sink_retries_run_on_a_reset_writer_connection():
+    """A connection that dies mid-batch is replaced before the batch is retried"""
+    from config import Config
+    from database_writers import PostgreSQLWriter
+    from metrics import PipelineMetrics
+    from sink_fanout import SinkRunner, SinkTable
+
+    class Connection:
+        def __init__(self):
+            self.closed = 0
+
+    class Writer:
+        def __init__(self):
+            self.connection = Connection()
+            self.resets = 0
+
+        def write(self, batch):
+            if self.connection.closed:
+                raise ConnectionError("connection already closed")
+            if batch == [3] and self.resets == 0:
+                self.connection.closed = 2
+                raise ConnectionError("server closed the connection unexpectedly")
+            return len(batch)
+
+        def reset(self):
+            self.resets += 1
+            self.connection = Connection()
+
+        def close(self):
+            pass
+
+    writer = Writer()
+    batches = [[1, 2], [3], [4]]
+    runner = SinkRunner(
+        "pg",
+        lambda: writer,
+        lambda w: [SinkTable("t", lambda: iter(batches), w.write)],
+        max_attempts=2,
+        retry_backoff=0,
+    )
+    result = runner.run(PipelineMetrics())
+    assert result.rows == 4 and result.retries == 1 and writer.resets == 1
+
+    # PostgreSQLWriter hands a dead connection back to its pool and borrows another
+    class Pool:
+        def __init__(self):
+            self.released = []
+
+        def acquire(self):
+            return Connection()
+
+        def release(self, connection):
+            self.released.append(connection)
+
+    pool = Pool()
+    pg = PostgreSQLWriter(Config(), pool=pool)
+    dead = pg.connection
+    dead.closed = 2
+    pg.reset()
+    assert pool.released == [dead] and pg.connection is not dead and pg.connection.autocommit
+
+
+def test_connection_pool_reuses_and_replaces_broken_connections():
+    """Released connections are reused; a dead idle one is swapped; connects retry"""
+    from connection_pool import ConnectionPool, PoolExhaustedError
+
+    class Conn:
+        def __init__(self):
+            self.alive = True
+
+    failures = [ConnectionError("refused")]
+
+    def connect():
+        if failures:
+            raise failures.pop()
+        return Conn()
+
+    def ping(conn):
+        if not conn.alive:
+            raise ConnectionError("gone")
+        return True
+
+    pool = ConnectionPool(
+        connect,
+        ping,
+        lambda conn: None,
+        min_size=1,
+        max_size=2,
+        connect_backoff=0,
+        health_check_seconds=0,
+        acquire_timeout=0.05,
+    )
+    first = pool.acquire()
+    pool.release(first)
+    assert pool.acquire() is first and pool.stats["connects"] == 1
+
+    second = pool.acquire()
+    with pytest.raises(PoolExhaustedError):
+        pool.acquire()
+
+    first.alive = False
+    pool.release(first)
+    replacement = pool.acquire()
+    assert replacement is not first and pool.stats["reconnects"] == 1
+    pool.release(second)
+    pool.release(replacement)
+    pool.close()
+
+
+def test_game_similarity_pairs_games_sharing_players(spark):
+    """Games played by the same players are each other's nearest neighbours"""
+    import game_similarity
+
+    rows = [(p, 1, 60.0 * p) for p in range(1, 9)]  # game 1: players 1-8
+    rows += [(p, 2, 50.0 * p) for p in range(1, 8)]  # game 2: players 1-7
+    rows += [(p, 3, 30.0) for p in range(20, 26)]  # game 3: nobody else's players
+    rows += [(p, 4, 10.0) for p in (1, 21, 22)]
+    playtime = spark.createDataFrame(rows, game_similarity.PLAYTIME_SCHEMA)
+    genres = spark.createDataFrame(
+        [(1, ["Action", "RPG"]), (2, ["RPG"])], game_similarity.GENRES_SCHEMA
+    )
+
+    similar = game_similarity.compute_similarity(playtime, genres, top_k=1).collect()
+    best = {r.game_sk_1: r for r in similar}
+    assert best[1].game_sk_2 == 2 and best[2].game_sk_2 == 1
+    assert best[1].common_players == 7 and best[1].similarity_score > 0.9
+    assert best[1].playtime_correlation > 0.9 and best[1].genre_overlap_score == 0.5
+    assert best[3].game_sk_2 == 4
+
+
+def test_recommendation_index_ranks_unowned_neighbours_and_refreshes():
+    """Neighbours of owned games are ranked by weighted score; refreshed players re-rank"""
+    import numpy as np
+    from recommendations import RecommendationIndex, game_sks
+
+    appids = np.array([10, 20, 30, 40])
+    sk = dict(zip(appids.tolist(), game_sks(appids)))
+    pairs = [(10, 20, 0.9), (10, 30, 0.5), (20, 40, 0.8), (40, 10, 0.7)]
+    index = RecommendationIndex(cache_size=2)
+    index.set_similarities(
+        np.array([sk[a] for a, _, _ in pairs]),
+        np.array([sk[b] for _, b, _ in pairs]),
+        np.array([s for _, _, s in pairs], dtype="float32"),
+        appids,
+    )
+    index.set_libraries(np.array([1, 1, 2]), np.array([10, 20, 40]), np.array([100, 100, 5]))
+
+    assert [a for a, _ in index.recommend("1")] == [40, 30]  # 0.8 vs 0.5, 20 is owned
+    assert [a for a, _ in index.recommend(2)] == [10]
+    assert index.recommend("999") == []
+
+    index.update_libraries(np.array([1]), np.array([30]), np.array([60]))
+    assert index.recommend("1") == [] and index.pending_updates == 1
+    index.compact()
+    assert index.recommend("2", n=1)[0][0] == 10 and index.pending_updates == 0
+
+
+def test_recommendation_index_rejects_stale_rankings_and_bad_n():
+    """Rankings computed before a swap are not served after it; bad n gets a 400"""
+    import http.client
+    import json
+    import threading
+
+    import numpy as np
+    from recommendations import RecommendationIndex, game_sks, recommendation_server
+
+    appids = np.array([10, 20, 30])
+    sks = game_sks(appids)
+    index = RecommendationIndex()
+    index.set_similarities(sks[[0, 0]], sks[[1, 2]], np.array([0.9, 0.5], "float32"), appids)
+    index.set_libraries(np.array([1]), np.array([10]), np.array([100]))
+    before = index._state
+
+    index.update_libraries(np.array([1, 1, 1]), np.array([10, 20, 30]), np.array([100, 1, 1]))
+    # A query that read the index before the update stores its result afterwards
+    index.cache.put(1, (before.generation, index._rank(before, 1)))
+    assert index.recommend("1") == []
+    index.set_libraries(np.array([1]), np.array([10]), np.array([100]))
+    assert [a for a, _ in index.recommend("1")] == [20, 30]
+
+    server = recommendation_server(index, "127.0.0.1", 0)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    try:
+        statuses = {}
+        for n in ("abc", "-1", "0", "1"):
+            connection = http.client.HTTPConnection("127.0.0.1", server.server_address[1])
+            connection.request("GET", f"/recommendations/1?n={n}")
+            response = connection.getresponse()
+            statuses[n] = (response.status, json.loads(response.read()))
+            connection.close()
+    finally:
+        server.shutdown()
+        server.server_close()
+    assert [statuses[n][0] for n in ("abc", "-1", "0")] == [400, 400, 400]
+    assert statuses["1"][0] == 200 and len(statuses["1"][1]["recommendations"]) == 1
+
+
+def test_player_features_from_daily_sessions(spark):
+    """Daily playtime, weekend ratio, top genres and diversity per player"""
+    from datetime import date
+
+    import player_features
+
+    daily = spark.createDataFrame(
+        [
+            (1, 10, 20240301, 120.0, 2, 1, 0),  # Friday
+            (1, 20, 20240302, 240.0, 1, 1, 1),  # Saturday
+            (1, 10, 20240415, 60.0, 1, 0, 0),
+            (2, 20, 20240302, 30.0, 1, 0, 1),
+        ],
+        player_features.DAILY_SCHEMA,
+    )
+    genres = spark.createDataFrame(
+        [(10, ["Action"]), (20, ["RPG", "Action"])], "game_sk long, genres array<string>"
+    )
+    rows = {
+        r.player_sk: r
+        for r in player_features.player_features(daily, genres, date(2024, 5, 1)).collect()
+    }
+
+    one = rows[1]
+    assert one.avg_daily_playtime == 140.0 and one.avg_session_duration == 105.0
+    assert one.achievement_rate == 0.5 and one.games_per_month == 1.0  # 2 games, Mar-Apr
+    assert one.weekend_vs_weekday_ratio == pytest.approx(240 / 90)
+    assert one.preferred_genres == ["Action", "RPG"]
+    assert 0 < one.genre_diversity_score < 1
+    assert rows[2].weekend_vs_weekday_ratio == 0.0 and rows[2].genre_diversity_score == 1.0
+
+
+def test_spark_profiles_size_shuffle_partitions(monkeypatch):
+    """Profiles set their options and bound the partition count by input rows"""
+    pytest.importorskip("pyspark")
+    from base import SPARK_PROFILES, partition_count, profile_name, spark_settings
+    from config import Config
+
+    monkeypatch.delenv("SPARK_SHUFFLE_PARTITIONS", raising=False)
+    monkeypatch.setenv("SPARK_PROFILE", "local-dev")
+    settings = spark_settings(Config(), input_rows=120_000)
+    assert settings["spark.sql.adaptive.enabled"] == "true"
+    assert settings["spark.serializer"].endswith("KryoSerializer")
+    assert settings["spark.driver.memory"] == "2g"
+    assert settings["spark.sql.shuffle.partitions"] == "3"
+
+    cluster = SPARK_PROFILES["cluster"]
+    assert partition_count(cluster, 10) == cluster.min_partitions
+    assert partition_count(cluster, 10**12) == cluster.max_partitions
+
+    monkeypatch.setenv("SPARK_SHUFFLE_PARTITIONS", "7")
+    monkeypatch.setenv("SPARK_EXECUTOR_MEMORY", "16g")
+    settings = spark_settings(Config(), input_rows=10**9)
+    assert settings["spark.sql.shuffle.partitions"] == "7"
+    assert settings["spark.executor.memory"] == "16g"
+
+    # Unset, the profile follows the master
+    monkeypatch.delenv("SPARK_PROFILE")
+    monkeypatch.setenv("SPARK_MASTER", "local[2]")
+    assert profile_name(Config()) == "local-dev"
+    monkeypatch.setenv("SPARK_MASTER", "spark://localhost:7077")
+    assert profile_name(Config()) == "cluster"
+    assert spark_settings(Config())["spark.executor.cores"] == "2"
+
+    monkeypatch.setenv("SPARK_PROFILE", "laptop")
+    with pytest.raises(ValueError):
+        spark_settings(Config())
+
+
+def test_worker_checkpoints_batches_and_requeues_failures():
+    """Fetched accounts are checkpointed, failed fetches and failed batches retried"""
+    pytest.importorskip("psycopg2")
+    pytest.importorskip("pyspark")
+    from contextlib import nullcontext
+    from datetime import datetime
+
+    import incremental
+    import worker
+
+    class FakeQueue:
+        def __init__(self):
+            self.done, self.failed = [], []
+
+        def keep_leased(self, steam_ids):
+            return nullcontext()
+
+        def complete(self, steam_ids):
+            self.done.extend(steam_ids)
+            return len(steam_ids)
+
+        def fail(self, steam_ids, error):
+            self.failed.extend(steam_ids)
+            return len(steam_ids)
+
+    def fetch(ids):
+        # Account 2's owned games failed to fetch, its profile came back
+        return {
+            "player_summary": {"response": {"players": [{"steamid": i} for i in ids]}},
+            "owned_games": {
+                "response": {"games": [{"steamid": i, "appid": 10} for i in ids if i != "2"]}
+            },
+            "recently_played": {"response": {"games": []}},
+            "failed_steam_ids": ["2"],
+        }
+
+    written = []
+    queue = FakeQueue()
+    result = worker.process_batch(queue, ["1", "2", "3"], fetch, written.append)
+    assert result == (2, 1)
+    assert queue.done == ["1", "3"] and queue.failed == ["2"]
+    # The failed account is neither written nor watermarked
+    [steam_data] = written
+    assert incremental.payload_steam_ids(steam_data) == ["1", "3"]
+    _, watermarks, _ = incremental.compute_deltas(steam_data, {}, datetime.now())
+    assert sorted(watermarks) == ["1", "3"]
+
+    def broken(steam_data):
+        raise RuntimeError("ClickHouse down")
+
+    queue = FakeQueue()
+    assert worker.process_batch(queue, ["4", "5"], lambda ids: {}, broken) == (0, 2)
+    assert queue.done == [] and queue.failed == ["4", "5"]
+
+
+def test_run_pipeline_returns_watermark_connection_when_transform_fails(monkeypatch):
+    """A failure after the delta stage still closes the watermark store"""
+    pytest.importorskip("pyspark")
+    from datetime import datetime
+
+    import steam_job
+    from config import Config
+
+    closed = []
+
+    class FakeWatermarkStore:
+        def __init__(self, config):
+            pass
+
+        def load(self, steam_ids):
+            return {}
+
+        def close(self):
+            closed.append(True)
+
+    def broken(spark, steam_data):
+        raise RuntimeError("transform failed")
+
+    monkeypatch.setenv("INGESTION_MODE", "incremental")
+    monkeypatch.setattr(steam_job, "WatermarkStore", FakeWatermarkStore)
+    monkeypatch.setattr(steam_job, "size_shuffle_partitions", lambda *args: 1)
+    monkeypatch.setattr(steam_job, "create_steam_dataframes", broken)
+    payload = {"owned_games": {"response": {"games": []}}}
+    with pytest.raises(RuntimeError, match="transform failed"):
+        steam_job.run_pipeline(None, Config(), payload, datetime(2024, 3, 1))
+    assert closed == [True]
+
+
+def test_full_mode_rerun_of_same_payload_adds_no_sessions(monkeypatch, spark):
+    """Sessions are diffed against watermarks in every mode, so a rerun yields none"""
+    from datetime import datetime
+
+    import steam_job
+    from config import Config
+
+    stored = {}
+    written = []
+
+    class MemoryWatermarkStore:
+        def __init__(self, config):
+            pass
+
+        def load(self, steam_ids):
+            return {steam_id: stored[steam_id] for steam_id in steam_ids if steam_id in stored}
+
+        def save(self, watermarks):
+            stored.update(watermarks)
+
+        def close(self):
+            pass
+
+    def write_to_databases(dataframes, *args, **kwargs):
+        sessions = dataframes.get("sessions")
+        written.append(sessions.count() if sessions is not None else 0)
+
+    monkeypatch.setenv("INGESTION_MODE", "full")
+    monkeypatch.setenv("FEATURES_REFRESH", "false")
+    monkeypatch.setenv("SPARK_SHUFFLE_PARTITIONS", "1")
+    monkeypatch.setattr(steam_job, "WatermarkStore", MemoryWatermarkStore)
+    monkeypatch.setattr(steam_job, "write_to_databases", write_to_databases)
+    monkeypatch.setattr(steam_job, "write_snapshots", lambda *args, **kwargs: None)
+
+    game = {
+        "steamid": "1",
+        "appid": 10,
+        "name": "Game",
+        "playtime_forever": 600,
+        "playtime_2weeks": 120,
+        "rtime_last_played": 1709280000,
+    }
+    for day in (1, 2):
+        payload = {"owned_games": {"response": {"games": [dict(game)]}}}
+        steam_job.run_pipeline(spark, Config(), payload, datetime(2024, 3, day, 12))
+    assert written == [1, 0]
+
+
+def test_lake_watermarks_take_latest_snapshot_per_game(tmp_path, spark):
+    """Accounts without a watermark get their last lake state as session baseline"""
+    from datetime import datetime
+
+    import snapshot_lake
+
+    root = str(tmp_path / "lake")
+    schema = (
+        "steamid string, appid long, playtime_forever long, playtime_2weeks long, "
+        "rtime_last_played long"
+    )
+    assert snapshot_lake.lake_watermarks(spark, root, ["1"], datetime(2024, 3, 3)) == {}
+    runs = [
+        (datetime(2024, 3, 1, 6), [("1", 10, 60, 60, 100), ("1", 20, 5, 0, 50)]),
+        (datetime(2024, 3, 2, 6), [("1", 10, 90, 90, 200)]),  # incremental: changed only
+        (datetime(2024, 3, 3, 6), [("1", 10, 500, 0, 300)]),  # not before the run
+    ]
+    for extracted_at, rows in runs:
+        df = spark.createDataFrame(rows, schema)
+        snapshot_lake.write_snapshot(df, f"{root}/owned_games", extracted_at, buckets=4)
+
+    watermarks = snapshot_lake.lake_watermarks(
+        spark, root, ["1", "2"], datetime(2024, 3, 3, 6), buckets=4
+    )
+    assert watermarks == {
+        "1": {
+            "owned_games_snapshot": {"10": [90, 90, 200], "20": [5, 0, 50]},
+            "extracted_at": datetime(2024, 3, 2, 6),
+        }
+    }
+
+
+def test_partition_writers_ship_driver_resolved_connection_settings(monkeypatch):
+    """Executors get the driver's connection settings, not their own environment"""
+    pytest.importorskip("pyspark")
+    import pickle
+
+    import partition_writers
+    from config import Config
+
+    monkeypatch.setenv("POSTGRES_HOST", "pg.driver")
+    monkeypatch.setenv("CLICKHOUSE_HOST", "ch.driver")
+    shipped = pickle.dumps(partition_writers.ConnectionSettings(Config()))
+
+    # An executor that lacks the driver's exports
+    monkeypatch.delenv("POSTGRES_HOST")
+    monkeypatch.delenv("CLICKHOUSE_HOST")
+    settings = pickle.loads(shipped)
+    assert settings.get_postgres_config()["host"] == "pg.driver"
+    assert settings.get_clickhouse_config()["host"] == "ch.driver"
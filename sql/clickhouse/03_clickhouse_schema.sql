@@ -8,6 +8,7 @@ DROP TABLE IF EXISTS dim_games;
 DROP TABLE IF EXISTS dim_players;
 DROP TABLE IF EXISTS dim_time;
 DROP TABLE IF EXISTS dim_game_categories;
+DROP TABLE IF EXISTS pipeline_runs;
 
 -- Dimension Tables
 
@@ -27,7 +28,7 @@ CREATE TABLE dim_players (
     is_active UInt8 DEFAULT 1,
     created_at DateTime DEFAULT now(),
     updated_at DateTime DEFAULT now()
-) ENGINE = MergeTree()
+) ENGINE = ReplacingMergeTree(updated_at)
 ORDER BY player_sk
 SETTINGS index_granularity = 8192;
 
@@ -60,7 +61,7 @@ CREATE TABLE dim_games (
     is_active UInt8 DEFAULT 1,
     created_at DateTime DEFAULT now(),
     updated_at DateTime DEFAULT now()
-) ENGINE = MergeTree()
+) ENGINE = ReplacingMergeTree(updated_at)
 ORDER BY game_sk
 SETTINGS index_granularity = 8192;
 
@@ -109,9 +110,10 @@ CREATE TABLE fact_gaming_sessions (
     is_first_play UInt8,
     device_type Enum8('Windows' = 1, 'Mac' = 2, 'Linux' = 3, 'SteamDeck' = 4),
     created_at DateTime DEFAULT now()
-) ENGINE = MergeTree()
+) ENGINE = ReplacingMergeTree(created_at)
 PARTITION BY toYYYYMM(session_start)
-ORDER BY (player_sk, game_sk, session_start)
+-- session_sk hashes (steamid, appid, session_start): a re-inserted session collapses on merge
+ORDER BY (player_sk, game_sk, session_start, session_sk)
 SETTINGS index_granularity = 8192;
 
 -- Game ownership/purchase fact table
@@ -214,4 +216,22 @@ CREATE TABLE game_similarity_features (
     calculated_at DateTime DEFAULT now()
 ) ENGINE = ReplacingMergeTree()
 ORDER BY (game_sk_1, game_sk_2)
-SETTINGS index_granularity = 8192;
\ No newline at end of file
+SETTINGS index_granularity = 8192;
+
+-- Pipeline run metrics, one row per stage of each run
+CREATE TABLE pipeline_runs (
+    run_id String,
+    job LowCardinality(String),
+    stage LowCardinality(String),
+    started_at DateTime,
+    duration_seconds Float64,
+    rows UInt64,
+    bytes UInt64,
+    http_requests UInt32,
+    http_retries UInt32,
+    rows_per_second Float64,
+    status LowCardinality(String)
+) ENGINE = MergeTree()
+PARTITION BY toYYYYMM(started_at)
+ORDER BY (job, stage, started_at)
+SETTINGS index_granularity = 8192;
@@ -2,6 +2,8 @@
 -- Creates tables to store Steam account data extracted via API
 
 -- Drop tables if they exist (for clean setup)
+DROP TABLE IF EXISTS steam_account_queue CASCADE;
+DROP TABLE IF EXISTS steam_account_watermarks CASCADE;
 DROP TABLE IF EXISTS steam_recently_played CASCADE;
 DROP TABLE IF EXISTS steam_owned_games CASCADE;
 DROP TABLE IF EXISTS steam_players CASCADE;
@@ -60,13 +62,41 @@ CREATE TABLE steam_recently_played (
     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
 );
 
+-- Account watermarks - last ingested state per account, used by incremental runs
+CREATE TABLE steam_account_watermarks (
+    steamid VARCHAR(20) PRIMARY KEY,
+    owned_games_fingerprint CHAR(64) NOT NULL,
+    owned_games_snapshot JSONB NOT NULL,     -- appid -> [playtime_forever, playtime_2weeks, rtime_last_played]
+    recently_played_snapshot JSONB NOT NULL, -- appid -> playtime_2weeks
+    player_fingerprint CHAR(64),
+    extracted_at TIMESTAMP NOT NULL,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+-- Account queue - steam IDs consumed by streaming workers (see spark_jobs/src/account_queue.py)
+CREATE TABLE steam_account_queue (
+    steamid VARCHAR(20) PRIMARY KEY,
+    status VARCHAR(10) NOT NULL DEFAULT 'pending', -- pending, leased, done, failed
+    attempts INTEGER NOT NULL DEFAULT 0,
+    available_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    leased_by VARCHAR(255),
+    lease_expires_at TIMESTAMP,
+    last_error TEXT,
+    processed_at TIMESTAMP,
+    enqueued_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
 -- Indexes for performance
 CREATE INDEX idx_steam_players_steamid ON steam_players(steamid);
 CREATE INDEX idx_steam_games_appid ON steam_games(appid);
 CREATE INDEX idx_owned_games_player_id ON steam_owned_games(player_id);
 CREATE INDEX idx_owned_games_appid ON steam_owned_games(appid);
+CREATE INDEX idx_owned_games_updated_at ON steam_owned_games(updated_at);
 CREATE INDEX idx_recently_played_player_id ON steam_recently_played(player_id);
 CREATE INDEX idx_recently_played_recorded_at ON steam_recently_played(recorded_at);
+CREATE INDEX idx_account_queue_available ON steam_account_queue(status, available_at);
+CREATE INDEX idx_account_queue_lease ON steam_account_queue(lease_expires_at) WHERE status = 'leased';
 
 -- Views for common queries
 CREATE OR REPLACE VIEW player_game_stats AS